@@ -1,8 +1,38 @@
+import argparse
+import ast
+import contextlib
 import os
 import re
 import sys
 from pathlib import Path
 import configparser
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import selectors
+import signal
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import tokenize
+from array import array
+from bisect import bisect_right
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import chain, count, islice
+from stat import S_ISREG
+from typing import NamedTuple
+from xml.parsers import expat
+
+try:
+    import resource   # pico de RSS en la telemetría; no existe en Windows
+except ImportError:
+    resource = None
 
 # -----------------------------
 # Config: fija la ubicación del INI en .github/audit/
@@ -29,29 +59,15 @@ def parse_roots_from_config(cfg: configparser.ConfigParser, repo_root: Path) ->
             out.append(r)
     return out or [repo_root]
 
+def _logs_dir(cfg: configparser.ConfigParser, repo_root: Path) -> Path:
+    """[paths] logs_dir (caché, índice de funciones, parciales de shards), relativo a la raíz del repo."""
+    logs_dir = cfg.get("paths", "logs_dir", fallback=".github/audit/audit_logs").strip()
+    return repo_root / logs_dir if not Path(logs_dir).is_absolute() else Path(logs_dir)
+
 # -----------------------------
 # Severidades por regla
 # -----------------------------
-DEFAULT_SEVERITIES = {
-    "nolock": "error",
-    "special_chars": "warning",
-    "global_temp": "error",
-    "temp_names": "warning",
-    "cursors": "error",
-    "user_functions": "error",
-    "inner_join_where": "warning",
-    "select_star": "error",
-    "select_top": "error",
-    "top_without_order_by": "error",
-    "delete_update_without_where": "error",
-    "merge_usage": "warning",
-    "select_distinct_no_justification": "warning",
-    "exec_dynamic_sql_unparameterized": "error",
-    "select_into_heavy": "warning",
-    "scalar_udf_in_select_where": "warning",
-    "deprecated_types": "error",
-    "hint_usage_general": "warning",
-}
+# Las severidades por defecto (DEFAULT_SEVERITIES) salen del registro de reglas (RULES).
 
 def sev(cfg, rule):
     s = cfg.get("severities", rule, fallback=DEFAULT_SEVERITIES.get(rule, "error")).lower()
@@ -95,7 +111,122 @@ def is_sys_table(token: str) -> bool:
 # -----------------------------
 # Carga de caracteres especiales
 # -----------------------------
-def compile_special_chars_pattern(cfg, repo_root: Path) -> re.Pattern:
+SPECIAL_CHARS_POLICIES = ("list", "ascii")
+non_ascii_pattern = re.compile(r"[^\x00-\x7f]")
+ASCII_BLOCK_LINES = 64   # política ascii: líneas por bloque del primer descarte con str.isascii()
+
+class SpecialChars:
+    """
+    Motor de la regla special_chars, armado una vez por ejecución desde special_chars.txt y
+    [special_chars] policy:
+      - list: los caracteres de la lista. Si todas las entradas son de un codepoint, cada archivo se
+        descarta entero con `c in text` (búsqueda de subcadenas en C) y, si el texto es ASCII
+        (str.isascii() es O(1)), sin mirar los no ASCII; solo los caracteres presentes se ubican con
+        str.find. Con entradas de varios caracteres queda la alternancia IGNORECASE.
+      - ascii: cualquier carácter no ASCII, más los ASCII de la lista; las líneas ASCII se saltan
+        con str.isascii().
+    Un hallazgo por línea: columna del primer carácter y, en el mensaje, cada carácter distinto
+    con su codepoint y sus columnas. `pattern`/`flags` identifican la configuración (huella de la caché).
+    """
+    __slots__ = ("regex", "chars", "ascii_only", "labels")
+
+    def __init__(self, entries: list, ascii_only: bool = False):
+        self.ascii_only = ascii_only
+        self.labels = {}   # carácter -> "'á' U+00E1", para los mensajes
+        if ascii_only:
+            self.chars = tuple(c for c in entries if len(c) == 1 and c.isascii())
+            extra = "".join(re.escape(c) for c in self.chars)
+            self.regex = re.compile(f"[^\\x00-\\x7f]|[{extra}]" if extra else non_ascii_pattern.pattern)
+        elif all(len(c) == 1 for c in entries):
+            # ASCII primero: son los únicos que hay que buscar en un archivo ASCII
+            self.chars = tuple(sorted(set(entries), key=lambda c: not c.isascii()))
+            self.regex = re.compile("[" + "".join(re.escape(c) for c in self.chars) + "]")
+        else:
+            self.chars = None
+            alt = "|".join(re.escape(c) for c in sorted(entries, key=len, reverse=True))
+            self.regex = re.compile(alt, re.IGNORECASE)
+
+    @property
+    def pattern(self) -> str:
+        return f"{'ascii' if self.ascii_only else 'list'}:{self.regex.pattern}"
+
+    @property
+    def flags(self) -> int:
+        return self.regex.flags
+
+    def _offsets(self, text: str) -> list:
+        """(offset, coincidencia) de cada carácter de la lista en `text`, en orden; [] sin ninguno."""
+        chars = self.chars
+        if chars is None:
+            return [(m.start(), m.group()) for m in self.regex.finditer(text)]
+        is_ascii = text.isascii()
+        hits = []
+        for c in chars:
+            if is_ascii and not c.isascii():
+                break
+            pos = text.find(c)
+            while pos >= 0:
+                hits.append((pos, c))
+                pos = text.find(c, pos + 1)
+        hits.sort()
+        return hits
+
+    def _line_offsets(self, src: "SqlSource") -> list:
+        """
+        Como _offsets pero con la política ascii: str.isascii() primero sobre bloques de
+        ASCII_BLOCK_LINES líneas y, dentro de un bloque con algo, línea por línea; solo las líneas
+        con algún carácter marcado pasan por la regex (para las columnas).
+        """
+        text, chars, search, starts = src.text, self.chars, self.regex.finditer, src.line_starts
+        if text.isascii() and not any(c in text for c in chars):
+            return []
+        hits = []
+        n = len(starts) - 1
+        for b in range(0, n, ASCII_BLOCK_LINES):
+            block_end = min(b + ASCII_BLOCK_LINES, n)
+            block = text[starts[b]:starts[block_end]]
+            if block.isascii() and not any(c in block for c in chars):
+                continue
+            for i in range(b, block_end):
+                s, e = starts[i], starts[i + 1]
+                line = text[s:e]
+                if line.isascii() and not any(c in line for c in chars):
+                    continue
+                hits.extend((m.start(), m.group()) for m in search(text, s, e))
+        return hits
+
+    def findings(self, src: "SqlSource") -> list:
+        hits = self._line_offsets(src) if self.ascii_only else self._offsets(src.text)
+        if not hits:
+            return []
+        text, starts, first, labels = src.text, src.line_starts, src.first_line, self.labels
+        out = []
+        i, k, n = 0, 0, len(hits)
+        while k < n:
+            pos, c = hits[k]
+            i = bisect_right(starts, pos, i) - 1
+            s, e = starts[i], starts[i + 1]
+            k += 1
+            label = labels.get(c) or labels.setdefault(c, _describe_chars(c))
+            if k == n or hits[k][0] >= e:   # lo habitual: un solo carácter en la línea
+                detail = f"{label} (col {pos - s + 1})"
+            else:
+                cols = {c: [str(pos - s + 1)]}   # carácter -> columnas, en orden de aparición
+                while k < n and hits[k][0] < e:
+                    p, ch = hits[k]
+                    cols.setdefault(ch, []).append(str(p - s + 1))
+                    k += 1
+                detail = "; ".join(f"{labels.get(ch) or labels.setdefault(ch, _describe_chars(ch))} (col {', '.join(ch_cols)})"
+                                   for ch, ch_cols in cols.items())
+            text_i = text[s:e].strip()
+            out.append(Finding(first + i, pos - s + 1, f"{detail} -> {text_i}", text_i))
+        return out
+
+def _describe_chars(s: str) -> str:
+    """'á' U+00E1; para entradas de varios caracteres, un codepoint por carácter."""
+    return f"{s!r} " + " ".join(f"U+{ord(ch):04X}" for ch in s)
+
+def compile_special_chars_pattern(cfg, repo_root: Path) -> "SpecialChars":
     rel = cfg.get("paths", "special_chars_file", fallback=".github/audit/special_chars.txt").strip()
     path = (repo_root / rel) if not Path(rel).is_absolute() else Path(rel)
     chars = []
@@ -108,410 +239,3428 @@ def compile_special_chars_pattern(cfg, repo_root: Path) -> re.Pattern:
                 chars.append(s)
     if not chars:
         chars = list("áéíóúÁÉÍÓÚñÑ&%$¡¿")
-    if all(len(c) == 1 for c in chars):
-        escaped = "".join(re.escape(c) for c in chars)
-        return re.compile(f"[{escaped}]")
-    chars.sort(key=len, reverse=True)
-    alt = "|".join(re.escape(c) for c in chars)
-    return re.compile(alt, re.IGNORECASE)
+    policy = cfg.get("special_chars", "policy", fallback="list").strip().lower()
+    if policy not in SPECIAL_CHARS_POLICIES:
+        raise ValueError(f"[special_chars] policy desconocida '{policy}' (se espera {' o '.join(SPECIAL_CHARS_POLICIES)})")
+    return SpecialChars(chars, ascii_only=(policy == "ascii"))
+
+# -----------------------------
+# Lexer T-SQL
+# -----------------------------
+# lex_sql solo arma lo que usan todas las reglas: la vista enmascarada `code_text` y el índice de
+# líneas, saltando de comentario en literal sin recorrer el resto token a token. Los tokens (y con
+# ellos el índice de sentencias) se generan aparte, solo si una regla de sentencia los pide.
+class Token(NamedTuple):
+    kind: str    # KEYWORD | IDENT | QUOTED_IDENT | VARIABLE | TEMP | STRING | NUMBER | COMMENT | OP | GO
+    value: str
+    line: int    # 1-based
+    col: int     # 1-based
+
+
+class SqlSource:
+    """
+    Archivo SQL ya lexado. `text` conserva el texto original (para mostrar hallazgos);
+    `code_text` tiene la misma geometría (mismos offsets, líneas y columnas) pero con comentarios
+    y contenido de literales reemplazados por espacios, para que las reglas no disparen sobre
+    texto que no es código. No hay copias por línea: `line_starts` guarda el offset de inicio de
+    cada línea (más el largo total al final) y las reglas buscan sobre el buffer completo acotado
+    a la línea (pattern.search(buf, inicio, fin)); solo se copia el texto de las líneas con hallazgo.
+    Los tokens no se guardan: iter_tokens() los genera en cada llamada, y `statements` se construye
+    una sola vez, al primer uso. `first_line` es el número (en el archivo) de la primera línea: un
+    lote leído en streaming no empieza en la línea 1. `complete` es False si el texto termina
+    dentro de un literal, comentario de bloque o identificador entre [] sin cerrar.
+    """
+    __slots__ = ("text", "code_text", "line_starts", "first_line", "complete", "_statements", "_snippets")
+
+    def __init__(self, text: str, code_text: str, line_starts: array, first_line: int = 1, complete: bool = True):
+        self.text = text
+        self.code_text = code_text
+        self.line_starts = line_starts
+        self.first_line = first_line
+        self.complete = complete
+        self._statements = None
+        self._snippets = {}
+
+    @property
+    def line_count(self) -> int:
+        return len(self.line_starts) - 1
+
+    def spans(self):
+        """(número de línea, offset de inicio, offset de fin) de cada línea; el fin incluye el salto."""
+        starts = self.line_starts
+        return zip(count(self.first_line), starts, islice(starts, 1, None))
+
+    def locate(self, offset: int) -> tuple:
+        """(línea, columna) 1-based del offset `offset` de `text`/`code_text`."""
+        i = bisect_right(self.line_starts, offset) - 1
+        return self.first_line + i, offset - self.line_starts[i] + 1
+
+    def line_text(self, line: int) -> str:
+        """Texto original de la línea `line` (numeración del archivo), con su salto."""
+        i = line - self.first_line
+        return self.text[self.line_starts[i]:self.line_starts[i + 1]]
+
+    def snippet(self, line: int) -> str:
+        """line_text(line) sin espacios en los extremos; los hallazgos de una misma línea comparten la copia."""
+        snippet = self._snippets.get(line)
+        if snippet is None:
+            snippet = self._snippets[line] = self.line_text(line).strip()
+        return snippet
+
+    def iter_tokens(self):
+        """Tokens del texto en orden (ver iter_sql_tokens); se generan de nuevo en cada llamada."""
+        return iter_sql_tokens(self)
+
+    @property
+    def statements(self) -> list:
+        return self.build_statements()
+
+    def build_statements(self) -> list:
+        """Construye el índice de sentencias si todavía no existe (ver index_statements) y lo devuelve."""
+        if self._statements is None:
+            self._statements = index_statements(self.iter_tokens())
+        return self._statements
+
+
+# Palabras reservadas T-SQL relevantes para las reglas (el resto se trata como IDENT)
+SQL_KEYWORDS = frozenset("""
+ADD ALL ALTER AND ANY APPLY AS ASC BEGIN BETWEEN BREAK BY CASE CATCH CLOSE COMMIT CONTINUE
+CREATE CROSS CURSOR DEALLOCATE DECLARE DEFAULT DELETE DESC DISTINCT DROP ELSE END EXCEPT
+EXEC EXECUTE EXISTS FETCH FOR FROM FULL FUNCTION GOTO GROUP HAVING IF IN INDEX INNER INSERT
+INTERSECT INTO IS JOIN LEFT LIKE MERGE NOT NULL OF ON OPEN OPTION OR ORDER OUTER OVER
+PERCENT PROC PROCEDURE RETURN RETURNS RIGHT ROLLBACK SELECT SET TABLE THEN TIES TOP TRAN
+TRANSACTION TRIGGER TRUNCATE TRY UNION UPDATE USING VALUES VIEW WHEN WHERE WHILE WITH
+""".split())
+
+# Caracteres que str.splitlines() trata como salto de línea (se preservan al enmascarar)
+_LINE_BREAKS = "\r\n\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+_linebreak_re = re.compile(r"\r\n|[" + _LINE_BREAKS + "]")
+_mask_re = re.compile(r"[^" + _LINE_BREAKS + "]")
+
+# Lo que se enmascara en `code_text` (comentarios, contenido de literales) y los identificadores
+# entre [] o "", que se copian tal cual pero pueden contener '--', '/*' o comillas
+_code_re = re.compile(r"""
+    --[^\r\n]*
+  | /\*
+  | '(?:[^']|'')*(?P<string_end>')?
+  | \[(?:[^\]]|\]\])*(?P<bracket_end>\])?
+  | "(?:[^"]|"")*(?P<dquote_end>")?
+""", re.VERBOSE)
+
+# Un token por match, con los espacios y saltos de línea previos (que no son tokens) delante
+_token_re = re.compile(r"""
+    [ \t""" + _LINE_BREAKS + r"""]*
+    (?:
+      (?P<comment>--[^\r\n]*)
+    | (?P<block>/\*)
+    | (?P<string>[Nn]?'(?:[^']|'')*'?)
+    | (?P<quoted>\[(?:[^\]]|\]\])*\]?|"(?:[^"]|"")*"?)
+    | (?P<variable>@@?[\w$#@]*)
+    | (?P<temp>\#\#?[\w$#@]*)
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<word>[^\W\d][\w$#@]*)
+    | (?P<op>[^ \t""" + _LINE_BREAKS + r"""])
+    )
+""", re.VERBOSE | re.DOTALL)
+_block_delim_re = re.compile(r"/\*|\*/")
+_go_tail_re = re.compile(r"(?P<count>[ \t]*\d+)?[ \t]*(?:--[^\r\n]*)?(?=[" + _LINE_BREAKS + r"]|\Z)")
+_TOKEN_KINDS = {"comment": "COMMENT", "block": "COMMENT", "string": "STRING", "quoted": "QUOTED_IDENT",
+                "variable": "VARIABLE", "temp": "TEMP", "number": "NUMBER", "op": "OP"}
+
+
+def _mask(s: str) -> str:
+    return _mask_re.sub(" ", s)
+
+
+def _block_comment_end(text: str, start: int) -> int:
+    """Fin de un comentario /* ... */ (T-SQL permite anidarlos). Sin cierre: -1."""
+    depth = 1
+    pos = start + 2
+    while depth:
+        m = _block_delim_re.search(text, pos)
+        if not m:
+            return -1
+        depth += 1 if m.group() == "/*" else -1
+        pos = m.end()
+    return pos
+
+
+def lex_sql(text: str, first_line: int = 1) -> SqlSource:
+    """
+    Construye la vista enmascarada `code_text` y el índice de líneas `line_starts` del archivo
+    completo (o de un lote, numerado desde `first_line`) en una pasada que salta directo de un
+    comentario o literal al siguiente (ver SqlSource). El código entre ellos se copia en bloque.
+    """
+    parts = []
+    append = parts.append
+    complete = True
+    copied = 0   # `text` ya volcado a `parts` hasta acá
+    pos = 0
+    n = len(text)
+    search = _code_re.search
+    while True:
+        m = search(text, pos)
+        if m is None:
+            break
+        start = m.start()
+        lead = text[start]
+        if lead == "/":
+            end = _block_comment_end(text, start)
+            if end < 0:
+                end = n; complete = False
+            masked = _mask(text[start:end])
+        elif lead == "-":
+            end = m.end()
+            masked = _mask(m.group())
+        elif lead == "'":
+            end = m.end()
+            complete = m.group("string_end") is not None
+            masked = "'" + _mask(text[start + 1:end - 1 if complete else end]) + ("'" if complete else "")
+        else:
+            # identificador entre [] o "": sin cambios, queda en el próximo bloque copiado
+            pos = m.end()
+            complete = m.group("bracket_end") is not None or m.group("dquote_end") is not None
+            continue
+        if start > copied:
+            append(text[copied:start])
+        append(masked)
+        copied = pos = end
+    # sin comentarios ni literales, `code_text` es el mismo objeto que `text` (sin copia)
+    code_text = text if not parts else "".join(parts) + text[copied:]
+    # inicio de cada línea con los mismos cortes que str.splitlines() (más el largo total al final)
+    starts = array("q", [0])
+    starts.extend(m.end() for m in _linebreak_re.finditer(text))
+    if starts[-1] != n:
+        starts.append(n)
+    return SqlSource(text, code_text, starts, first_line, complete)
+
+
+def iter_sql_tokens(src: SqlSource):
+    """
+    Genera los Token de `src.text` (los espacios y saltos de línea no son tokens). Línea y columna
+    salen de `line_starts`; los valores repetidos comparten el mismo str. "GO [n]" como primer
+    código de la línea es un token GO (separador de lote).
+    """
+    text, starts = src.text, src.line_starts
+    n = len(text)
+    match = _token_re.match
+    new = tuple.__new__   # Token(...) sin pasar por el __new__ en Python de NamedTuple
+    values = {}
+    intern = values.setdefault
+    i = 0                        # índice en `line_starts` de la línea del token
+    line, line_start, next_start = src.first_line, 0, starts[1] if len(starts) > 1 else n
+    code_line = -1               # índice de la última línea con código (GO solo separa al inicio)
+    pos = 0
+    while True:
+        m = match(text, pos)
+        if m is None:
+            return
+        kind = m.lastgroup
+        start = m.start(kind)
+        end = m.end()
+        if start >= next_start:
+            i = bisect_right(starts, start, i) - 1
+            line, line_start, next_start = src.first_line + i, starts[i], starts[i + 1]
+        col = start - line_start + 1
+        if kind == "word":
+            value = text[start:end]
+            value = intern(value, value)
+            up = value.upper()
+            if up == "GO" and code_line != i:
+                tail = _go_tail_re.match(text, end)
+                if tail:
+                    # "GO [n]": separador de lote, el contador opcional va en el mismo token
+                    end = tail.end("count") if tail.group("count") else end
+                    yield new(Token, ("GO", text[start:end], line, col))
+                    code_line = i
+                    pos = end
+                    continue
+            yield new(Token, ("KEYWORD" if up in SQL_KEYWORDS else "IDENT", value, line, col))
+            code_line = i
+        else:
+            if kind == "block":
+                end = _block_comment_end(text, start)
+                if end < 0:
+                    end = n
+            value = text[start:end]
+            if kind not in ("comment", "block", "string"):
+                value = intern(value, value)
+            yield new(Token, (_TOKEN_KINDS[kind], value, line, col))
+            if kind != "comment":
+                # los tokens multilínea terminan en otra línea: GO tras ellos ya no es el primer código,
+                # salvo tras un comentario de bloque que empezó en una línea sin código
+                last = i if end <= next_start else bisect_right(starts, end - 1, i) - 1
+                if kind != "block" or code_line == i:
+                    code_line = last
+        pos = end
+
+
+# -----------------------------
+# Índice de sentencias (lotes GO, límites de sentencia y cláusulas)
+# -----------------------------
+# El índice vive mientras viva el SqlSource: los tokens de las sentencias se guardan en arreglos
+# paralelos (TokenTable, ~17 bytes por token) y Statement.tokens es una vista sobre ellos
+# (TokenSlice) que arma cada Token recién al leerlo.
+TOKEN_KINDS = ("KEYWORD", "IDENT", "QUOTED_IDENT", "VARIABLE", "TEMP", "STRING", "NUMBER", "COMMENT", "OP", "GO")
+_KIND_CODES = {k: i for i, k in enumerate(TOKEN_KINDS)}
+
+
+class TokenTable:
+    """Tokens de un archivo en arreglos paralelos: código de tipo, valor, línea y columna."""
+    __slots__ = ("kinds", "values", "lines", "cols")
+
+    def __init__(self):
+        self.kinds = bytearray()
+        self.values = []
+        self.lines = array("i")
+        self.cols = array("i")
+
+    def extend(self, toks: list) -> "TokenSlice":
+        """Agrega `toks` al final y devuelve la vista sobre ellos."""
+        lo = len(self.values)
+        kinds, values, lines, cols = zip(*toks)
+        self.kinds.extend(map(_KIND_CODES.__getitem__, kinds))
+        self.values.extend(values)
+        self.lines.extend(lines)
+        self.cols.extend(cols)
+        return TokenSlice(self, lo, len(self.values))
+
+    def token(self, k: int) -> Token:
+        return Token(TOKEN_KINDS[self.kinds[k]], self.values[k], self.lines[k], self.cols[k])
+
+
+class TokenSlice(Sequence):
+    """Vista de solo lectura de los tokens [lo, hi) de una TokenTable; un slice es otra vista."""
+    __slots__ = ("table", "lo", "hi")
+
+    def __init__(self, table: TokenTable, lo: int, hi: int):
+        self.table = table
+        self.lo = lo
+        self.hi = hi
+
+    def __len__(self) -> int:
+        return self.hi - self.lo
+
+    def __getitem__(self, i):
+        n = self.hi - self.lo
+        if isinstance(i, slice):
+            start, stop, step = i.indices(n)
+            if step != 1:
+                return [self[k] for k in range(start, stop, step)]
+            return TokenSlice(self.table, self.lo + start, self.lo + max(start, stop))
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("índice de token fuera de la sentencia")
+        return self.table.token(self.lo + i)
+
+    def __iter__(self):
+        return map(self.table.token, range(self.lo, self.hi))
+
+    def __repr__(self) -> str:
+        return f"TokenSlice({list(self)!r})"
+
+
+class Clause(NamedTuple):
+    name: str    # SELECT | INTO | FROM | WHERE | GROUP BY | HAVING | ORDER BY | SET | VALUES | OPTION | OUTPUT
+    start: int   # índice (en Statement.tokens) de la palabra clave que abre la cláusula
+    end: int     # índice exclusivo
+    depth: int   # nivel de paréntesis (0 = nivel de la sentencia)
+    group: int   # índice del '(' que la contiene (-1 = nivel de la sentencia)
+
+
+class Statement(NamedTuple):
+    batch: int        # lote (1-based), separado por GO
+    start_line: int
+    end_line: int
+    verb: str         # verbo principal en mayúsculas (SELECT, UPDATE, DECLARE, ...)
+    verb_pos: int     # índice del token del verbo en `tokens`
+    tokens: TokenSlice  # tokens de la sentencia, sin comentarios
+    clauses: list     # list[Clause], en orden de aparición
+
+
+# Palabras que inician sentencia en T-SQL (no exige ';', así que también cortan sentencia)
+STATEMENT_STARTERS = frozenset("""
+SELECT INSERT UPDATE DELETE MERGE WITH DECLARE SET EXEC EXECUTE CREATE ALTER DROP TRUNCATE
+IF ELSE WHILE BEGIN END RETURN PRINT OPEN FETCH CLOSE DEALLOCATE GOTO BREAK CONTINUE THROW
+RAISERROR USE COMMIT ROLLBACK SAVE WAITFOR GRANT REVOKE DENY
+""".split())
+DML_VERBS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "MERGE"))
+CLAUSE_KEYWORDS = frozenset(("SELECT", "INTO", "FROM", "WHERE", "HAVING", "SET", "VALUES", "OPTION", "OUTPUT"))
+_SET_OPERATORS = frozenset(("UNION", "EXCEPT", "INTERSECT"))
+_PERMISSION_VERBS = frozenset(("GRANT", "REVOKE", "DENY"))
+# Contextos en los que INSERT/UPDATE/DELETE no son sentencias: triggers, FKs, MERGE, cursores
+_DML_CONTINUATION_PREV = frozenset(("ON", "FOR", "AFTER", "OF", ",", "THEN", "INSTEAD"))
+
+
+def _word(tok) -> str:
+    return tok.value.upper() if tok is not None and tok.kind in ("KEYWORD", "IDENT") else (tok.value if tok else "")
+
+
+def _continues_statement(up, prev, nxt, lead, verb, main_seen, source_seen, case_depth, perm_list) -> bool:
+    """
+    Decide si una palabra de STATEMENT_STARTERS (a nivel de paréntesis 0) sigue dentro de la
+    sentencia actual en vez de abrir una nueva.
+    """
+    if prev == "." or perm_list:
+        return True
+    if up in ("END", "ELSE"):
+        return case_depth > 0
+    if up == "WITH":
+        return True   # WITH solo abre sentencia (CTE) cuando es el primer token
+    cte_body = lead == "WITH" and not main_seen
+    insert_source = verb == "INSERT" and not source_seen
+    if up == "SELECT":
+        return prev in ("UNION", "ALL", "EXCEPT", "INTERSECT", "FOR") or cte_body or insert_source
+    if up in ("INSERT", "UPDATE", "DELETE"):
+        return prev in _DML_CONTINUATION_PREV or (up == "UPDATE" and nxt == "(") or cte_body
+    if up == "MERGE":
+        return nxt == "JOIN" or cte_body
+    if up == "SET":
+        return verb in ("UPDATE", "MERGE", "ALTER") or prev in ("DELETE", "UPDATE")
+    if up in ("EXEC", "EXECUTE"):
+        return prev in ("WITH", ",") or insert_source
+    if up in ("ALTER", "DROP"):
+        return lead == "ALTER" or prev == "OR"
+    if up == "IF":
+        return lead == "DROP" and nxt == "EXISTS"
+    if up == "FETCH":
+        return prev in ("ROWS", "ROW")
+    return False
+
+
+def _clause_spans(toks: list) -> list:
+    clauses = []
+    open_at = {}      # depth -> (name, start, group)
+    groups = [-1]     # pila de '(' abiertos
+    depth = 0
+    n = len(toks)
+
+    def close(d, end):
+        c = open_at.pop(d, None)
+        if c:
+            clauses.append(Clause(c[0], c[1], end, d, c[2]))
+
+    for i, t in enumerate(toks):
+        if t.kind == "OP":
+            v = t.value
+            if v == "(":
+                depth += 1; groups.append(i)
+            elif v == ")" and depth:
+                close(depth, i); depth -= 1; groups.pop()
+            elif v == ";":
+                close(depth, i)
+            continue
+        if t.kind not in ("KEYWORD", "IDENT"):
+            continue
+        up = t.value.upper()
+        if up in ("GROUP", "ORDER"):
+            name = up + " BY" if i + 1 < n and _word(toks[i + 1]) == "BY" else None
+        elif up in CLAUSE_KEYWORDS:
+            name = up
+        else:
+            if up in _SET_OPERATORS:
+                close(depth, i)
+            continue
+        if name:
+            close(depth, i)
+            open_at[depth] = (name, i, groups[-1])
+    for d in sorted(open_at, reverse=True):
+        close(d, n)
+    clauses.sort(key=lambda c: c.start)
+    return clauses
+
+
+def index_statements(tokens: list) -> list:
+    """
+    Segmenta el flujo de tokens en sentencias (una pasada): corta en ';', en GO y en cada
+    palabra que inicia sentencia a nivel 0 de paréntesis. Cada sentencia lleva sus cláusulas.
+    """
+    statements = []
+    table = TokenTable()
+    batch = 1
+    cur = []
+    lead = verb = None; verb_pos = 0
+    depth = 0; case_depth = 0
+    main_seen = source_seen = perm_list = False
+
+    def flush():
+        nonlocal cur, lead, verb, verb_pos, depth, case_depth, main_seen, source_seen, perm_list
+        if cur:
+            statements.append(Statement(batch, cur[0].line, cur[-1].line, verb, verb_pos, table.extend(cur),
+                                        _clause_spans(cur)))
+        cur = []
+        lead = verb = None; verb_pos = 0
+        depth = 0; case_depth = 0
+        main_seen = source_seen = perm_list = False
+
+    # una pasada sin listar el archivo entero: cada token se procesa al llegar el siguiente
+    # (`following`), que es todo lo que hace falta mirar adelante
+    pending = None
+    for following in chain(tokens, (None,)):
+        if following is not None and following.kind == "COMMENT":
+            continue
+        t, pending = pending, following
+        if t is None:
+            continue
+        if t.kind == "GO":
+            flush()
+            batch += 1
+            continue
+        up = t.value.upper() if t.kind in ("KEYWORD", "IDENT") else None
+        if up and not depth:
+            if cur and up in STATEMENT_STARTERS:
+                prev = _word(cur[-1])
+                nxt = _word(following)
+                if not _continues_statement(up, prev, nxt, lead, verb, main_seen, source_seen, case_depth, perm_list):
+                    flush()
+                elif lead == "WITH" and not main_seen and up in DML_VERBS:
+                    verb = up; verb_pos = len(cur); main_seen = True
+            if cur:
+                if perm_list and up in ("ON", "TO", "FROM"):
+                    perm_list = False
+                if verb == "INSERT" and up in ("SELECT", "VALUES", "EXEC", "EXECUTE", "DEFAULT") and verb_pos < len(cur):
+                    source_seen = True
+        if not cur:
+            lead = verb = up or t.value
+            perm_list = up in _PERMISSION_VERBS
+        if up == "CASE":
+            case_depth += 1
+        elif up == "END" and case_depth:
+            case_depth -= 1
+        elif t.kind == "OP":
+            if t.value == "(":
+                depth += 1
+            elif t.value == ")" and depth:
+                depth -= 1
+        cur.append(t)
+        if t.kind == "OP" and t.value == ";" and not depth:
+            flush()
+    flush()
+    return statements
+
+
+# -----------------------------
+# Patrones de reglas (compilados una sola vez)
+# -----------------------------
+from_join_table_pattern = re.compile(r"\b(FROM|JOIN)\s+([\w.\[\]]+)", re.IGNORECASE)
+temp_or_var_prefix_pattern = re.compile(r"[#@]")
+select_pattern = re.compile(r"\bSELECT\b", re.IGNORECASE)
+where_pattern = re.compile(r"\bWHERE\b", re.IGNORECASE)
+inner_join_pattern = re.compile(r"\bINNER\s+JOIN\b", re.IGNORECASE)
+outer_join_variant_pattern = re.compile(r"\b(LEFT|RIGHT|FULL|OUTER)\s+JOIN\b", re.IGNORECASE)
+statement_end_pattern = re.compile(r";\s*$")
+nonblank_pattern = re.compile(r"\S")
+merge_pattern = re.compile(r"\bMERGE\b", re.IGNORECASE)
+select_distinct_pattern = re.compile(r"\bSELECT\s+DISTINCT\b", re.IGNORECASE)
+justification_pattern = re.compile(r"--\s*justification\s*:", re.IGNORECASE)
+exec_dynamic_pattern = re.compile(
+    r"\bEXEC(?:UTE)?\b\s*(?:sp_executesql)?\s*\((?:[^)]*\+[^)]*)\)|\bsp_executesql\b\s+@?\w+\s*=.*\+.*",
+    re.IGNORECASE | re.DOTALL
+)
+select_into_temp_pattern = re.compile(r"\bSELECT\b.*\bINTO\b\s+#\w+", re.IGNORECASE)
 
 # -----------------------------
 # Reglas (existentes)
 # -----------------------------
+# Todas las reglas reciben el SqlSource del archivo: buscan sobre `code_text` (sin comentarios
+# ni literales) acotado a cada línea con `spans()`/`line_starts`, y muestran el texto original
+# de `text` (solo se copian las líneas con hallazgo).
 def rule_enabled(cfg, key, default=True):
     return cfg.getboolean("rules", key, fallback=default)
 
-def check_nolock(lines):
+class Finding(NamedTuple):
+    line: int      # 1-based, numeración absoluta del archivo
+    col: int       # 1-based, donde empieza lo detectado
+    message: str   # lo que se muestra tras "Línea N:"
+    snippet: str   # línea original, sin espacios en los extremos
+
+def _finding(src: SqlSource, line: int, col: int, message: str) -> Finding:
+    return Finding(line, col, message, src.snippet(line))
+
+def check_nolock(src: SqlSource):
     issues = []
-    for i, ln in enumerate(lines, 1):
-        l = ln.strip()
-        if l.startswith("--") or ignore_temp_tables_pattern.search(ln):
+    code = src.code_text
+    for i, s, e in src.spans():
+        if ignore_temp_tables_pattern.search(code, s, e):
             continue
-        if nolock_pattern.search(ln) or nolock_paren_only_pattern.search(ln):
+        if nolock_pattern.search(code, s, e) or nolock_paren_only_pattern.search(code, s, e):
             continue
-        m = re.search(r"\b(FROM|JOIN)\s+([\w.\[\]]+)", ln, re.IGNORECASE)
+        m = from_join_table_pattern.search(code, s, e)
         if m:
             table = m.group(2)
             if is_sys_table(table):
                 continue
-            if re.match(r"[#@]", table):
+            if temp_or_var_prefix_pattern.match(table):
                 continue
-            issues.append(f"   Línea {i}: Falta hint WITH (NOLOCK) en {m.group(1).upper()} tabla '{table}'")
+            issues.append(_finding(src, i, m.start(1) - s + 1, f"Falta hint WITH (NOLOCK) en {m.group(1).upper()} tabla '{table}'"))
     return issues
 
-def check_special_chars(lines, special_chars_re):
-    return [f"   Línea {i}: {ln.strip()}" for i, ln in enumerate(lines, 1) if special_chars_re.search(ln)]
-
-def check_global_temp(lines):
-    return [f"   Línea {i}: {ln.strip()}" for i, ln in enumerate(lines, 1)
-            if not ln.strip().startswith('--') and global_temp_pattern.search(ln)]
-
-def check_temp_names(lines):
-    return [f"   Línea {i}: {ln.strip()}" for i, ln in enumerate(lines, 1)
-            if not ln.strip().startswith('--') and bad_temp_names_pattern.search(ln)]
-
-def check_cursors(lines):
-    return [f"   Línea {i}: {ln.strip()}" for i, ln in enumerate(lines, 1)
-            if not ln.strip().startswith('--') and cursor_pattern.search(ln)]
-
-def check_user_funcs(lines):
-    issues = []
-    for i, ln in enumerate(lines, 1):
-        if ln.strip().startswith("--"):
-            continue
-        if user_function_in_where_pattern.search(ln):
-            issues.append(f"   Línea {i}: {ln.strip()}")
-    return issues
+def check_special_chars(src: SqlSource, special_chars_re: SpecialChars):
+    # Se revisa el texto original completo (comentarios incluidos); ver SpecialChars
+    return special_chars_re.findings(src)
 
-def check_inner_join_warnings(lines):
+def check_inner_join_warnings(src: SqlSource):
     issues = []
-    join_count = 0; first_join = None; has_variant = False; in_block = False
-    for i, ln in enumerate(lines, 1):
-        line = ln.strip()
-        if not line or line.startswith("--"):
+    code = src.code_text
+    join_count = 0; first_join = None; first_col = 0; has_variant = False; in_block = False
+    for i, s, e in src.spans():
+        if not nonblank_pattern.search(code, s, e):
             continue
-        if re.search(r"\bSELECT\b", line, re.IGNORECASE):
+        if select_pattern.search(code, s, e):
             join_count = 0; first_join = None; has_variant = False; in_block = True
         if not in_block:
             continue
-        if re.search(r"\bINNER\s+JOIN\b", line, re.IGNORECASE):
+        m = inner_join_pattern.search(code, s, e)
+        if m:
             join_count += 1
             if first_join is None:
                 first_join = i
-        if re.search(r"\b(LEFT|RIGHT|FULL|OUTER)\s+JOIN\b", line, re.IGNORECASE):
+                first_col = m.start() - s + 1
+        if outer_join_variant_pattern.search(code, s, e):
             has_variant = True
-        if re.search(r"\bWHERE\b", line, re.IGNORECASE):
+        if where_pattern.search(code, s, e):
             if join_count > 1 and not has_variant and first_join is not None:
-                issues.append(f"   Línea {first_join}: Múltiples INNER JOIN + WHERE sin variantes")
+                issues.append(_finding(src, first_join, first_col, "Múltiples INNER JOIN + WHERE sin variantes"))
             in_block = False; join_count = 0; has_variant = False; first_join = None
-        if re.search(r";\s*$", line):
+        if statement_end_pattern.search(code, s, e):
             in_block = False; join_count = 0; has_variant = False; first_join = None
     return issues
 
-def check_select_star(lines):
-    issues = []
-    buffering = False; buf = []; start_line = None
-    for i, ln in enumerate(lines, 1):
-        line = ln.split("--", 1)[0]
-        if not buffering and re.search(r"\bSELECT\b", line, re.IGNORECASE):
-            buffering = True; start_line = i; buf = [line]
-            if re.search(r"\bFROM\b", line, re.IGNORECASE):
-                buffering = False
-                joined = " ".join(buf)
-                m = re.search(r"\bSELECT\b(?P<clause>.*?)\bFROM\b", joined, re.IGNORECASE | re.DOTALL)
-                if m and re.fullmatch(r"\s*\*\s*", m.group("clause"), re.DOTALL):
-                    issues.append(f"   Línea {start_line}: Uso de SELECT *")
-                buf = []
-            continue
-        if buffering:
-            buf.append(line)
-            if re.search(r"\bFROM\b", line, re.IGNORECASE):
-                buffering = False
-                joined = " ".join(buf)
-                m = re.search(r"\bSELECT\b(?P<clause>.*?)\bFROM\b", joined, re.IGNORECASE | re.DOTALL)
-                if m and re.fullmatch(r"\s*\*\s*", m.group("clause"), re.DOTALL):
-                    issues.append(f"   Línea {start_line}: Uso de SELECT *")
-                buf = []
-    return issues
+def _select_lists(src: SqlSource):
+    """Genera (sentencia, cláusula SELECT, tokens de la lista) para cada SELECT, subconsultas incluidas."""
+    for st in src.statements:
+        for c in st.clauses:
+            if c.name == "SELECT":
+                yield st, c, st.tokens[c.start + 1:c.end]
 
-def check_select_top(lines):
-    issues = []
-    buffering = False; buf = []; start_line = None
-    for i, ln in enumerate(lines, 1):
-        line = ln.split("--", 1)[0]
-        if not buffering and re.search(r"\bSELECT\b", line, re.IGNORECASE):
-            buffering = True; start_line = i; buf = [line]
-            if re.search(r"\bFROM\b", line, re.IGNORECASE):
-                buffering = False
-                joined = " ".join(buf)
-                m = re.search(r"\bSELECT\b(?P<clause>.*?)\bFROM\b", joined, re.IGNORECASE | re.DOTALL)
-                if m and re.search(r"\bTOP\b", m.group("clause"), re.IGNORECASE):
-                    issues.append(f"   Línea {start_line}: Uso de SELECT TOP")
-                buf = []
-            continue
-        if buffering:
-            buf.append(line)
-            if re.search(r"\bFROM\b", line, re.IGNORECASE):
-                buffering = False
-                joined = " ".join(buf)
-                m = re.search(r"\bSELECT\b(?P<clause>.*?)\bFROM\b", joined, re.IGNORECASE | re.DOTALL)
-                if m and re.search(r"\bTOP\b", m.group("clause"), re.IGNORECASE):
-                    issues.append(f"   Línea {start_line}: Uso de SELECT TOP")
-                buf = []
-    return issues
+def _starts_with_top(select_list) -> bool:
+    for t in select_list[:2]:
+        up = _word(t)
+        if up == "TOP":
+            return True
+        if up not in ("ALL", "DISTINCT"):
+            return False
+    return False
+
+def _token_finding(src: SqlSource, tok: Token, message: str) -> Finding:
+    return _finding(src, tok.line, tok.col, message)
+
+def check_select_star(src: SqlSource):
+    return [_token_finding(src, st.tokens[c.start], "Uso de SELECT *") for st, c, items in _select_lists(src)
+            if len(items) == 1 and items[0].value == "*"]
+
+def check_select_top(src: SqlSource):
+    return [_token_finding(src, st.tokens[c.start], "Uso de SELECT TOP") for st, c, items in _select_lists(src)
+            if _starts_with_top(items)]
 
 # -----------------------------
 # Reglas nuevas (ya activadas)
 # -----------------------------
-def check_top_without_order_by(lines):
+def check_top_without_order_by(src: SqlSource):
     issues = []
-    buffering = False; buf=[]; start_line=None
-    for i, ln in enumerate(lines, 1):
-        line = ln.split("--",1)[0]
-        if not buffering and re.search(r"\bSELECT\b", line, re.IGNORECASE):
-            buffering=True; buf=[line]; start_line=i
+    for st, c, items in _select_lists(src):
+        if not _starts_with_top(items):
             continue
-        if buffering:
-            buf.append(line)
-            if ";" in line or re.search(r"^\s*GO\s*$", line, re.IGNORECASE) or re.search(r"\bSELECT\b", line, re.IGNORECASE):
-                stmt = " ".join(buf)
-                if re.search(r"\bSELECT\s+TOP\b", stmt, re.IGNORECASE) and not re.search(r"\bORDER\s+BY\b", stmt, re.IGNORECASE):
-                    issues.append(f"   Línea {start_line}: SELECT TOP sin ORDER BY determinista")
-                buffering=False; buf=[]; start_line=None
+        # ORDER BY de la misma consulta: mismo nivel y mismo paréntesis (no cuenta OVER(ORDER BY ...))
+        ordered = any(o.name == "ORDER BY" and o.depth == c.depth and o.group == c.group and o.start > c.start
+                      for o in st.clauses)
+        if not ordered:
+            issues.append(_token_finding(src, st.tokens[c.start], "SELECT TOP sin ORDER BY determinista"))
     return issues
 
-def check_delete_update_without_where(lines):
+def check_delete_update_without_where(src: SqlSource):
     issues = []
-    buffering=False; buf=[]; start_line=None; kind=None
-    for i, ln in enumerate(lines, 1):
-        line = ln.split("--",1)[0]
-        if not buffering:
-            m = re.search(r"\b(DELETE|UPDATE)\b", line, re.IGNORECASE)
-            if m:
-                kind = m.group(1).upper(); buffering=True; buf=[line]; start_line=i
-                continue
-        else:
-            buf.append(line)
-            if ";" in line or re.search(r"^\s*GO\s*$", line, re.IGNORECASE):
-                stmt = " ".join(buf)
-                if not re.search(r"\bWHERE\b", stmt, re.IGNORECASE):
-                    issues.append(f"   Línea {start_line}: {kind} sin cláusula WHERE")
-                buffering=False; buf=[]; start_line=None; kind=None
+    for st in src.statements:
+        if st.verb not in ("DELETE", "UPDATE"):
+            continue
+        nxt = _word(st.tokens[st.verb_pos + 1]) if st.verb_pos + 1 < len(st.tokens) else ""
+        if nxt == "STATISTICS":
+            continue
+        if not any(c.name == "WHERE" and c.depth == 0 for c in st.clauses):
+            issues.append(_token_finding(src, st.tokens[st.verb_pos], f"{st.verb} sin cláusula WHERE"))
     return issues
 
-def check_merge_usage(lines):
-    return [f"   Línea {i}: {ln.strip()}" for i, ln in enumerate(lines,1)
-            if not ln.strip().startswith('--') and re.search(r"\bMERGE\b", ln, re.IGNORECASE)]
-
-def check_select_distinct_no_justification(lines):
+def check_select_distinct_no_justification(src: SqlSource):
     issues=[]
-    for i, ln in enumerate(lines,1):
-        if re.search(r"\bSELECT\s+DISTINCT\b", ln, re.IGNORECASE):
-            prev = lines[i-2:i-1] + lines[i-1:i]
-            snippet = " ".join(prev + [ln])
-            if not re.search(r"--\s*justification\s*:", snippet, re.IGNORECASE):
-                issues.append(f"   Línea {i}: SELECT DISTINCT sin justificación (-- justification:)")
+    code, starts = src.code_text, src.line_starts
+    for j, (i, s, e) in enumerate(src.spans()):
+        m = select_distinct_pattern.search(code, s, e)
+        if m:
+            # la justificación es un comentario: se busca en el texto original (línea previa y actual)
+            if not justification_pattern.search(src.text, starts[max(j-1, 0)], e):
+                issues.append(_finding(src, i, m.start() - s + 1,
+                                       "SELECT DISTINCT sin justificación (-- justification:)"))
     return issues
 
-def check_exec_dynamic_sql_unparameterized(lines):
+def check_exec_dynamic_sql_unparameterized(src: SqlSource):
     issues=[]
-    joined = "\n".join(lines)
-    pattern = re.compile(r"\bEXEC(?:UTE)?\b\s*(?:sp_executesql)?\s*\((?:[^)]*\+[^)]*)\)|\bsp_executesql\b\s+@?\w+\s*=.*\+.*", re.IGNORECASE|re.DOTALL)
-    for m in pattern.finditer(joined):
-        pos = joined[:m.start()].count("\n")+1
-        issues.append(f"   Línea {pos}: SQL dinámico con concatenación no parametrizada")
+    for m in exec_dynamic_pattern.finditer(src.code_text):
+        line, col = src.locate(m.start())
+        issues.append(_finding(src, line, col, "SQL dinámico con concatenación no parametrizada"))
     return issues
 
-def check_select_into_heavy(lines):
+def check_select_into_heavy(src: SqlSource):
     issues=[]
-    for i, ln in enumerate(lines,1):
-        line = ln.split("--",1)[0]
-        if re.search(r"\bSELECT\b.*\bINTO\b\s+#\w+", line, re.IGNORECASE):
-            issues.append(f"   Línea {i}: SELECT INTO #temp; recomienda CREATE TABLE + INSERT para control de tipos/índices")
+    code = src.code_text
+    for i, s, e in src.spans():
+        m = select_into_temp_pattern.search(code, s, e)
+        if m:
+            issues.append(_finding(src, i, m.start() - s + 1,
+                                   "SELECT INTO #temp; recomienda CREATE TABLE + INSERT para control de tipos/índices"))
     return issues
 
 # ---- Nuevas (pedido actual): 10, 13, 14
-def check_scalar_udf_in_select_where(lines):
+def check_scalar_udf_in_select_where(src: SqlSource):
     """
     Detecta llamadas a UDF escalares en SELECT/WHERE: p.ej. dbo.fn(...), schema.fn(...).
     (Heurística: cualquier identificador 1-3 partes seguido de '(' que no sea palabra clave típica.)
     """
     issues = []
-    for i, ln in enumerate(lines, 1):
-        if ln.strip().startswith("--"):
-            continue
-        l = ln.split("--",1)[0]
-        if re.search(r"\bSELECT\b", l, re.IGNORECASE) or re.search(r"\bWHERE\b", l, re.IGNORECASE):
+    code = src.code_text
+    for i, s, e in src.spans():
+        if select_pattern.search(code, s, e) or where_pattern.search(code, s, e):
             # Evitar funciones nativas comunes? (heurística básica: de momento no; revisión manual)
-            if udf_call_pattern.search(l):
-                issues.append(f"   Línea {i}: Posible UDF escalar en SELECT/WHERE -> {l.strip()}")
+            m = udf_call_pattern.search(code, s, e)
+            if m:
+                raw = src.text[s:e]
+                issues.append(Finding(i, m.start() - s + 1, f"Posible UDF escalar en SELECT/WHERE -> {raw.split('--', 1)[0].strip()}",
+                                      raw.strip()))
     return issues
 
-def check_deprecated_types(lines):
+# -----------------------------
+# Índice de funciones del repo (CREATE/ALTER FUNCTION)
+# -----------------------------
+# Se arma antes de auditar y se guarda en <logs_dir>/functions_index.json, por archivo y con su
+# sha256: en la siguiente ejecución solo se vuelven a analizar los archivos cuyo contenido cambió.
+# El (mtime, tamaño) guardado evita hasta leerlos si no se tocaron; un checkout nuevo (CI) cambia
+# todos los mtime, y ahí alcanza con leer y comparar el hash.
+# Con el índice, user_functions y scalar_udf_in_select_where marcan solo llamadas a UDF escalares
+# definidas en el repo (búsqueda O(1) por "esquema.nombre"), no cualquier identificador con '('.
+FUNCTION_INDEX_FORMAT = "2"
+FUNCTION_INDEX_FILE = "functions_index.json"
+
+class FunctionDef(NamedTuple):
+    schema: str   # "dbo" si la definición no lo indica
+    name: str
+    kind: str     # "scalar" | "table" (RETURNS TABLE o RETURNS @var TABLE)
+    line: int
+
+# llamada con nombre de 2 o 3 partes: una UDF escalar solo se puede invocar con esquema
+qualified_call_pattern = re.compile(r"(?<![\w.\]])(?:(?:\[(?:[^\]]|\]\])*\]|\w+)\s*\.\s*){1,2}(?:\[(?:[^\]]|\]\])*\]|\w+)\s*\(")
+_name_part_pattern = re.compile(r"\[((?:[^\]]|\]\])*)\]|(\w+)")
+
+def _unquote_ident(value: str) -> str:
+    if value[:1] == "[":
+        return value[1:-1].replace("]]", "]") if value.endswith("]") else value[1:]
+    if value[:1] == '"':
+        return value[1:-1].replace('""', '"') if len(value) > 1 and value.endswith('"') else value[1:]
+    return value
+
+def function_key(schema: str, name: str) -> str:
+    """Clave del índice: sin distinción de mayúsculas, como la intercalación por defecto de SQL Server."""
+    return f"{schema}.{name}".lower()
+
+def extract_function_defs(src: SqlSource) -> list:
+    """FunctionDef de cada CREATE [OR ALTER] FUNCTION / ALTER FUNCTION de `src` (por tokens)."""
+    toks = [t for t in src.iter_tokens() if t.kind != "COMMENT"]
+    defs = []
+    n = len(toks)
+    for i, tok in enumerate(toks):
+        if tok.kind != "KEYWORD" or tok.value.upper() != "FUNCTION" or _word(toks[i - 1] if i else None) not in ("CREATE", "ALTER"):
+            continue
+        parts = []
+        j = i + 1
+        while j < n and toks[j].kind in ("IDENT", "QUOTED_IDENT", "KEYWORD"):
+            parts.append(_unquote_ident(toks[j].value))
+            j += 1
+            if j < n and toks[j].value == ".":
+                j += 1
+            else:
+                break
+        if not parts or len(parts) > 3:
+            continue
+        # RETURNS a nivel de paréntesis 0: tras la lista de parámetros
+        depth = 0
+        kind = None
+        while j < n and toks[j].kind != "GO":
+            v = toks[j].value
+            if v == "(":
+                depth += 1
+            elif v == ")":
+                depth -= 1
+            elif depth == 0 and toks[j].kind == "KEYWORD" and v.upper() == "RETURNS":
+                nxt = toks[j + 1] if j + 1 < n else None
+                if nxt is not None and nxt.kind == "VARIABLE":
+                    nxt = toks[j + 2] if j + 2 < n else None
+                kind = "table" if _word(nxt) == "TABLE" else "scalar"
+                break
+            j += 1
+        if kind is not None:
+            defs.append(FunctionDef(parts[-2] if len(parts) > 1 else "dbo", parts[-1], kind, tok.line))
+    return defs
+
+def _function_defs_in_file(fp: Path, max_bytes: int) -> list:
+    try:
+        with open(fp, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            data = f.read() if size <= max_bytes else None
+        if data is None:
+            return [d for src in iter_sql_batches(fp) for d in extract_function_defs(src)]
+        if b"function" not in data.lower():
+            return []   # la gran mayoría: sin lexer
+        return extract_function_defs(lex_sql(_decode_sql(data)))
+    except (OSError, UnicodeDecodeError):
+        return []   # el error se informa al auditar el archivo
+
+def _file_sha256(fp: Path):
+    """sha256 (hex) del contenido de `fp`, leído por bloques, o None si no se puede leer."""
+    h = hashlib.sha256()
+    try:
+        with open(fp, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+def function_index_mode(cfg: configparser.ConfigParser) -> str:
+    """[functions] index: "auto" (índice si el repo define alguna función), "on" u "off" (heurística)."""
+    value = cfg.get("functions", "index", fallback="auto").strip().lower()
+    if value in ("", "auto"):
+        return "auto"
+    return "on" if value in ("1", "yes", "true", "on") else "off"
+
+def build_function_index(files: list, cfg: configparser.ConfigParser, repo_root: Path, stamps: dict = None):
     """
-    Detecta tipos TEXT/NTEXT/IMAGE en cualquier definición/uso.
+    Índice {"esquema.nombre": "scalar"|"table"} de las funciones definidas en `files`, o None si
+    no se usa ([functions] index = off, o auto sin ninguna definición). Reutiliza lo guardado de los
+    archivos con el mismo (mtime, tamaño) sin leerlos, y el de los que tienen el mismo sha256 sin
+    analizarlos; reescribe el archivo del índice solo si algo cambió.
+    `stamps` ({ruta: (mtime_ns, tamaño)}) evita volver a hacer stat de archivos ya vistos.
     """
+    mode = function_index_mode(cfg)
+    if mode == "off":
+        return None
+    # las funciones del repo se definen en .sql, no en el SQL embebido de otros archivos
+    files = [fp for fp in files if fp.name.lower().endswith(".sql")]
+    path = _logs_dir(cfg, repo_root) / FUNCTION_INDEX_FILE
+    try:
+        with open(path, encoding="utf-8") as f:
+            stored = json.load(f)
+        entries = stored["files"] if stored.get("format") == FUNCTION_INDEX_FORMAT else {}
+    except (OSError, ValueError, KeyError, AttributeError):
+        entries = {}
+    max_bytes = max_file_bytes(cfg)
+    current = {}
+    changed = False
+    for fp in files:
+        stamp = stamps.get(fp) if stamps is not None else None
+        stamp = list(stamp or _file_stamp(fp) or ())
+        rel = _report_path(str(fp), repo_root)
+        entry = entries.get(rel)
+        if entry is None or entry.get("stamp") != stamp:
+            digest = _file_sha256(fp)
+            if entry is None or digest is None or entry.get("sha256") != digest:
+                entry = {"functions": [list(d) for d in _function_defs_in_file(fp, max_bytes)]}
+            entry = {"stamp": stamp, "sha256": digest, "functions": entry["functions"]}
+            changed = True
+        current[rel] = entry
+    if changed or current.keys() != entries.keys():
+        try:
+            _atomic_write(path, json.dumps({"format": FUNCTION_INDEX_FORMAT, "files": current}, ensure_ascii=False))
+        except OSError:
+            pass   # igual que la caché: sin poder guardarlo, la próxima ejecución vuelve a indexar
+    index = {}
+    for rel in sorted(current):
+        for schema, name, kind, _ in current[rel]["functions"]:
+            index.setdefault(function_key(schema, name), kind)
+    if not index and mode == "auto":
+        return None
+    return index
+
+def _indexed_scalar_call(code: str, start: int, end: int, udf_index: dict):
+    """Primera llamada en code[start:end] a una UDF escalar del índice, o None."""
+    for m in qualified_call_pattern.finditer(code, start, end):
+        parts = [a or b for a, b in _name_part_pattern.findall(m.group())]
+        if udf_index.get(function_key(parts[-2].replace("]]", "]"), parts[-1].replace("]]", "]"))) == "scalar":
+            return m
+    return None
+
+def check_user_funcs_indexed(src: SqlSource, udf_index: dict):
+    """user_functions con índice: WHERE seguido de una llamada a una UDF escalar definida en el repo."""
     issues = []
-    for i, ln in enumerate(lines, 1):
-        if ln.strip().startswith("--"):
-            continue
-        if deprecated_types_pattern.search(ln):
-            issues.append(f"   Línea {i}: Uso de tipo deprecado (TEXT/NTEXT/IMAGE)")
+    code = src.code_text
+    for i, s, e in src.spans():
+        w = where_pattern.search(code, s, e)
+        if w and _indexed_scalar_call(code, w.end(), e, udf_index):
+            text = src.text[s:e].strip()
+            issues.append(Finding(i, w.start() - s + 1, text, text))
     return issues
 
-def check_hint_usage_general(lines):
-    """
-    Detecta hints de consulta comunes:
-      - WITH (INDEX(...)), FORCESEEK, FAST n
-      - LOOP/HASH/MERGE JOIN
-      - OPTION(RECOMPILE|OPTIMIZE FOR|USE HINT|QUERYTRACEON|...)
-    """
+def check_scalar_udf_indexed(src: SqlSource, udf_index: dict):
+    """scalar_udf_in_select_where con índice: solo llamadas a UDF escalares definidas en el repo."""
     issues = []
-    for i, ln in enumerate(lines, 1):
-        if ln.strip().startswith("--"):
-            continue
-        if hints_pattern.search(ln):
-            issues.append(f"   Línea {i}: Uso de hint de consulta -> {ln.strip()}")
+    code = src.code_text
+    for i, s, e in src.spans():
+        if select_pattern.search(code, s, e) or where_pattern.search(code, s, e):
+            m = _indexed_scalar_call(code, s, e, udf_index)
+            if m:
+                name = re.sub(r"\s+", "", m.group()[:-1])
+                raw = src.text[s:e]
+                issues.append(Finding(i, m.start() - s + 1, f"UDF escalar {name} en SELECT/WHERE -> {raw.split('--', 1)[0].strip()}",
+                                      raw.strip()))
     return issues
 
 # -----------------------------
-# Auditoría de archivo
+# Registro de reglas
 # -----------------------------
-def audit_file(fp: Path, cfg: configparser.ConfigParser, special_chars_re: re.Pattern):
-    with open(fp, encoding="utf-8") as f:
-        lines = f.read().splitlines(True)
-
-    res = {
-        "archivo": str(fp),
-        "nolock": [], "special": [], "global": [], "temp": [],
-        "curs": [], "funcs": [], "warn": [],
-        "select_star": [], "select_top": [],
-        "top_without_order_by": [], "delete_update_without_where": [], "merge_usage": [],
-        "select_distinct_no_justification": [], "exec_dynamic_sql_unparameterized": [], "select_into_heavy": [],
-        "scalar_udf_in_select_where": [], "deprecated_types": [], "hint_usage_general": []
-    }
-
-    if rule_enabled(cfg, "nolock", True):
-        res["nolock"] = check_nolock(lines)
-    if rule_enabled(cfg, "special_chars", True):
-        res["special"] = check_special_chars(lines, special_chars_re)
-    if rule_enabled(cfg, "global_temp", True):
-        res["global"] = check_global_temp(lines)
-    if rule_enabled(cfg, "temp_names", True):
-        res["temp"] = check_temp_names(lines)
-    if rule_enabled(cfg, "cursors", True):
-        res["curs"] = check_cursors(lines)
-    if rule_enabled(cfg, "user_functions", True):
-        res["funcs"] = check_user_funcs(lines)
-    if rule_enabled(cfg, "inner_join_where", True):
-        res["warn"] = check_inner_join_warnings(lines)
-    if rule_enabled(cfg, "select_star", True):
-        res["select_star"] = check_select_star(lines)
-    if rule_enabled(cfg, "select_top", True):
-        res["select_top"] = check_select_top(lines)
-
-    # nuevas ya activadas en la entrega anterior
-    if rule_enabled(cfg, "top_without_order_by", True):
-        res["top_without_order_by"] = check_top_without_order_by(lines)
-    if rule_enabled(cfg, "delete_update_without_where", True):
-        res["delete_update_without_where"] = check_delete_update_without_where(lines)
-    if rule_enabled(cfg, "merge_usage", True):
-        res["merge_usage"] = check_merge_usage(lines)
-    if rule_enabled(cfg, "select_distinct_no_justification", True):
-        res["select_distinct_no_justification"] = check_select_distinct_no_justification(lines)
-    if rule_enabled(cfg, "exec_dynamic_sql_unparameterized", True):
-        res["exec_dynamic_sql_unparameterized"] = check_exec_dynamic_sql_unparameterized(lines)
-    if rule_enabled(cfg, "select_into_heavy", True):
-        res["select_into_heavy"] = check_select_into_heavy(lines)
-
-    # nuevas de este pedido
-    if rule_enabled(cfg, "scalar_udf_in_select_where", True):
-        res["scalar_udf_in_select_where"] = check_scalar_udf_in_select_where(lines)
-    if rule_enabled(cfg, "deprecated_types", True):
-        res["deprecated_types"] = check_deprecated_types(lines)
-    if rule_enabled(cfg, "hint_usage_general", True):
-        res["hint_usage_general"] = check_hint_usage_general(lines)
+class Rule(NamedTuple):
+    key: str                     # clave en [rules] y [severities]
+    res_key: str                 # clave en el resultado de audit_file
+    severity: str                # severidad por defecto (si [severities] no la define)
+    title: str                   # título en el reporte de consola
+    keywords: tuple              # literales (en mayúsculas) de los que al menos uno debe aparecer en el
+                                 # código para que la regla pueda disparar; () = corre siempre
+    check: object = None         # check_*(src), o None si la resuelve el escáner por línea
+    pattern: re.Pattern = None   # patrón de la regla por línea (escáner fusionado)
+    message: str = "{text}"      # mensaje de la regla por línea; `{text}` es la línea original
+    scope: str = "line"          # "statement": en --diff se conserva si el cambio toca la sentencia;
+                                 # "file": en --diff se conserva siempre
+    indexed_check: object = None # check_*(src, udf_index) que reemplaza a la regla si hay índice de funciones
 
-    return res
+# En el orden del reporte
+RULES = [
+    Rule("nolock", "nolock", "error", "Falta WITH (NOLOCK) en FROM/JOIN:", ("FROM", "JOIN"), check=check_nolock),
+    Rule("special_chars", "special", "warning", "Caracteres especiales no permitidos:", ()),
+    Rule("global_temp", "global", "error", "Uso de tabla temporal global (##):", ("##",), pattern=global_temp_pattern),
+    Rule("temp_names", "temp", "warning", "Nombre de temporal genérico (#temp/@temp):", ("#TEMP", "@TEMP"),
+         pattern=bad_temp_names_pattern),
+    Rule("cursors", "curs", "error", "Uso de cursor:", ("CURSOR",), pattern=cursor_pattern),
+    Rule("user_functions", "funcs", "error", "Función en WHERE:", ("WHERE",), pattern=user_function_in_where_pattern,
+         indexed_check=check_user_funcs_indexed),
+    Rule("inner_join_where", "warn", "warning", "INNER JOIN + WHERE sin variantes:", ("INNER",),
+         check=check_inner_join_warnings, scope="statement"),
+    Rule("select_star", "select_star", "error", "SELECT * detectado:", ("*",), check=check_select_star, scope="statement"),
+    Rule("select_top", "select_top", "error", "SELECT TOP detectado:", ("TOP",), check=check_select_top, scope="statement"),
+    Rule("top_without_order_by", "top_without_order_by", "error", "SELECT TOP sin ORDER BY:", ("TOP",),
+         check=check_top_without_order_by, scope="statement"),
+    Rule("delete_update_without_where", "delete_update_without_where", "error", "DELETE/UPDATE sin WHERE:",
+         ("DELETE", "UPDATE"), check=check_delete_update_without_where, scope="statement"),
+    Rule("merge_usage", "merge_usage", "warning", "MERGE detectado:", ("MERGE",), pattern=merge_pattern),
+    Rule("select_distinct_no_justification", "select_distinct_no_justification", "warning",
+         "SELECT DISTINCT sin justificación:", ("DISTINCT",), check=check_select_distinct_no_justification),
+    Rule("exec_dynamic_sql_unparameterized", "exec_dynamic_sql_unparameterized", "error", "EXEC dinámico sin parámetros:",
+         ("EXEC",), check=check_exec_dynamic_sql_unparameterized, scope="statement"),
+    Rule("select_into_heavy", "select_into_heavy", "warning", "SELECT INTO #temp (recomendación):", ("INTO",),
+         check=check_select_into_heavy),
+    Rule("scalar_udf_in_select_where", "scalar_udf_in_select_where", "warning", "UDF escalar en SELECT/WHERE:",
+         ("SELECT", "WHERE"), check=check_scalar_udf_in_select_where, indexed_check=check_scalar_udf_indexed),
+    Rule("deprecated_types", "deprecated_types", "error", "Tipos deprecados (TEXT/NTEXT/IMAGE):", ("TEXT", "IMAGE"),
+         pattern=deprecated_types_pattern, message="Uso de tipo deprecado (TEXT/NTEXT/IMAGE)"),
+    Rule("hint_usage_general", "hint_usage_general", "warning", "Hints de consulta detectados:",
+         ("INDEX", "FORCESEEK", "FAST", "JOIN", "OPTION"), pattern=hints_pattern, message="Uso de hint de consulta -> {text}"),
+    # no es una regla de estilo: la registra audit_source cuando otra regla se pasa de [limits]. Es error:
+    # la regla interrumpida pierde sus hallazgos, y un archivo patológico no debe dejar pasar el CI
+    Rule("analysis_timeout", "analysis_timeout", "error", "Análisis interrumpido por tiempo:", (), scope="file"),
+    # tampoco es de estilo: la registra audit_file cuando no puede leer el archivo (no es UTF-8, XML mal
+    # formado, .py que no se tokeniza). Es error por lo mismo: lo que no se leyó no se auditó
+    Rule("unreadable_file", "unreadable_file", "error", "Archivo no auditado (no se pudo leer):", (), scope="file"),
+]
+DEFAULT_SEVERITIES = {r.key: r.severity for r in RULES}
 
 # -----------------------------
-# Helpers de impresión
+# Escáner fusionado de reglas por línea y prefiltro por palabras clave
 # -----------------------------
-def show(rule_key: str, title: str, items: list, cfg: configparser.ConfigParser):
-    s = sev(cfg, rule_key)
-    if s == "off":
-        return False
-    if items:
-        print(f"\n{badge(s)} [{rule_key}] {title} ({len(items)}):")
-        for it in items:
-            print(it)
-        return s == "error"
-    return False
+
+class LineScanner:
+    """
+    Reglas habilitadas en [rules] para una ejecución (se construye una vez). Las reglas por línea
+    del registro se fusionan en una sola alternancia con un grupo con nombre por regla: por archivo
+    hay una búsqueda sobre la vista de código y special_chars va por su propio motor (SpecialChars);
+    las líneas sin ninguna coincidencia se saltan sin evaluar regla alguna. Produce los mismos
+    hallazgos que check_*. `checks` son las demás reglas habilitadas (las que corre audit_source).
+    Con `udf_index` (ver build_function_index) las reglas con `indexed_check` pasan a usarlo.
+    """
+    __slots__ = ("rules", "checks", "keywords", "fused", "special_chars_re")
+
+    def __init__(self, cfg: configparser.ConfigParser, special_chars_re: SpecialChars, udf_index: dict = None):
+        enabled = [r for r in RULES if rule_enabled(cfg, r.key, True)]
+        if udf_index is not None:
+            enabled = [r._replace(check=partial(r.indexed_check, udf_index=udf_index), pattern=None)
+                       if r.indexed_check is not None else r for r in enabled]
+        self.rules = [(r.key, r.res_key, r.pattern, r.message) for r in enabled if r.pattern is not None]
+        self.checks = [r for r in enabled if r.check is not None]
+        self.keywords = sorted({kw for r in enabled for kw in r.keywords})
+        self.fused = {}   # alternancia compilada por subconjunto de reglas activas
+        self.special_chars_re = special_chars_re if rule_enabled(cfg, "special_chars", True) else None
+
+    def candidates(self, src: SqlSource):
+        """
+        Claves de las reglas que pueden disparar en `src`: las que no declaran palabras clave y las que
+        tienen alguna presente en la vista de código (una pasada de búsqueda de subcadenas en C sobre el
+        texto en mayúsculas). None = sin prefiltro: con texto no ASCII, IGNORECASE de `re` iguala letras
+        que upper() no (p.ej. 'ſ' con 's'), así que ahí corren todas.
+        """
+        code_text = src.code_text
+        if not code_text.isascii():
+            return None
+        up = code_text.upper()
+        found = {kw for kw in self.keywords if kw in up}
+        return {r.key for r in RULES if not r.keywords or not found.isdisjoint(r.keywords)}
+
+    def _fused_for(self, rules: list):
+        keys = tuple(key for key, _, _, _ in rules)
+        fused = self.fused.get(keys)
+        if fused is None and keys:
+            alts = []
+            for key, _, pattern, _ in rules:
+                flags = "i" if pattern.flags & re.IGNORECASE else "-i"
+                alts.append(f"(?P<{key}>(?{flags}:{pattern.pattern}))")
+            fused = self.fused[keys] = re.compile("|".join(alts))
+        return fused
+
+    def scan(self, src: SqlSource, active: set = None) -> dict:
+        """
+        Devuelve {clave de resultado: [hallazgos]} de las reglas por línea habilitadas; con `active`
+        (ver candidates) solo se buscan esas y las demás quedan vacías.
+        """
+        out = {res_key: [] for _, res_key, _, _ in self.rules}
+        rules = self.rules if active is None else [r for r in self.rules if r[0] in active]
+        starts = src.line_starts   # misma geometría en `text` y `code_text`
+        text = src.text
+        first = src.first_line
+
+        fused = self._fused_for(rules)
+        if fused is not None:
+            code_text = src.code_text
+            search = fused.search
+            pos = 0
+            while True:
+                m = search(code_text, pos)
+                if m is None:
+                    break
+                i = bisect_right(starts, m.start()) - 1
+                start, pos = starts[i], starts[i + 1]
+                # la regla que coincidió no necesita re-evaluarse si su match no cruza de línea;
+                # las demás se confirman sobre esta línea (una línea puede disparar varias reglas)
+                hit = m.lastgroup if m.end() <= pos else None
+                text_i = text[start:pos].strip()
+                for key, res_key, pattern, msg in rules:
+                    if key == hit:
+                        col = m.start() - start + 1
+                    else:
+                        hm = pattern.search(code_text, start, pos)
+                        if hm is None:
+                            continue
+                        col = hm.start() - start + 1
+                    out[res_key].append(Finding(first + i, col, msg.format(text=text_i), text_i))
+
+        if self.special_chars_re is not None:
+            out["special"] = self.special_chars_re.findings(src)
+        return out
+
+    def scan_each(self, src: SqlSource, timings: dict, active: set = None, budget: "TimeBudget" = None) -> dict:
+        """
+        Igual que scan(), pero regla por regla (sin alternancia fusionada) para poder atribuir el
+        tiempo a cada una en `timings` (modo --profile) o el presupuesto de `budget` ([limits]).
+        Mismos hallazgos, más lento.
+        """
+        out = {res_key: [] for _, res_key, _, _ in self.rules}
+        spans = list(src.spans())
+        for key, res_key, pattern, msg in self.rules:
+            if active is not None and key not in active:
+                continue
+            out[res_key] = _run_rule(timings, budget, key, _line_rule_findings, src, spans, pattern, msg)
+        if self.special_chars_re is not None:
+            out["special"] = _run_rule(timings, budget, "special_chars", check_special_chars, src, self.special_chars_re)
+        return out
+
+def _line_rule_findings(src: SqlSource, spans: list, pattern: re.Pattern, msg: str) -> list:
+    """Una regla por línea sobre `spans` (ver SqlSource.spans), fuera del escáner fusionado."""
+    code_text, text = src.code_text, src.text
+    search = pattern.search
+    items = []
+    for i, s, e in spans:
+        m = search(code_text, s, e)
+        if m:
+            text_i = text[s:e].strip()
+            items.append(Finding(i, m.start() - s + 1, msg.format(text=text_i), text_i))
+    return items
 
 # -----------------------------
-# Main
+# Presupuesto de tiempo del análisis ([limits])
 # -----------------------------
-def main():
-    print("==== Auditoría iniciada ====\n")
-    repo_root = Path.cwd().resolve()
-    cfg = load_config_fixed(repo_root)
-    roots = parse_roots_from_config(cfg, repo_root)
-    print(f"Raíz del repo detectada: {repo_root}")
-    print("Orígenes a auditar:")
-    for r in roots:
-        print(f"  - {r}")
+class AnalysisTimeout(Exception):
+    """Una regla agotó su presupuesto de tiempo (la lanza la alarma de TimeBudget.run)."""
 
-    any_issue_as_error = False
-    audited_any = False
+def _on_alarm(signum, frame):
+    raise AnalysisTimeout()
 
-    # Compilar caracteres especiales una sola vez
-    special_chars_re = compile_special_chars_pattern(cfg, repo_root)
+def _can_interrupt() -> bool:
+    """
+    SIGALRM solo existe en Unix y solo llega al hilo principal; además no se pisa un temporizador
+    ITIMER_REAL que ya tenga armado quien nos llama.
+    """
+    return (hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+            and signal.getitimer(signal.ITIMER_REAL)[0] == 0)
 
-    for root_dir in roots:
-        root_dir = root_dir.resolve()
-        if not root_dir.exists() or not root_dir.is_dir():
-            print(f"⚠️  Origen no válido (se omite): {root_dir}")
-            continue
+def analysis_limits(cfg: configparser.ConfigParser) -> tuple:
+    """([limits] rule_timeout_s, [limits] file_timeout_s) en segundos; 0 = sin límite."""
+    limits = []
+    for key, fallback in (("rule_timeout_s", 30.0), ("file_timeout_s", 300.0)):
+        try:
+            value = float(cfg.get("limits", key, fallback=str(fallback)))
+        except ValueError:
+            value = fallback
+        limits.append(max(value, 0.0))
+    return tuple(limits)
 
-        audited_any = True
-        for walk_root, _, files in os.walk(root_dir):
-            # Ignora .github y .config en cualquier nivel
-            parts = Path(walk_root).parts
-            if ".github" in parts or ".config" in parts:
+class TimeBudget:
+    """
+    Presupuesto de tiempo de un archivo: cada regla corre a lo sumo `rule_s` segundos y entre todas
+    (todos los lotes, en streaming) no pasan de `file_s`; 0 = sin límite. Con SIGALRM la regla que
+    se pasa (p.ej. un patrón que retrocede sin fin en una línea minificada) se interrumpe en plena
+    búsqueda; sin él (Windows, hilos) solo se omiten las reglas que quedan una vez agotado el archivo.
+    Lo interrumpido y lo omitido se reporta como hallazgos analysis_timeout (ver findings).
+    """
+    __slots__ = ("rule_s", "deadline", "timed_out", "skipped")
+
+    def __init__(self, rule_s: float, file_s: float):
+        self.rule_s = rule_s
+        self.deadline = time.monotonic() + file_s if file_s > 0 else None
+        self.timed_out = []   # (clave de regla, segundos) interrumpidas
+        self.skipped = []     # claves de regla no evaluadas: el archivo ya había agotado su presupuesto
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def run(self, key, fn, *args):
+        """
+        fn(*args) dentro del presupuesto; None si se interrumpió o ni llegó a correr. Con `key`
+        None no se registra nada (quien llama decide cómo atribuirlo).
+        """
+        limit = self.rule_s
+        if self.deadline is not None:
+            left = self.deadline - time.monotonic()
+            if left <= 0:
+                if key is not None:
+                    self.skipped.append(key)
+                return None
+            limit = min(limit, left) if limit > 0 else left
+        if limit <= 0 or not _can_interrupt():
+            return fn(*args)
+        t0 = time.perf_counter()
+        prev = signal.signal(signal.SIGALRM, _on_alarm)
+        try:
+            signal.setitimer(signal.ITIMER_REAL, limit)
+            try:
+                return fn(*args)
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        except AnalysisTimeout:
+            # también si la alarma llegó justo al terminar fn: se pasó del límite igual
+            if key is not None:
+                self.timed_out.append((key, time.perf_counter() - t0))
+            return None
+        finally:
+            signal.signal(signal.SIGALRM, prev)
+
+    def findings(self, src: SqlSource) -> list:
+        """Hallazgos analysis_timeout de lo registrado desde la llamada anterior, en la 1ª línea de `src`."""
+        if not self.timed_out and not self.skipped:
+            return []
+        line = src.first_line
+        snippet = src.line_text(line).strip()
+        items = [Finding(line, 1, f"Regla {key} interrumpida tras {secs:.1f}s ([limits] rule_timeout_s/file_timeout_s): "
+                                  f"sus hallazgos quedan sin evaluar", snippet)
+                 for key, secs in self.timed_out]
+        if self.skipped:
+            items.append(Finding(line, 1, f"Presupuesto del archivo agotado ([limits] file_timeout_s): sin evaluar "
+                                          f"{', '.join(self.skipped)}", snippet))
+        self.timed_out = []
+        self.skipped = []
+        return items
+
+# -----------------------------
+# Auditoría de archivo
+# -----------------------------
+def _record_timing(timings: dict, key: str, seconds: float, matches: int):
+    t = timings.get(key)
+    if t is None:
+        timings[key] = [seconds, matches]
+    else:
+        t[0] += seconds
+        t[1] += matches
+
+def _timed_rule(timings, key: str, check, src: SqlSource, *args) -> list:
+    """check(src, *args); con `timings` ({clave: [segundos, hallazgos]}) además acumula su costo."""
+    if timings is None:
+        return check(src, *args)
+    t0 = time.perf_counter()
+    items = check(src, *args)
+    _record_timing(timings, key, time.perf_counter() - t0, len(items))
+    return items
+
+def _run_rule(timings, budget: TimeBudget, key: str, check, src: SqlSource, *args) -> list:
+    """_timed_rule dentro de `budget` (si hay): una regla interrumpida u omitida queda sin hallazgos."""
+    if budget is None:
+        return _timed_rule(timings, key, check, src, *args)
+    items = budget.run(key, _timed_rule, timings, key, check, src, *args)
+    return [] if items is None else items
+
+def audit_source(src: SqlSource, cfg: configparser.ConfigParser, scanner: "LineScanner", timings: dict = None,
+                 budget: TimeBudget = None) -> dict:
+    """
+    Ejecuta las reglas habilitadas sobre un SqlSource (archivo completo o lote); {clave: [hallazgos]}.
+    Con `timings` (modo --profile) acumula ahí segundos y hallazgos por regla de config.
+    Con `budget` cada regla corre dentro de su presupuesto de tiempo y las que se pasan quedan
+    reportadas en "analysis_timeout".
+    """
+    res = {r.res_key: [] for r in RULES}
+
+    # prefiltro: las reglas sin ninguna de sus palabras clave en el código no se evalúan
+    t0 = time.perf_counter() if timings is not None else 0.0
+    active = scanner.candidates(src)
+    checks = [r for r in scanner.checks if active is None or r.key in active]
+
+    # reglas por línea: una sola pasada fusionada (main() construye el escáner una vez por ejecución)
+    line_res = None
+    if timings is None:
+        line_res = scanner.scan(src, active) if budget is None else budget.run(None, scanner.scan, src, active)
+    else:
+        _record_timing(timings, "prefilter", time.perf_counter() - t0, 0)
+    if line_res is None:
+        # --profile, o la pasada fusionada se pasó del presupuesto y no dice qué regla fue:
+        # regla por regla, cada una con su propio presupuesto (las demás conservan sus hallazgos)
+        line_res = scanner.scan_each(src, timings, active, budget)
+    res.update(line_res)
+    if timings is not None and any(r.scope == "statement" for r in checks):
+        # el índice de sentencias (y los tokens, que solo se generan para él) es perezoso: se construye
+        # acá para medirlo aparte; si no, su costo se lo cargaría la primera regla que lo usa
+        t0 = time.perf_counter()
+        src.build_statements()
+        _record_timing(timings, "statement_index", time.perf_counter() - t0, 0)
+
+    for rule in checks:
+        res[rule.res_key] = _run_rule(timings, budget, rule.key, rule.check, src)
+
+    if budget is not None:
+        res["analysis_timeout"] = budget.findings(src)
+    return res
+
+def _decode_sql(data: bytes) -> str:
+    return _normalize_newlines(data.decode("utf-8"))
+
+def _normalize_newlines(text: str) -> str:
+    if "\r" in text:
+        # mismos saltos de línea que open(..., encoding="utf-8") en modo texto
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+def max_file_bytes(cfg: configparser.ConfigParser) -> int:
+    """[paths] max_file_size_mb en bytes: por encima, el archivo se audita en streaming (o se omite)."""
+    try:
+        max_mb = float(cfg.get('paths','max_file_size_mb', fallback='5'))
+    except Exception:
+        max_mb = 5.0
+    return int(max_mb * 1024 * 1024)
+
+def skip_large_files(cfg: configparser.ConfigParser) -> bool:
+    return cfg.get("paths", "large_files", fallback="stream").strip().lower() == "skip"
+
+STREAM_BATCH_BYTES = 1024 * 1024
+go_separator_pattern = re.compile(rb"[ \t]*GO(?:[ \t]+\d+)?[ \t]*(?:--[^\r\n]*)?\r?\n?\Z", re.IGNORECASE)
+
+def _ends_statement(src: SqlSource) -> bool:
+    statements = src.statements
+    return bool(statements) and statements[-1].tokens[-1].value == ";"
+
+def iter_sql_batches(fp: Path, batch_bytes: int = STREAM_BATCH_BYTES):
+    """
+    Lee `fp` línea a línea (memoria acotada al lote) y entrega un SqlSource por lote, numerado
+    con sus líneas absolutas. Un lote se cierra en el primer GO tras acumular `batch_bytes`; sin GO,
+    al pasar 2x se cierra tras una sentencia terminada en ';' y al pasar 8x en cualquier línea.
+    Nunca corta dentro de un literal o comentario: si el lote lexado queda incompleto, sigue acumulando.
+    """
+    chunks = []
+    size = 0
+    first = 1
+    next_check = 2 * batch_bytes
+    with open(fp, "rb") as f:
+        for raw in f:
+            chunks.append(raw)
+            size += len(raw)
+            is_go = size >= batch_bytes and go_separator_pattern.match(raw) is not None
+            forced = size >= 8 * batch_bytes
+            if not is_go and (size < next_check or not (forced or raw.rstrip().endswith(b";"))):
                 continue
+            src = lex_sql(_decode_sql(b"".join(chunks)), first)
+            if not src.complete or not (is_go or forced or _ends_statement(src)):
+                if not is_go:
+                    next_check = size + size // 4
+                continue
+            yield src
+            first = src.first_line + src.line_count
+            chunks = []
+            size = 0
+            next_check = 2 * batch_bytes
+    if chunks:
+        yield lex_sql(_decode_sql(b"".join(chunks)), first)
 
-            for name in files:
-                if not name.lower().endswith(".sql"):
-                    continue
-                full = Path(walk_root, name).resolve()
-                rel_print = str(full)
+# -----------------------------
+# SQL embebido en otros archivos (paquetes SSIS, reportes RDL, literales de Python/C#)
+# -----------------------------
+class EmbeddedSql(NamedTuple):
+    text: str      # SQL del fragmento (saltos de línea normalizados a '\n')
+    line: int      # línea del archivo original donde empieza
+    col: int       # columna (1-based) donde empieza, en esa línea
+    exact: bool    # True: cada línea del fragmento es una línea física del archivo (line, line+1, ...);
+                   # False: el SQL venía codificado (&#xA;, '\n') y todos sus hallazgos van a `line`
 
-                # Tamaño máximo de archivo (MB)
-                try:
-                    max_mb = float(cfg.get('paths','max_file_size_mb', fallback='5'))
-                except Exception:
-                    max_mb = 5.0
-                size_mb = (full.stat().st_size / (1024*1024)) if full.exists() else 0
-                if size_mb > max_mb:
-                    # print(f"Se omite por tamaño ({size_mb:.2f} MB > {max_mb} MB): {rel_print}")
+EMBEDDED_READ_BYTES = 1024 * 1024
+# SSIS: atributo SqlStatementSource (Execute SQL Task) y <property name="SqlCommand"> (orígenes de
+# datos); RDL: <CommandText>. Se comparan sin prefijo de namespace y sin distinguir mayúsculas.
+XML_SQL_ATTRIBUTES = frozenset({"sqlstatementsource"})
+XML_SQL_ELEMENTS = frozenset({"commandtext"})
+XML_SQL_PROPERTIES = frozenset({"sqlstatementsource", "sqlcommand"})
+# un literal de código se audita solo si empieza como una sentencia SQL
+embedded_sql_start_pattern = re.compile(
+    r"\s*(?:SELECT|INSERT|UPDATE|DELETE|MERGE|EXEC(?:UTE)?|WITH|CREATE|ALTER|DROP|TRUNCATE|DECLARE)\b", re.IGNORECASE)
+
+def _local_name(name: str) -> str:
+    return name.rpartition(":")[2].lower()
+
+def extract_xml_sql(fp: Path):
+    """
+    Fragmentos SQL de un XML (.dtsx, .rdl) leído por bloques con expat: la memoria queda acotada
+    al bloque y al fragmento en curso, no al documento. El texto de un elemento conserva sus
+    líneas si no traía saltos codificados; un atributo (donde los saltos siempre vienen como
+    &#xA;) se ubica en la línea de su etiqueta. Lanza ValueError si el XML está mal formado.
+    """
+    found = []
+    stack = []   # por elemento abierto: [línea, columna, partes] si su texto es SQL, si no None
+    parser = expat.ParserCreate()
+
+    def start(name, attrs):
+        line, col = parser.CurrentLineNumber, parser.CurrentColumnNumber + 1
+        local = _local_name(name)
+        capture = None
+        if local in XML_SQL_ELEMENTS or (local == "property" and any(
+                _local_name(k) == "name" and v.lower() in XML_SQL_PROPERTIES for k, v in attrs.items())):
+            capture = [0, 0, []]
+        for k, v in attrs.items():
+            if _local_name(k) in XML_SQL_ATTRIBUTES and v.strip():
+                found.append(EmbeddedSql(_normalize_newlines(v), line, col, False))
+        stack.append(capture)
+
+    def chars(data):
+        capture = stack[-1] if stack else None
+        if capture is not None:
+            if not capture[2]:
+                capture[0], capture[1] = parser.CurrentLineNumber, parser.CurrentColumnNumber + 1
+            capture[2].append(data)
+
+    def end(name):
+        capture = stack.pop()
+        if capture is None or not capture[2]:
+            return
+        text = _normalize_newlines("".join(capture[2]))
+        # un texto que empieza con '=' es una expresión de RDL/SSIS, no SQL
+        if text.strip() and not text.lstrip().startswith("="):
+            exact = parser.CurrentLineNumber - capture[0] == text.count("\n")
+            found.append(EmbeddedSql(text, capture[0], capture[1], exact))
+
+    parser.StartElementHandler = start
+    parser.CharacterDataHandler = chars
+    parser.EndElementHandler = end
+    with open(fp, "rb") as f:
+        try:
+            for chunk in iter(partial(f.read, EMBEDDED_READ_BYTES), b""):
+                parser.Parse(chunk, False)
+                yield from found
+                found.clear()
+            parser.Parse(b"", True)
+        except expat.ExpatError as e:
+            raise ValueError(f"XML mal formado en {fp}: {e}") from None
+    yield from found
+
+def _python_literal(raw: str):
+    """
+    (valor, caracteres antes del contenido) de un literal de texto de Python, o None si es de bytes
+    o no se puede evaluar; los f-strings quedan con sus {expresiones} tal cual.
+    """
+    body = raw.lstrip("rRbBuUfF")
+    prefix = raw[:len(raw) - len(body)].lower()
+    q = 3 if body[:3] in ('"""', "'''") else 1
+    if "b" in prefix:
+        return None
+    if "f" in prefix:
+        return body[q:-q], len(prefix) + q
+    try:
+        return ast.literal_eval(raw), len(prefix) + q
+    except (ValueError, SyntaxError):
+        return None
+
+def _merge_literals(pieces: list):
+    """
+    Une literales consecutivos ("SELECT a " "FROM t", o con '+') en un fragmento. Mientras las
+    líneas sean exactas, un literal en otra línea se separa con saltos de línea y se rellena hasta
+    su columna, para que los hallazgos caigan en su línea y columna del archivo. None si no parece SQL.
+    """
+    text, line, col, end_line, exact = pieces[0]
+    for value, start, piece_col, end, piece_exact in pieces[1:]:
+        if exact and start > end_line:
+            text += "\n" * (start - end_line) + " " * (piece_col - 1)
+        text += value
+        exact = exact and piece_exact
+        end_line = end
+    if not embedded_sql_start_pattern.match(text):
+        return None
+    return EmbeddedSql(text, line, col, exact)
+
+# tokens entre literales que no cortan una concatenación
+_PY_JOINERS = {tokenize.NL, tokenize.COMMENT}
+_PY_STATEMENT_START = {tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.ENCODING}
+_PY_FSTRING_START = getattr(tokenize, "FSTRING_START", None)   # Python 3.12+
+_PY_FSTRING_END = getattr(tokenize, "FSTRING_END", None)
+
+def extract_python_sql(fp: Path):
+    """
+    Literales de texto de un .py que empiezan como SQL, leídos token a token con `tokenize`.
+    Los literales sueltos como sentencia (docstrings) no se auditan. Lanza ValueError si el
+    archivo no se puede tokenizar.
+    """
+    pieces = []           # (valor, línea inicial, columna, línea final, exacto)
+    statement = False     # el literal en curso es una sentencia por sí solo (docstring)
+    prev = tokenize.NEWLINE
+    fstring = None        # (partes, inicio, profundidad) de un f-string de 3.12+
+    with open(fp, "rb") as f:
+        try:
+            for tok in tokenize.tokenize(f.readline):
+                if fstring is not None:
+                    fstring[0].append(tok.string)
+                    if tok.type == _PY_FSTRING_START:
+                        fstring[2] += 1
+                    elif tok.type == _PY_FSTRING_END:
+                        fstring[2] -= 1
+                        if not fstring[2]:
+                            raw = "".join(fstring[0])
+                            tok = tok._replace(type=tokenize.STRING, string=raw, start=fstring[1])
+                            fstring = None
+                    if fstring is not None:
+                        continue
+                elif tok.type == _PY_FSTRING_START:
+                    fstring = [[tok.string], tok.start, 1]
+                    continue
+                if tok.type == tokenize.STRING:
+                    if not pieces:
+                        statement = prev in _PY_STATEMENT_START
+                    literal = _python_literal(tok.string)
+                    if literal is not None and isinstance(literal[0], str):
+                        value = _normalize_newlines(literal[0])
+                        exact = value.count("\n") == tok.end[0] - tok.start[0]
+                        pieces.append((value, tok.start[0], tok.start[1] + literal[1] + 1, tok.end[0], exact))
+                elif pieces and (tok.type in _PY_JOINERS or (tok.type == tokenize.OP and tok.string == "+")):
                     continue
+                elif pieces:
+                    frag = None if statement and tok.type == tokenize.NEWLINE else _merge_literals(pieces)
+                    if frag is not None:
+                        yield frag
+                    pieces = []
+                if tok.type not in _PY_JOINERS:
+                    prev = tok.type
+        except (tokenize.TokenError, SyntaxError) as e:
+            raise ValueError(f"No se pudo tokenizar {fp}: {e}") from None
+    if pieces:
+        frag = _merge_literals(pieces)
+        if frag is not None:
+            yield frag
+
+csharp_token_pattern = re.compile(r"""
+    //[^\n]*                                       # comentario de línea
+  | /\*.*?\*/                                      # comentario de bloque
+  | '(?:\\.|[^'\\\n])*'                            # carácter
+  | (?P<raw>\$*(?P<q>"{3,}).*?(?P=q))              # raw string (C# 11)
+  | (?P<verbatim>(?:\$@|@\$?)"(?:[^"]|"")*")       # verbatim @"..." (admite saltos de línea)
+  | (?P<regular>\$?"(?:\\.|[^"\\\n])*")            # "..." con escapes
+""", re.VERBOSE | re.DOTALL)
+_csharp_escape_pattern = re.compile(r"\\(u[0-9a-fA-F]{4}|.)")
+_CSHARP_ESCAPES = {"n": "\n", "r": "\r", "t": "\t", "0": "\0", "\\": "\\", '"': '"', "'": "'"}
+
+def _csharp_value(m: re.Match) -> tuple:
+    """(valor, caracteres antes del contenido) de un literal de texto de C#."""
+    if m.group("raw"):
+        raw = m.group("raw")
+        start = raw.index('"') + len(m.group("q"))
+        return raw[start:len(raw) - len(m.group("q"))], start
+    if m.group("verbatim"):
+        body = m.group("verbatim")
+        start = body.index('"') + 1
+        return body[start:-1].replace('""', '"'), start
+    body = m.group("regular")
+    start = body.index('"') + 1
+    return _csharp_escape_pattern.sub(
+        lambda e: chr(int(e.group(1)[1:], 16)) if len(e.group(1)) == 5 else _CSHARP_ESCAPES.get(e.group(1), e.group(1)),
+        body[start:-1]), start
+
+def extract_csharp_sql(fp: Path):
+    """
+    Literales de texto de un .cs que empiezan como SQL (normales, verbatim @"..." y raw de C# 11,
+    con o sin interpolación $; las {expresiones} quedan tal cual). Los unidos con '+' forman un
+    solo fragmento. El archivo se lee entero: el código fuente no llega a los tamaños de un .dtsx.
+    """
+    with open(fp, encoding="utf-8-sig") as f:
+        text = _normalize_newlines(f.read())
+    pieces = []
+    line, pos, gap_start = 1, 0, 0
+    for m in csharp_token_pattern.finditer(text):
+        line += text.count("\n", pos, m.start())
+        pos = m.start()
+        if m.group("raw") or m.group("verbatim") or m.group("regular"):
+            if pieces and text[gap_start:m.start()].strip() not in ("+", ""):
+                frag = _merge_literals(pieces)
+                if frag is not None:
+                    yield frag
+                pieces = []
+            value, offset = _csharp_value(m)
+            value = _normalize_newlines(value)
+            end_line = line + m.group().count("\n")
+            col = m.start() - text.rfind("\n", 0, m.start()) + offset
+            pieces.append((value, line, col, end_line, value.count("\n") == end_line - line))
+            gap_start = m.end()
+        elif pieces and text[gap_start:m.start()].strip() not in ("+", ""):
+            frag = _merge_literals(pieces)
+            if frag is not None:
+                yield frag
+            pieces = []
+    if pieces:
+        frag = _merge_literals(pieces)
+        if frag is not None:
+            yield frag
+
+# Extractores por extensión: fn(ruta) -> EmbeddedSql en orden de aparición. Para auditar otra
+# extensión basta con registrar aquí su extractor y agregarla a [embedded] extensions.
+EXTRACTORS = {
+    ".dtsx": extract_xml_sql,
+    ".rdl": extract_xml_sql,
+    ".py": extract_python_sql,
+    ".cs": extract_csharp_sql,
+}
+
+def audited_suffixes(cfg: configparser.ConfigParser) -> tuple:
+    """Extensiones a descubrir: .sql y las de [embedded] extensions que tienen extractor."""
+    out = [".sql"]
+    for t in cfg.get("embedded", "extensions", fallback="").replace(";", ",").split(","):
+        t = t.strip().lower()
+        t = t if not t or t.startswith(".") else "." + t
+        if t in EXTRACTORS and t not in out:
+            out.append(t)
+    return tuple(out)
+
+def _place_fragment(res: dict, frag: EmbeddedSql):
+    """Lleva in situ los hallazgos de un fragmento (lexado desde frag.line) a su posición en el archivo."""
+    shift = frag.col - 1
+    for key, items in res.items():
+        if items:
+            res[key] = [it._replace(line=it.line if frag.exact else frag.line,
+                                    col=it.col + shift if it.line == frag.line else it.col)
+                        for it in items]
+
+def _unreadable(res: dict, error: Exception) -> dict:
+    """Registra en `res` que el archivo no se pudo leer: hallazgo de archivo, en la línea 1."""
+    res.setdefault("unreadable_file", []).append(Finding(1, 1, str(error), ""))
+    return res
+
+def _until_unreadable(sources, res: dict):
+    """Las fuentes de `sources` hasta que leerlas falle; el error queda en `res` (ver _unreadable)."""
+    try:
+        yield from sources
+    except (OSError, ValueError) as e:   # ValueError: no es UTF-8 o el extractor no pudo leerlo
+        _unreadable(res, e)
+
+def audit_file(fp: Path, cfg: configparser.ConfigParser, special_chars_re: SpecialChars,
+               scanner: "LineScanner" = None, cache: "ResultCache" = None, scope: "DiffScope" = None,
+               profile: bool = False, metrics: bool = False):
+    """
+    Audita un archivo. Si supera [paths] max_file_size_mb se audita en streaming, lote a lote
+    (ver iter_sql_batches), y el resultado lo indica con "modo": "streaming".
+    Con `scope` (modo --diff) solo se conservan los hallazgos dentro de las líneas cambiadas;
+    en ese caso no se usa la caché, que guarda resultados completos.
+    Con `profile` el resultado trae además "perfil": tiempos de lectura, lexer, total y por regla.
+    Con `metrics` (telemetría de [log]) trae el mismo "perfil" sin la medición por regla.
+    Un archivo con extractor en EXTRACTORS (.dtsx, .rdl, .py, .cs) se audita fragmento a fragmento,
+    con "modo": "embebido" y los hallazgos en las líneas del archivo original.
+    El análisis corre dentro del presupuesto de [limits] (ver TimeBudget); un resultado con
+    reglas interrumpidas no se guarda en la caché.
+    Un archivo que no se puede leer (E/S, no es UTF-8, el extractor lo rechaza) no lanza: queda un
+    hallazgo unreadable_file, se conserva lo auditado antes del error y el resultado no se cachea.
+    """
+    t_start = time.perf_counter()
+    if scope is not None:
+        cache = None
+    if scanner is None:
+        scanner = LineScanner(cfg, special_chars_re)
+    extractor = EXTRACTORS.get(fp.suffix.lower())
+    try:
+        with open(fp, "rb") as f:
+            size = os.fstat(f.fileno()).st_size   # sobre el descriptor: sin otra búsqueda por ruta
+            streaming = size > max_file_bytes(cfg)
+            data = None if streaming or extractor is not None else f.read()
+    except OSError as e:
+        return _unreadable({"archivo": str(fp)}, e)
+    read_s = time.perf_counter() - t_start
+    if cache is not None:
+        kind = extractor.__name__ if extractor is not None else "sql"
+        key = cache.key(data, kind) if data is not None else cache.key_for_file(fp, kind)
+        cached = cache.get(key)
+        if cached is not None:
+            cached["archivo"] = str(fp)
+            if profile or metrics:
+                cached["perfil"] = {"bytes": size, "read_s": read_s, "lex_s": 0.0,
+                                    "total_s": time.perf_counter() - t_start, "cache": True, "rules": {}}
+            return cached
+
+    res = {"archivo": str(fp)}
+    timings = {} if profile else None
+    limits = analysis_limits(cfg)
+    budget = TimeBudget(*limits) if any(limits) else None
+    lex_s = 0.0
+    if extractor is not None:
+        res["modo"] = "embebido"
+        sources = _until_unreadable(((lex_sql(frag.text, frag.line), frag) for frag in extractor(fp)), res)
+    elif streaming:
+        res["modo"] = "streaming"
+        sources = _until_unreadable(((src, None) for src in iter_sql_batches(fp)), res)
+    else:
+        t0 = time.perf_counter()
+        try:
+            sources = ((lex_sql(_decode_sql(data)), None),)
+        except UnicodeDecodeError as e:
+            sources = ()
+            _unreadable(res, e)
+        lex_s = time.perf_counter() - t0
+    lazy = data is None
+    t0 = time.perf_counter()
+    for src, frag in sources:
+        if lazy and (profile or metrics):
+            # en streaming (y con extractor) la lectura y el lexer ocurren dentro del generador
+            lex_s += time.perf_counter() - t0
+        if lazy and budget is not None and budget.expired():
+            # sin presupuesto no tiene sentido seguir leyendo lotes
+            res.setdefault("analysis_timeout", []).append(_finding(
+                src, src.first_line, 1,
+                f"Presupuesto del archivo agotado ([limits] file_timeout_s): sin auditar desde la línea {src.first_line}"))
+            break
+        part = audit_source(src, cfg, scanner, timings, budget)
+        if frag is not None:
+            _place_fragment(part, frag)
+        if scope is not None:
+            restrict_to_changes(part, src, scope)
+        for rule_key, items in part.items():
+            res.setdefault(rule_key, []).extend(items)
+        t0 = time.perf_counter()
+
+    if cache is not None and not res.get("analysis_timeout") and not res.get("unreadable_file"):
+        cache.put(key, res)
+    if profile or metrics:
+        res["perfil"] = {"bytes": size, "read_s": read_s, "lex_s": lex_s,
+                         "total_s": time.perf_counter() - t_start, "cache": False, "rules": timings or {}}
+    return res
+
+# -----------------------------
+# Modo diff: solo archivos y líneas cambiadas (git local)
+# -----------------------------
+class DiffScope(NamedTuple):
+    lines: frozenset     # líneas agregadas/modificadas (numeración del archivo nuevo)
+    anchors: frozenset   # líneas junto a las que solo se borró código
+
+# Reglas cuyo hallazgo depende de la sentencia completa: se conservan si el cambio toca la sentencia
+STATEMENT_RESULT_KEYS = tuple(r.res_key for r in RULES if r.scope == "statement")
+FILE_RESULT_KEYS = tuple(r.res_key for r in RULES if r.scope == "file")
+RESULT_META_KEYS = ("archivo", "modo", "perfil")
+hunk_header_pattern = re.compile(r"@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+def _git(repo_root: Path, *args) -> str:
+    """Salida de `git args` en `repo_root`; RuntimeError si git falla."""
+    proc = subprocess.run(["git", "-c", "core.quotepath=off", "-C", str(repo_root), *args],
+                          capture_output=True, text=True, encoding="utf-8", errors="replace")
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip() or f"git {args[0]} terminó con código {proc.returncode}")
+    return proc.stdout
+
+def git_diff_audit_changes(repo_root: Path, spec: str, cfg: configparser.ConfigParser) -> list:
+    """
+    Archivos que definen lo que se exige (este script, audit_config.ini y special_chars_file) que
+    cambian en `spec`. Si hay alguno, un diff de solo los archivos cambiados no alcanza. El resto de
+    .github/audit/ (bench, logs) no cambia los hallazgos.
+    """
+    rel = cfg.get("paths", "special_chars_file", fallback=".github/audit/special_chars.txt").strip()
+    special = Path(rel) if Path(rel).is_absolute() else repo_root / rel
+    specs = [str(CFG_FIXED_PATH.parent / Path(__file__).name), str(CFG_FIXED_PATH)]
+    if special.resolve().is_relative_to(repo_root):
+        specs.append(str(special.resolve().relative_to(repo_root)))
+    out = _git(repo_root, "diff", "--name-only", "--no-color", "--no-ext-diff", spec, "--", *specs)
+    return [line for line in out.splitlines() if line]
+
+def git_diff_scopes(repo_root: Path, spec: str, suffixes: tuple = (".sql",)) -> dict:
+    """
+    Ejecuta `git diff spec` (p.ej. BASE..HEAD o BASE...HEAD) y devuelve {ruta absoluta: DiffScope}
+    de los archivos con esas extensiones agregados, modificados o renombrados. Lanza RuntimeError si git falla.
+    """
+    top = Path(_git(repo_root, "rev-parse", "--show-toplevel").strip())
+    out = _git(repo_root, "diff", "--unified=0", "--no-color", "--no-ext-diff", "--diff-filter=AMR",
+              "--src-prefix=a/", "--dst-prefix=b/", spec, "--", *(f":(icase)*{s}" for s in suffixes))
+
+    scopes = {}
+    cur = None; in_header = False
+    for line in out.splitlines():
+        if line.startswith("diff --git "):
+            cur = None; in_header = True
+        elif in_header and line.startswith("+++ "):
+            name = line[4:]
+            if name.startswith('"') and name.endswith('"'):
+                name = name[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+            if name.startswith("b/"):
+                cur = scopes.setdefault((top / name[2:]).resolve(), (set(), set()))
+        elif line.startswith("@@"):
+            in_header = False
+            m = hunk_header_pattern.match(line)
+            if m and cur is not None:
+                start = int(m.group(1)); count = int(m.group(2) or 1)
+                if count:
+                    cur[0].update(range(start, start + count))
+                else:
+                    cur[1].update((start, start + 1))
+    return {fp: DiffScope(frozenset(lines), frozenset(anchors)) for fp, (lines, anchors) in scopes.items()}
+
+def restrict_to_changes(res: dict, src: SqlSource, scope: DiffScope):
+    """
+    Filtra `res` in situ: reglas de línea por línea cambiada, reglas de sentencia por sentencia tocada;
+    las de archivo (analysis_timeout, unreadable_file) se conservan.
+    """
+    touched = scope.lines | scope.anchors
+    in_statement = set()
+    for st in src.statements:
+        span = range(st.start_line, st.end_line + 1)
+        if any(ln in span for ln in touched):
+            in_statement.update(span)
+    for key, items in res.items():
+        if key in RESULT_META_KEYS or key in FILE_RESULT_KEYS or not items:
+            continue
+        allowed = in_statement | scope.lines if key in STATEMENT_RESULT_KEYS else scope.lines
+        res[key] = [it for it in items if it.line in allowed]
+
+# -----------------------------
+# Caché de resultados (por contenido del archivo)
+# -----------------------------
+CACHE_FORMAT = "4"
+
+class ResultCache:
+    """
+    Resultados de audit_file en disco, uno por archivo JSON, con clave = hash del contenido +
+    huella de la ejecución (config parseada, patrón de special_chars, índice de funciones y fuente
+    de este script):
+    cualquier cambio en esas entradas invalida la caché sin borrarla. Las escrituras son atómicas
+    (archivo temporal + os.replace), así que varios workers pueden escribir a la vez.
+    """
+    __slots__ = ("directory", "fingerprint", "max_bytes")
+
+    def __init__(self, directory: Path, fingerprint: bytes, max_bytes: int):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+
+    def key(self, data: bytes, kind: str = "sql") -> str:
+        """
+        `kind` es cómo se audita el contenido ("sql" o el extractor de EXTRACTORS): los mismos bytes
+        en un .sql y en un .rdl dan resultados distintos.
+        """
+        return hashlib.sha256(self.fingerprint + kind.encode() + b"\0" + data).hexdigest()
+
+    def key_for_file(self, fp: Path, kind: str = "sql") -> str:
+        """Misma clave que key(), leyendo el archivo por bloques (archivos grandes)."""
+        h = hashlib.sha256(self.fingerprint + kind.encode() + b"\0")
+        with open(fp, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                res = json.load(f)
+            # los Finding se guardan como listas [línea, columna, mensaje, snippet]
+            res = {k: v if k in RESULT_META_KEYS else [Finding(*it) for it in v] for k, v in res.items()}
+        except (OSError, ValueError, TypeError):
+            return None
+        try:
+            os.utime(path)   # marca de uso reciente para el desalojo
+        except OSError:
+            pass
+        return res
+
+    def put(self, key: str, res: dict):
+        path = self._path(key)
+        tmp = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=".json")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({k: v for k, v in res.items() if k != "archivo"}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError:
+            # la caché es best-effort: un fallo de escritura no debe romper la auditoría
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def prune(self):
+        """Si la caché supera max_bytes, borra las entradas menos usadas hasta quedar en el 90%."""
+        entries = []
+        total = 0
+        try:
+            shards = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            for e in os.scandir(shard.path):
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+def open_result_cache(cfg: configparser.ConfigParser, repo_root: Path, special_chars_re: SpecialChars,
+                      udf_index: dict = None):
+    """
+    Caché configurada en [cache] (bajo [paths] logs_dir), o None si está deshabilitada.
+    Los hallazgos de las reglas de UDF dependen de `udf_index`: si cambia, cambia la huella.
+    """
+    if not cfg.getboolean("cache", "enabled", fallback=True):
+        return None
+    directory = _logs_dir(cfg, repo_root) / "cache"
+    try:
+        max_mb = float(cfg.get("cache", "max_size_mb", fallback="100"))
+    except ValueError:
+        max_mb = 100.0
+    h = hashlib.sha256()
+    h.update(CACHE_FORMAT.encode())
+    h.update(Path(__file__).read_bytes())
+    h.update(json.dumps({s: dict(cfg[s]) for s in cfg.sections()}, sort_keys=True).encode())
+    h.update(f"{special_chars_re.pattern}\0{special_chars_re.flags}".encode())
+    h.update(json.dumps(udf_index, sort_keys=True).encode())
+    return ResultCache(directory, h.digest(), int(max_mb * 1024 * 1024))
+
+# -----------------------------
+# Ejecución en paralelo (un proceso por worker; config y patrones se envían una sola vez)
+# -----------------------------
+_worker_state = {}
+
+def _init_worker(cfg: configparser.ConfigParser, special_chars_re: SpecialChars, cache, profile: bool = False,
+                 udf_index: dict = None, metrics: bool = False):
+    _worker_state["cfg"] = cfg
+    _worker_state["special_chars_re"] = special_chars_re
+    _worker_state["scanner"] = LineScanner(cfg, special_chars_re, udf_index)
+    _worker_state["cache"] = cache
+    _worker_state["profile"] = profile
+    _worker_state["metrics"] = metrics
+
+def _audit_in_worker(fp: Path, scope: DiffScope = None):
+    st = _worker_state
+    return audit_file(fp, st["cfg"], st["special_chars_re"], st["scanner"], st["cache"], scope, st["profile"], st["metrics"])
+
+def audit_files(files: list, cfg: configparser.ConfigParser, special_chars_re: SpecialChars, jobs: int = 1,
+                cache: ResultCache = None, scopes: dict = None, profile: bool = False, udf_index: dict = None,
+                metrics: bool = False):
+    """
+    Audita `files` y va entregando los resultados en el mismo orden de `files`, sin importar
+    cuántos workers se usen (la salida y el código de salida no dependen de --jobs).
+    `scopes` ({ruta: DiffScope}) limita los hallazgos a las líneas cambiadas (modo --diff).
+    `udf_index` es el índice de funciones del repo (ver build_function_index).
+    """
+    file_scopes = [scopes.get(fp) if scopes else None for fp in files]
+    if jobs <= 1 or len(files) <= 1:
+        scanner = LineScanner(cfg, special_chars_re, udf_index)
+        for fp, scope in zip(files, file_scopes):
+            yield audit_file(fp, cfg, special_chars_re, scanner, cache, scope, profile, metrics)
+        return
+    workers = min(jobs, len(files))
+    chunksize = max(1, len(files) // (workers * 8))
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(cfg, special_chars_re, cache, profile, udf_index, metrics))
+    try:
+        yield from pool.map(_audit_in_worker, files, file_scopes, chunksize=chunksize)
+    except GeneratorExit:
+        # quien consume cortó antes (--fail-fast): sin `with`, que esperaría a los lotes en curso
+        _stop_pool(pool)
+        raise
+    finally:
+        pool.shutdown(wait=True)   # tras _stop_pool no queda nada que esperar
+
+def _stop_pool(pool: ProcessPoolExecutor):
+    """
+    Cierra `pool` sin esperar a los archivos en curso: cancela los pendientes y termina los workers.
+    shutdown(wait=False) sola no alcanza: el hook de salida de concurrent.futures igual espera a
+    que cada worker termine su lote. Los procesos y el hilo que administra el pool se toman antes,
+    porque shutdown los suelta; se espera a ese hilo (ya sin workers termina enseguida) para que
+    cierre su tubería antes del hook de salida, que si no puede escribir en ella ya cerrada.
+    """
+    procs = list((pool._processes or {}).values())
+    manager = pool._executor_manager_thread
+    pool.shutdown(wait=False, cancel_futures=True)
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        proc.join()
+    if manager is not None:
+        manager.join()
+
+# -----------------------------
+# Perfilado (--profile)
+# -----------------------------
+class RunProfile:
+    """
+    Junta el "perfil" de cada resultado de audit_file: totales por regla (segundos, hallazgos,
+    archivos) y la lista de archivos con sus tiempos. Al final imprime los rankings y puede
+    escribir todo a JSON.
+    """
+    __slots__ = ("rules", "files", "started")
+
+    def __init__(self):
+        self.rules = {}
+        self.files = []
+        self.started = time.perf_counter()
+
+    def add(self, archivo: str, perfil: dict):
+        for key, (seconds, matches) in perfil["rules"].items():
+            r = self.rules.setdefault(key, [0.0, 0, 0])
+            r[0] += seconds
+            r[1] += matches
+            r[2] += 1
+        self.files.append(dict(perfil, archivo=archivo))
+
+    def to_dict(self) -> dict:
+        return {
+            "wall_s": time.perf_counter() - self.started,
+            "files": len(self.files),
+            "bytes": sum(f["bytes"] for f in self.files),
+            "rules": {k: {"seconds": s, "matches": n, "files": f}
+                      for k, (s, n, f) in sorted(self.rules.items(), key=lambda kv: -kv[1][0])},
+            "per_file": sorted(self.files, key=lambda f: -f["total_s"]),
+        }
+
+    def print_report(self, top: int = 10):
+        data = self.to_dict()
+        rule_total = sum(r["seconds"] for r in data["rules"].values()) or 1e-9
+        mb = data["bytes"] / (1024 * 1024)
+        print(f"\n==== Perfil (--profile): {data['files']} archivo(s), {mb:.2f} MB en {data['wall_s']:.2f}s ====")
+        print("   (las reglas por línea se miden una a una, sin el escáner fusionado: el perfil es más lento que una ejecución normal)")
+        print("\nReglas más costosas:")
+        print(f"   {'regla':<36} {'seg':>9} {'%':>6} {'hallazgos':>10} {'archivos':>9}")
+        for key, r in data["rules"].items():
+            print(f"   {key:<36} {r['seconds']:>9.3f} {100 * r['seconds'] / rule_total:>5.1f}% {r['matches']:>10} {r['files']:>9}")
+        print(f"\nArchivos más lentos (top {top}):")
+        print(f"   {'total s':>9} {'lectura':>9} {'lexer':>9}  {'KB':>9}  regla más costosa / archivo")
+        for f in data["per_file"][:top]:
+            hot = max(f["rules"].items(), key=lambda kv: kv[1][0], default=None)
+            hot_txt = "caché" if f["cache"] else (f"{hot[0]} {hot[1][0]:.3f}s" if hot else "-")
+            print(f"   {f['total_s']:>9.3f} {f['read_s']:>9.3f} {f['lex_s']:>9.3f}  {f['bytes'] / 1024:>9.1f}  {hot_txt}")
+            print(f"      {f['archivo']}")
+
+    def write_json(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+# -----------------------------
+# Telemetría de ejecución ([log])
+# -----------------------------
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+RUN_LOG_FILE = "audit_runs.jsonl"
+METRICS_FILE = "audit_metrics.prom"
+
+def _log_option(cfg: configparser.ConfigParser, key: str, fallback: str) -> str:
+    # los valores de [log] admiten un comentario al final ("level = INFO   # DEBUG | INFO | ...")
+    return cfg.get("log", key, fallback=fallback).split("#", 1)[0].strip()
+
+def telemetry_enabled(cfg: configparser.ConfigParser) -> bool:
+    return _log_option(cfg, "enabled", "false").lower() in ("1", "yes", "true", "on")
+
+def peak_rss_bytes():
+    """Pico de memoria residente del proceso y de sus workers ya terminados; None si no se puede medir."""
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024   # ru_maxrss: bytes en macOS, KiB en Linux
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+
+def _atomic_write(path: Path, text: str):
+    """Escribe `text` en `path` vía archivo temporal + os.replace (nadie lee un archivo a medias)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=path.suffix)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def _prom_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels.items()) + "}"
+
+class RunTelemetry:
+    """
+    Métricas de una ejecución con [log] enabled: archivos descubiertos/auditados/omitidos, bytes,
+    tiempos por fase, hallazgos por regla y pico de RSS. Al terminar agrega un registro JSON a
+    <logs_dir>/audit_runs.jsonl y reescribe <logs_dir>/audit_metrics.prom (formato textfile de
+    Prometheus, p.ej. para el textfile collector de node_exporter).
+    `level` filtra el registro por la severidad de la ejecución: INFO registra todas, WARNING solo
+    las que tuvieron warnings u omitidos, ERROR solo las que fallaron; DEBUG además guarda el
+    detalle por archivo. El archivo de métricas se escribe siempre (es el último valor, no un historial).
+    """
+    __slots__ = ("cfg", "repo_root", "level", "also_console", "started", "phases", "discovered", "skipped",
+                 "files", "cached", "bytes", "read_s", "analysis_s", "findings", "detail")
+
+    def __init__(self, cfg: configparser.ConfigParser, repo_root: Path):
+        self.cfg = cfg
+        self.repo_root = repo_root
+        level = _log_option(cfg, "level", "INFO").upper()
+        self.level = level if level in LOG_LEVELS else "INFO"
+        self.also_console = _log_option(cfg, "also_console", "true").lower() in ("1", "yes", "true", "on")
+        self.started = time.perf_counter()
+        self.phases = {}        # fase -> segundos de reloj
+        self.discovered = 0
+        self.skipped = 0
+        self.files = 0
+        self.cached = 0
+        self.bytes = 0
+        self.read_s = 0.0       # sumas por archivo: con --jobs superan al reloj
+        self.analysis_s = 0.0
+        self.findings = {}      # regla -> [severidad, hallazgos]
+        self.detail = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - t0
+
+    def add(self, res: dict, perfil: dict):
+        """Suma un resultado de audit_file (con su "perfil", ver audit_file(metrics=True))."""
+        self.files += 1
+        self.cached += perfil["cache"]
+        self.bytes += perfil["bytes"]
+        self.read_s += perfil["read_s"]
+        self.analysis_s += perfil["total_s"] - perfil["read_s"]
+        n = 0
+        for rule_key, s, _, items in _reported(res, self.cfg):
+            self.findings.setdefault(rule_key, [s, 0])[1] += len(items)
+            n += len(items)
+        if self.level == "DEBUG":
+            self.detail.append({"file": _report_path(res["archivo"], self.repo_root), "bytes": perfil["bytes"],
+                                "read_s": perfil["read_s"], "total_s": perfil["total_s"], "cache": perfil["cache"],
+                                "findings": n})
+
+    def record(self, failed: bool, context: dict) -> dict:
+        wall = time.perf_counter() - self.started
+        severities = {s for s, _ in self.findings.values()}
+        level = "ERROR" if failed else ("WARNING" if "warning" in severities or self.skipped else "INFO")
+        rec = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "level": level,
+            **context,
+            "files": {"discovered": self.discovered, "audited": self.files, "skipped": self.skipped,
+                      "cached": self.cached},
+            "bytes": self.bytes,
+            "seconds": {"total": wall, **self.phases, "read": self.read_s, "analysis": self.analysis_s},
+            "throughput_bytes_s": self.bytes / wall if wall > 0 else 0.0,
+            "findings": {k: {"severity": s, "count": n} for k, (s, n) in sorted(self.findings.items())},
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+        if self.level == "DEBUG":
+            rec["per_file"] = self.detail
+        return rec
+
+    def prometheus(self, rec: dict) -> str:
+        out = []
+        def metric(name, help_text, samples):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} gauge")
+            out.extend(f"{name}{_prom_labels(labels)} {value}" for labels, value in samples)
+        metric("sql_audit_last_run_timestamp_seconds", "Fin de la última auditoría (epoch).", [({}, time.time())])
+        metric("sql_audit_duration_seconds", "Duración total de la auditoría.", [({}, rec["seconds"]["total"])])
+        metric("sql_audit_phase_seconds", "Segundos por fase (read/analysis: suma por archivo).",
+               [({"phase": k}, v) for k, v in rec["seconds"].items() if k != "total"])
+        metric("sql_audit_files", "Archivos .sql por estado.", [({"state": k}, v) for k, v in rec["files"].items()])
+        metric("sql_audit_bytes_processed", "Bytes de .sql auditados.", [({}, rec["bytes"])])
+        metric("sql_audit_throughput_bytes_per_second", "Bytes auditados por segundo de reloj.",
+               [({}, rec["throughput_bytes_s"])])
+        metric("sql_audit_findings", "Hallazgos reportados por regla.",
+               [({"rule": k, "severity": f["severity"]}, f["count"]) for k, f in rec["findings"].items()])
+        if rec["peak_rss_bytes"] is not None:
+            metric("sql_audit_peak_rss_bytes", "Pico de memoria residente (proceso y workers).",
+                   [({}, rec["peak_rss_bytes"])])
+        metric("sql_audit_failed", "1 si la auditoría terminó con errores.", [({}, int(rec["level"] == "ERROR"))])
+        return "\n".join(out) + "\n"
+
+    def write(self, failed: bool, context: dict):
+        """Escribe el registro (si su nivel alcanza `level`) y el archivo de métricas."""
+        rec = self.record(failed, context)
+        logs_dir = _logs_dir(self.cfg, self.repo_root)
+        log_path = logs_dir / RUN_LOG_FILE
+        logged = LOG_LEVELS.index(rec["level"]) >= LOG_LEVELS.index(self.level)
+        try:
+            if logged:
+                logs_dir.mkdir(parents=True, exist_ok=True)
+                with open(log_path, "a", encoding="utf-8", newline="\n") as f:
+                    f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            _atomic_write(logs_dir / METRICS_FILE, self.prometheus(rec))
+        except OSError as e:
+            print(f"⚠️  No se pudo escribir la telemetría en {logs_dir}: {e}")
+            return
+        if self.also_console:
+            mb = rec["bytes"] / (1024 * 1024)
+            rss = rec["peak_rss_bytes"]
+            print(f"\n📈 Telemetría: {rec['files']['audited']} archivo(s) ({rec['files']['cached']} de caché, "
+                  f"{rec['files']['skipped']} omitidos), {mb:.2f} MB en {rec['seconds']['total']:.2f}s "
+                  f"({rec['throughput_bytes_s'] / (1024 * 1024):.2f} MB/s)"
+                  + (f", pico RSS {rss / (1024 * 1024):.1f} MB" if rss is not None else "")
+                  + (f"\n   Registro: {log_path}" if logged else "") + f"\n   Métricas: {logs_dir / METRICS_FILE}")
+
+def _phase(telemetry: "RunTelemetry", name: str):
+    return telemetry.phase(name) if telemetry is not None else contextlib.nullcontext()
+
+# -----------------------------
+# Salida: un renderer por formato (console | jsonl | sarif)
+# -----------------------------
+def _reported(res: dict, cfg: configparser.ConfigParser):
+    """(clave de regla, severidad, título, hallazgos) de las reglas no 'off' que tienen hallazgos."""
+    for rule in RULES:
+        items = res.get(rule.res_key)
+        if items:
+            s = sev(cfg, rule.key)
+            if s != "off":
+                yield rule.key, s, rule.title, items
+
+def _report_path(archivo: str, repo_root: Path) -> str:
+    """Ruta del archivo relativa a la raíz del repo (con '/'), o absoluta si queda fuera."""
+    p = Path(archivo)
+    try:
+        return p.relative_to(repo_root).as_posix()
+    except ValueError:
+        return p.as_posix()
+
+def finding_records(res: dict, cfg: configparser.ConfigParser, path: str):
+    """Hallazgos reportables de un resultado como dicts planos (formato jsonl y respuestas del daemon)."""
+    for rule_key, s, _, items in _reported(res, cfg):
+        for it in items:
+            yield {"rule": rule_key, "severity": s, "file": path, "line": it.line,
+                   "column": it.col, "message": it.message, "snippet": it.snippet}
+
+def has_error(res: dict, cfg: configparser.ConfigParser) -> bool:
+    return any(s == "error" for _, s, _, _ in _reported(res, cfg))
+
+class ConsoleReport:
+    """Reporte humano de siempre. Cada archivo se arma completo y se escribe con una sola llamada."""
+    __slots__ = ("cfg", "out")
+
+    def __init__(self, cfg: configparser.ConfigParser, out, repo_root: Path = None):
+        self.cfg = cfg
+        self.out = out
+
+    def file(self, res: dict) -> bool:
+        """Escribe los hallazgos de un archivo; devuelve True si alguno tiene severidad 'error'."""
+        parts = [f"\n--- Archivo: {res['archivo']} ---"]
+        if res.get("modo") == "streaming":
+            parts.append("   (archivo grande: auditado en streaming, lote a lote)")
+        elif res.get("modo") == "embebido":
+            parts.append("   (SQL embebido: fragmentos extraídos del archivo, en sus líneas originales)")
+        if not any(res.get(r.res_key) for r in RULES):
+            parts.append("   (sin hallazgos)")
+        any_issue_as_error = False
+        for rule_key, s, title, items in _reported(res, self.cfg):
+            parts.append(f"\n{badge(s)} [{rule_key}] {title} ({len(items)}):")
+            parts.extend(f"   Línea {it.line}: {it.message}" for it in items)
+            any_issue_as_error |= s == "error"
+        parts.append("")
+        self.out.write("\n".join(parts))
+        return any_issue_as_error
+
+    def close(self):
+        self.out.flush()
+
+class JsonlReport:
+    """Un objeto JSON por hallazgo y por línea: regla, severidad, archivo, línea, columna, mensaje, snippet."""
+    __slots__ = ("cfg", "out", "repo_root")
+
+    def __init__(self, cfg: configparser.ConfigParser, out, repo_root: Path):
+        self.cfg = cfg
+        self.out = out
+        self.repo_root = repo_root
+
+    def file(self, res: dict) -> bool:
+        path = _report_path(res["archivo"], self.repo_root)
+        lines = [json.dumps(rec, ensure_ascii=False) for rec in finding_records(res, self.cfg, path)]
+        if lines:
+            lines.append("")
+            self.out.write("\n".join(lines))
+        return has_error(res, self.cfg)
+
+    def close(self):
+        self.out.flush()
+
+SARIF_LEVELS = {"error": "error", "warning": "warning"}
+
+class SarifReport:
+    """
+    SARIF 2.1.0 escrito en streaming: el encabezado (herramienta y reglas) al abrir, cada
+    resultado al terminar su archivo y el cierre del documento en close().
+    """
+    __slots__ = ("cfg", "out", "repo_root", "first")
+
+    def __init__(self, cfg: configparser.ConfigParser, out, repo_root: Path):
+        self.cfg = cfg
+        self.out = out
+        self.repo_root = repo_root
+        self.first = True
+        rules = [{"id": r.key, "shortDescription": {"text": r.title.rstrip(":")},
+                  "defaultConfiguration": {"level": SARIF_LEVELS.get(sev(cfg, r.key), "none")}}
+                 for r in RULES]
+        run = {"tool": {"driver": {"name": "audit_sql_standards", "rules": rules}},
+               "originalUriBaseIds": {"SRCROOT": {"uri": repo_root.as_uri() + "/"}},
+               "columnKind": "unicodeCodePoints"}
+        head = json.dumps({"$schema": "https://json.schemastore.org/sarif-2.1.0.json", "version": "2.1.0",
+                           "runs": [run]}, ensure_ascii=False)
+        # se abre el arreglo de resultados dentro del único run: '...}]}' -> '..., "results": ['
+        out.write(head[:-3] + ', "results": [\n')
+
+    def file(self, res: dict) -> bool:
+        path = _report_path(res["archivo"], self.repo_root)
+        location = {"uri": path, "uriBaseId": "SRCROOT"} if not Path(path).is_absolute() else {"uri": Path(path).as_uri()}
+        any_issue_as_error = False
+        chunks = []
+        for rule_key, s, _, items in _reported(res, self.cfg):
+            any_issue_as_error |= s == "error"
+            for it in items:
+                chunks.append(json.dumps({
+                    "ruleId": rule_key, "level": SARIF_LEVELS[s], "message": {"text": it.message},
+                    "locations": [{"physicalLocation": {
+                        "artifactLocation": location,
+                        "region": {"startLine": it.line, "startColumn": it.col, "snippet": {"text": it.snippet}},
+                    }}],
+                }, ensure_ascii=False))
+        if chunks:
+            self.out.write(("" if self.first else ",\n") + ",\n".join(chunks))
+            self.first = False
+        return any_issue_as_error
+
+    def close(self):
+        self.out.write("\n]}]}\n")
+        self.out.flush()
+
+REPORTERS = {"console": ConsoleReport, "jsonl": JsonlReport, "sarif": SarifReport}
+
+# -----------------------------
+# Descubrimiento de archivos
+# -----------------------------
+IGNORED_DIR_NAMES = frozenset({".github", ".config", ".git"})
+
+def _glob_regex(pat: str) -> str:
+    """Glob estilo .gitignore -> regex: '*' y '?' no cruzan '/', '**' sí."""
+    out = []
+    i, n = 0, len(pat)
+    while i < n:
+        if pat.startswith("**/", i):
+            out.append("(?:.*/)?"); i += 3
+        elif pat.startswith("**", i):
+            out.append(".*"); i += 2
+        elif pat[i] == "*":
+            out.append("[^/]*"); i += 1
+        elif pat[i] == "?":
+            out.append("[^/]"); i += 1
+        elif pat[i] == "[" and pat.find("]", i + 2) > 0:
+            j = pat.find("]", i + 2)
+            body = pat[i + 1:j]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append("[" + body.replace("\\", "\\\\") + "]"); i = j + 1
+        else:
+            out.append(re.escape(pat[i])); i += 1
+    return "".join(out)
+
+def _ignore_rule(line: str, base: str):
+    """Una línea de .gitignore (o de [paths] exclude) -> (base, regex, negada, solo_dirs, anclada) o None."""
+    line = line.rstrip("\r\n")
+    if not line.strip() or line.startswith("#"):
+        return None
+    line = line.rstrip()
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    if line.startswith("\\"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    anchored = "/" in line
+    line = line.lstrip("/")
+    if not line:
+        return None
+    return (base, re.compile(_glob_regex(line)), negate, dir_only, anchored)
+
+class PathFilter:
+    """
+    Rutas que quedan fuera del descubrimiento: directorios .github, .config y .git en cualquier nivel,
+    los globs de [paths] exclude y, con [paths] respect_gitignore, los .gitignore del repo (subconjunto
+    de la sintaxis de git: comentarios, '!', '/' inicial o intermedio = anclado a su directorio,
+    '/' final = solo directorios, *, ?, [...] y **). Todo se evalúa relativo a la raíz del repo.
+    Un '!' de un .gitignore no rescata lo que excluye [paths] exclude: son dos listas independientes.
+    """
+    __slots__ = ("repo_root", "use_gitignore", "exclude_rules", "suffixes", "_dir_rules", "_dir_verdicts")
+
+    def __init__(self, cfg: configparser.ConfigParser, repo_root: Path, use_gitignore: bool = None):
+        self.repo_root = repo_root
+        self.suffixes = audited_suffixes(cfg)
+        if use_gitignore is None:
+            use_gitignore = cfg.getboolean("paths", "respect_gitignore", fallback=True)
+        self.use_gitignore = use_gitignore
+        raw = cfg.get("paths", "exclude", fallback="")
+        self.exclude_rules = [r for r in (_ignore_rule(t.strip(), "") for t in raw.replace(";", ",").split(",")) if r]
+        self._dir_rules = {}
+        self._dir_verdicts = {}
+
+    def audited_name(self, name: str) -> bool:
+        """True si un archivo con ese nombre se audita: .sql o una extensión de [embedded]."""
+        return name.lower().endswith(self.suffixes)
+
+    def _rel(self, path: Path):
+        try:
+            return path.relative_to(self.repo_root).as_posix()
+        except ValueError:
+            return None
+
+    def rules_for(self, directory: Path, names=None) -> list:
+        """Reglas de .gitignore vigentes para las entradas de `directory` (las de sus padres + la suya)."""
+        key = str(directory)
+        rules = self._dir_rules.get(key)
+        if rules is not None:
+            return rules
+        rel = self._rel(directory)
+        if rel is None or rel == ".":
+            rules = []
+            if rel is None:
+                self._dir_rules[key] = rules
+                return rules
+        else:
+            rules = self.rules_for(directory.parent)
+        if self.use_gitignore and (".gitignore" in names if names is not None else (directory / ".gitignore").is_file()):
+            base = "" if rel == "." else rel
+            try:
+                with open(directory / ".gitignore", encoding="utf-8", errors="replace") as f:
+                    own = [r for r in (_ignore_rule(ln, base) for ln in f) if r]
+            except OSError:
+                own = []
+            if own:
+                rules = rules + own
+        self._dir_rules[key] = rules
+        return rules
+
+    def ignores(self, path: Path, is_dir: bool, rules: list) -> bool:
+        """¿Se excluye esta entrada, dadas las reglas .gitignore de su directorio? (no mira a los padres)"""
+        if is_dir and path.name in IGNORED_DIR_NAMES:
+            return True
+        if not self.exclude_rules and not rules:
+            return False
+        rel = self._rel(path)
+        return (self._matches(self.exclude_rules, rel, path.name, is_dir)
+                or self._matches(rules, rel, path.name, is_dir))
+
+    @staticmethod
+    def _matches(rules: list, rel, name: str, is_dir: bool) -> bool:
+        """Última regla que coincide gana (como git); '!' la niega."""
+        ignored = False
+        for base, rx, negate, dir_only, anchored in rules:
+            if dir_only and not is_dir:
+                continue
+            if anchored:
+                if rel is None:
+                    continue
+                if base:
+                    if not rel.startswith(base + "/"):
+                        continue
+                    sub = rel[len(base) + 1:]
+                else:
+                    sub = rel
+                hit = rx.fullmatch(sub)
+            else:
+                hit = rx.fullmatch(name)
+            if hit:
+                ignored = not negate
+        return ignored
+
+    def excluded(self, path: Path, is_dir: bool = False) -> bool:
+        """Comprobación completa de una ruta suelta (--diff, --watch): la entrada y todos sus padres."""
+        parent = path.parent
+        # se sube hasta la raíz del repo (o hasta '/' si la ruta queda fuera de él)
+        if parent != path and self._rel(parent) != ".":
+            key = str(parent)
+            verdict = self._dir_verdicts.get(key)
+            if verdict is None:
+                verdict = self._dir_verdicts[key] = self.excluded(parent, True)
+            if verdict:
+                return True
+        return self.ignores(path, is_dir, self.rules_for(parent))
+
+def walk_sql_files(root: Path, pfilter: PathFilter):
+    """
+    (ruta, stat) de cada .sql (o extensión de [embedded]) bajo `root`. Los directorios excluidos se podan antes de entrar
+    (no se listan) y cada archivo se consulta una sola vez.
+    """
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            with os.scandir(d) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        rules = pfilter.rules_for(d, {e.name for e in entries} if pfilter.use_gitignore else None)
+        for e in entries:
+            try:
+                if e.is_dir(follow_symlinks=False):
+                    p = Path(e.path)
+                    if not pfilter.ignores(p, True, rules):
+                        stack.append(p)
+                    continue
+                if not pfilter.audited_name(e.name):
+                    continue
+                p = Path(e.path)
+                if pfilter.ignores(p, False, rules):
+                    continue
+                st = e.stat()
+            except OSError:
+                continue
+            if S_ISREG(st.st_mode):
+                yield p, st
+
+def git_sql_files(repo_root: Path, suffixes: tuple = (".sql",)):
+    """
+    Archivos con esas extensiones versionados o nuevos no ignorados según git (índice + .gitignore),
+    o None si git no responde.
+    """
+    try:
+        proc = subprocess.run(["git", "-C", str(repo_root), "ls-files", "-z", "--cached", "--others",
+                               "--exclude-standard", "--", *(f":(icase)*{s}" for s in suffixes)],
+                              capture_output=True)
+    except OSError:
+        return None
+    if proc.returncode != 0:
+        return None
+    return [repo_root / os.fsdecode(p) for p in proc.stdout.split(b"\0") if p]
+
+def _git_listed(listed: list, root_dir: Path, pfilter: PathFilter):
+    for p in listed:
+        if not p.is_relative_to(root_dir) or pfilter.excluded(p):
+            continue
+        try:
+            st = p.stat()
+        except OSError:
+            continue   # versionado pero borrado del working tree
+        if S_ISREG(st.st_mode):
+            yield p, st
+
+def discovery_mode(cfg: configparser.ConfigParser) -> str:
+    mode = cfg.get("paths", "discovery", fallback="walk").strip().lower()
+    return mode if mode in ("walk", "git") else "walk"
+
+def _exceeds_size_limit(full: Path, size: int, max_bytes: int, skip: bool, quiet: bool = False) -> bool:
+    """True si el archivo se omite por tamaño ([paths] large_files = skip); lo informa en consola."""
+    if size <= max_bytes or not skip:
+        return False
+    if not quiet:
+        print(f"⚠️  Se omite por tamaño ({size / (1024*1024):.2f} MB > {max_bytes / (1024*1024):g} MB): {full}")
+    return True
+
+def collect_sql_files(roots: list, cfg: configparser.ConfigParser, repo_root: Path = None, mode: str = None,
+                      quiet: bool = False, skipped: list = None):
+    """
+    Devuelve (archivos .sql y de [embedded] a auditar ordenados por ruta, si hubo algún origen válido).
+    `mode` ([paths] discovery): "walk" recorre el disco; "git" lista desde el índice de git
+    (con vuelta a "walk" si git no está disponible). Un archivo alcanzable desde varios
+    orígenes (solapados o por symlink) se audita una sola vez. `quiet` omite los avisos.
+    Los omitidos por tamaño se agregan a `skipped`, si se pasa.
+    """
+    repo_root = repo_root or Path.cwd().resolve()
+    mode = mode or discovery_mode(cfg)
+    listed = None
+    if mode == "git":
+        listed = git_sql_files(repo_root, audited_suffixes(cfg))
+        if listed is None and not quiet:
+            print("⚠️  No se pudo listar con git (¿no es un repo?); se recorre el disco.")
+    # con git, .gitignore ya lo aplicó `git ls-files`
+    pfilter = PathFilter(cfg, repo_root, use_gitignore=False if listed is not None else None)
+    max_bytes = max_file_bytes(cfg)
+    skip = skip_large_files(cfg)
+    candidates = []
+    audited_any = False
+    for root_dir in roots:
+        root_dir = root_dir.resolve()
+        if not root_dir.exists() or not root_dir.is_dir():
+            if not quiet:
+                print(f"⚠️  Origen no válido (se omite): {root_dir}")
+            continue
+
+        audited_any = True
+        if root_dir != repo_root and pfilter.excluded(root_dir, True):
+            continue
+        if listed is not None and root_dir.is_relative_to(repo_root):
+            candidates.extend(_git_listed(listed, root_dir, pfilter))
+        else:
+            candidates.extend(walk_sql_files(root_dir, pfilter))
+
+    # Orden estable: la salida no depende del orden del recorrido ni del número de workers;
+    # entre rutas al mismo archivo (orígenes solapados, symlinks) queda la primera en ese orden
+    candidates.sort(key=lambda c: str(c[0]))
+    found = []
+    seen = set()
+    for full, st in candidates:
+        ident = (st.st_dev, st.st_ino) if st.st_ino else str(full)
+        if ident in seen:
+            continue
+        seen.add(ident)
+        if _exceeds_size_limit(full, st.st_size, max_bytes, skip, quiet):
+            if skipped is not None:
+                skipped.append(full)
+            continue
+        found.append(full)
+    return found, audited_any
+
+def select_diff_files(scopes: dict, roots: list, cfg: configparser.ConfigParser, repo_root: Path = None,
+                      skipped: list = None) -> list:
+    """
+    De los .sql cambiados, los que caen bajo algún origen y pasarían los mismos filtros que el recorrido.
+    Los omitidos por tamaño se agregan a `skipped`, si se pasa.
+    """
+    pfilter = PathFilter(cfg, repo_root or Path.cwd().resolve())
+    max_bytes = max_file_bytes(cfg)
+    skip = skip_large_files(cfg)
+    found = []
+    for full in sorted(scopes, key=str):
+        if not pfilter.audited_name(full.name):
+            continue
+        if not any(full.is_relative_to(r) for r in roots if r.is_dir()):
+            continue
+        if pfilter.excluded(full):
+            continue
+        try:
+            st = full.stat()
+        except OSError:
+            continue
+        if not S_ISREG(st.st_mode):
+            continue
+        if _exceeds_size_limit(full, st.st_size, max_bytes, skip):
+            if skipped is not None:
+                skipped.append(full)
+            continue
+        found.append(full)
+    return found
+
+# -----------------------------
+# Modo watch: daemon local con config, patrones y resultados en memoria
+# -----------------------------
+class Inotify:
+    """inotify de Linux vía ctypes (sin dependencias). El constructor lanza OSError si no está disponible."""
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                  | IN_DELETE_SELF | IN_MOVE_SELF)
+    _event = struct.Struct("iIII")
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify solo existe en Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+        self.dirs = {}   # wd -> directorio
+
+    def add_tree(self, root: Path, pfilter: "PathFilter"):
+        """Vigila `root` y sus subdirectorios, salvo los que excluye `pfilter`."""
+        for walk_root, dirnames, _ in os.walk(root):
+            here = Path(walk_root)
+            rules = pfilter.rules_for(here)
+            dirnames[:] = [d for d in dirnames if not pfilter.ignores(here / d, True, rules)]
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(walk_root), self.WATCH_MASK)
+            if wd >= 0:
+                self.dirs[wd] = here
+
+    def read(self):
+        """Eventos pendientes como (ruta, máscara); ruta None si la cola del kernel se desbordó."""
+        try:
+            buf = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + self._event.size <= len(buf):
+            wd, mask, _, n = self._event.unpack_from(buf, pos)
+            name = buf[pos + self._event.size:pos + self._event.size + n].rstrip(b"\0")
+            pos += self._event.size + n
+            if mask & self.IN_Q_OVERFLOW:
+                events.append((None, mask))
+                continue
+            base = self.dirs.get(wd)
+            if base is None:
+                continue
+            if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF) and not name:
+                self.dirs.pop(wd, None)
+            events.append((base / os.fsdecode(name) if name else base, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class AuditDaemon:
+    """
+    Estado de --watch: config, patrones, escáner y último resultado de cada .sql bajo sql_roots.
+    Reaudita solo los archivos cuyo (mtime, tamaño) cambió, recarga todo si cambian audit_config.ini
+    o el archivo de caracteres especiales, y responde consultas por un socket Unix (JSON por línea).
+    Si un cambio altera el índice de funciones del repo, reaudita todos los archivos.
+    """
+    __slots__ = ("args", "repo_root", "report_out", "cfg", "roots", "special_chars_re", "udf_index", "scanner", "cache",
+                 "pfilter", "reporter", "results", "stamps", "config_stamp", "inotify", "selector", "server", "pending")
+
+    def __init__(self, args: argparse.Namespace, repo_root: Path, report_out):
+        self.args = args
+        self.repo_root = repo_root
+        self.report_out = report_out
+        self.results = {}   # ruta -> resultado de audit_file
+        self.stamps = {}    # ruta -> (mtime_ns, tamaño) con que se auditó
+        self.inotify = None
+        self.server = None
+        self.pending = set()
+        self.selector = selectors.DefaultSelector()
+
+    # ---- configuración
+    def _config_files(self) -> list:
+        rel = self.cfg.get("paths", "special_chars_file", fallback=".github/audit/special_chars.txt").strip()
+        special = Path(rel) if Path(rel).is_absolute() else self.repo_root / rel
+        return [self.repo_root / CFG_FIXED_PATH, special]
+
+    def _config_stamp(self) -> tuple:
+        return tuple(_file_stamp(p) for p in self._config_files())
+
+    def load(self):
+        """Carga la config; ValueError si es inválida, sin tocar la que estaba cargada."""
+        cfg = load_config_fixed(self.repo_root)
+        special_chars_re = compile_special_chars_pattern(cfg, self.repo_root)
+        self.cfg = cfg
+        self.roots = parse_roots_from_config(self.cfg, self.repo_root)
+        self.special_chars_re = special_chars_re
+        self._use_function_index(None)
+        self.pfilter = PathFilter(self.cfg, self.repo_root)
+        self.reporter = REPORTERS[self.args.format](self.cfg, self.report_out, self.repo_root)
+        self.config_stamp = self._config_stamp()
+        self.results.clear()
+        self.stamps.clear()
+
+    def _use_function_index(self, udf_index):
+        self.udf_index = udf_index
+        self.scanner = LineScanner(self.cfg, self.special_chars_re, udf_index)
+        self.cache = None if self.args.no_cache else open_result_cache(self.cfg, self.repo_root, self.special_chars_re,
+                                                                        udf_index)
+
+    def _update_function_index(self) -> bool:
+        """Actualiza el índice de funciones con los archivos conocidos; True si cambió."""
+        udf_index = build_function_index(sorted(self.stamps, key=str), self.cfg, self.repo_root, self.stamps)
+        if udf_index == self.udf_index:
+            return False
+        self._use_function_index(udf_index)
+        return True
+
+    def _start_watcher(self):
+        if self.inotify is not None:
+            self.selector.unregister(self.inotify.fd)
+            self.inotify.close()
+            self.inotify = None
+        if self.args.poll:
+            return
+        try:
+            self.inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            print(f"⚠️  inotify no disponible ({e}); se usa sondeo cada {self.args.poll_interval:g}s")
+            return
+        for r in self.roots:
+            if r.is_dir():
+                self.inotify.add_tree(r, self.pfilter)
+        self.selector.register(self.inotify.fd, selectors.EVENT_READ, "inotify")
+
+    def full_audit(self):
+        """Auditoría completa (al iniciar y tras recargar la config)."""
+        files, _ = collect_sql_files(self.roots, self.cfg, self.repo_root, self.args.discovery)
+        stamps = {fp: _file_stamp(fp) for fp in files}
+        self._use_function_index(build_function_index(files, self.cfg, self.repo_root, stamps))
+        any_error = False
+        for res in audit_files(files, self.cfg, self.special_chars_re, self.args.jobs, self.cache,
+                               udf_index=self.udf_index):
+            fp = Path(res["archivo"])
+            self.results[fp] = res
+            self.stamps[fp] = stamps[fp]
+            any_error |= self.reporter.file(res)
+        self.report_out.flush()
+        if self.cache is not None:
+            self.cache.prune()
+        mode = "sondeo" if self.inotify is None else "inotify"
+        print(f"\n{'❌' if any_error else '✅'} {len(files)} archivo(s) auditados; vigilando cambios ({mode}). Ctrl+C para salir.")
+
+    # ---- cambios
+    def _watched(self, fp: Path) -> bool:
+        return (self.pfilter.audited_name(fp.name) and any(fp.is_relative_to(r) for r in self.roots)
+                and not self.pfilter.excluded(fp))
+
+    def refresh(self, paths, quiet: bool = False) -> list:
+        """Reaudita las rutas cuyo (mtime, tamaño) cambió; quita las borradas. Devuelve las reauditadas."""
+        changed = []
+        todo = []
+        touched = False
+        max_bytes = max_file_bytes(self.cfg)
+        skip = skip_large_files(self.cfg)
+        for fp in sorted(paths, key=str):
+            stamp = _file_stamp(fp)
+            if stamp is None or not self._watched(fp):
+                if self.stamps.pop(fp, None) is not None:
+                    touched = True
+                if self.results.pop(fp, None) is not None and not quiet:
+                    print(f"\n--- Archivo eliminado: {fp} ---")
+                continue
+            if self.stamps.get(fp) == stamp:
+                continue
+            self.stamps[fp] = stamp
+            touched = True
+            if _exceeds_size_limit(fp, stamp[1], max_bytes, skip):
+                self.results.pop(fp, None)
+                continue
+            todo.append(fp)
+        if touched and function_index_mode(self.cfg) != "off" and self._update_function_index():
+            # los hallazgos de las reglas de UDF de cualquier archivo pueden haber cambiado
+            if not quiet:
+                print("\n🔄 Cambiaron las funciones definidas en el repo: se reaudita todo.")
+            todo = sorted(set(self.results) | set(todo), key=str)
+        for fp in todo:
+            res = audit_file(fp, self.cfg, self.special_chars_re, self.scanner, self.cache)
+            self.results[fp] = res
+            changed.append(res)
+            if not quiet:
+                self.reporter.file(res)
+        if changed and not quiet:
+            self.report_out.flush()
+            n_err = sum(has_error(r, self.cfg) for r in changed)
+            print(f"\n{'❌' if n_err else '✅'} {len(changed)} archivo(s) reauditados"
+                  + (f", {n_err} con errores" if n_err else ""))
+        return changed
+
+    def poll(self):
+        current = set()
+        for r in self.roots:
+            if r.is_dir():
+                current.update(p for p, _ in walk_sql_files(r, self.pfilter))
+        self.refresh(current | set(self.stamps))
+
+    def _on_inotify(self):
+        for path, mask in self.inotify.read():
+            if path is None:
+                # cola desbordada: se revisa todo por sondeo
+                self.poll()
+                continue
+            if mask & Inotify.IN_ISDIR:
+                if mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+                    self.inotify.add_tree(path, self.pfilter)
+                    self.pending.update(p for p, _ in walk_sql_files(path, self.pfilter))
+                elif mask & Inotify.IN_MOVED_FROM:
+                    self.pending.update(fp for fp in self.stamps if fp.is_relative_to(path))
+                continue
+            if self.pfilter.audited_name(path.name):
+                self.pending.add(path)
+
+    def _check_config(self):
+        if self._config_stamp() != self.config_stamp:
+            print("\n🔄 Cambió la configuración: se recarga y se vuelve a auditar todo.")
+            try:
+                self.load()
+            except ValueError as e:
+                print(f"❌ Configuración inválida: {e}. Se mantiene la anterior.")
+                self.config_stamp = self._config_stamp()
+                return
+            self._start_watcher()
+            self.full_audit()
+
+    # ---- socket
+    def _open_socket(self, path: Path):
+        if not hasattr(socket, "AF_UNIX"):
+            raise OSError("esta plataforma no soporta sockets Unix")
+        if path.exists():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(path))
+            except OSError:
+                path.unlink()   # socket huérfano de una ejecución anterior
+            else:
+                raise OSError(f"ya hay un daemon escuchando en {path}")
+            finally:
+                probe.close()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(path))
+        os.chmod(path, 0o600)
+        server.listen(16)
+        server.setblocking(False)
+        self.server = server
+        self.selector.register(server, selectors.EVENT_READ, "accept")
+
+    def _on_client(self, conn: socket.socket, buf: bytearray):
+        try:
+            data = conn.recv(64 * 1024)
+        except OSError:
+            data = b""
+        if not data:
+            self.selector.unregister(conn)
+            conn.close()
+            return
+        buf += data
+        while b"\n" in buf:
+            line, _, rest = bytes(buf).partition(b"\n")
+            buf[:] = rest
+            if not line.strip():
+                continue
+            try:
+                reply = self.handle_request(json.loads(line))
+            except ValueError as e:
+                reply = {"ok": False, "error": f"JSON inválido: {e}"}
+            conn.setblocking(True)
+            conn.settimeout(5)
+            try:
+                conn.sendall(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+            except OSError:
+                self.selector.unregister(conn)
+                conn.close()
+                return
+            conn.setblocking(False)
+
+    def handle_request(self, req: dict) -> dict:
+        """
+        {"cmd": "audit", "paths": [...]}: hallazgos de esas rutas (relativas a la raíz o absolutas),
+        reauditando antes las que cambiaron; sin "paths", de todos los archivos conocidos.
+        {"cmd": "status"}: archivos en memoria, modo de vigilancia y socket.
+        """
+        cmd = req.get("cmd") if isinstance(req, dict) else None
+        if cmd == "status":
+            return {"ok": True, "files": len(self.results), "root": str(self.repo_root),
+                    "watcher": "inotify" if self.inotify is not None else "polling"}
+        if cmd != "audit":
+            return {"ok": False, "error": f"comando desconocido: {cmd!r} (se espera 'audit' o 'status')"}
+        self._check_config()
+        paths = req.get("paths")
+        if paths is None:
+            targets = sorted(self.results, key=str)
+        else:
+            targets = [(self.repo_root / p).resolve() for p in paths]
+            self.refresh(targets, quiet=True)
+        files = []
+        for fp in targets:
+            res = self.results.get(fp)
+            if res is None:
+                files.append({"file": _report_path(str(fp), self.repo_root), "audited": False})
+                continue
+            path = _report_path(res["archivo"], self.repo_root)
+            files.append({"file": path, "audited": True, "error": has_error(res, self.cfg),
+                          "findings": list(finding_records(res, self.cfg, path))})
+        return {"ok": True, "error": any(f.get("error") for f in files), "files": files}
+
+    # ---- bucle principal
+    def run(self):
+        print("==== Auditoría en modo watch ====\n")
+        print(f"Raíz del repo detectada: {self.repo_root}")
+        try:
+            self.load()
+        except ValueError as e:
+            print(f"❌ Configuración inválida: {e}")
+            sys.exit(2)
+        if self.args.socket:
+            self._open_socket(self.args.socket)
+            print(f"Socket de consultas: {self.args.socket}")
+        self._start_watcher()
+        self.full_audit()
+        next_poll = time.monotonic() + self.args.poll_interval
+        try:
+            while True:
+                timeout = max(0.0, next_poll - time.monotonic())
+                if self.pending:
+                    timeout = min(timeout, WATCH_DEBOUNCE_S)
+                events = self.selector.select(timeout)
+                for key, _ in events:
+                    if key.data == "inotify":
+                        self._on_inotify()
+                    elif key.data == "accept":
+                        try:
+                            conn, _ = self.server.accept()
+                        except OSError:
+                            continue
+                        conn.setblocking(False)
+                        self.selector.register(conn, selectors.EVENT_READ, bytearray())
+                    else:
+                        self._on_client(key.fileobj, key.data)
+                if self.pending and not any(key.data == "inotify" for key, _ in events):
+                    # se espera un momento sin eventos: un guardado suele generar varios
+                    pending, self.pending = self.pending, set()
+                    self.refresh(pending)
+                if time.monotonic() >= next_poll:
+                    next_poll = time.monotonic() + self.args.poll_interval
+                    self._check_config()
+                    if self.inotify is None:
+                        self.poll()
+        except KeyboardInterrupt:
+            print("\nModo watch finalizado.")
+        finally:
+            if self.server is not None:
+                self.server.close()
+                try:
+                    self.args.socket.unlink()
+                except OSError:
+                    pass
+            if self.inotify is not None:
+                self.inotify.close()
+            self.selector.close()
+
+WATCH_DEBOUNCE_S = 0.1
+
+def _file_stamp(fp: Path):
+    try:
+        st = fp.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+# -----------------------------
+# API de biblioteca: auditoría en proceso, sin prints ni sys.exit
+# -----------------------------
+#   cfg = AuditConfig.from_repo(Path("."))
+#   audit_text("SELECT * FROM t", cfg)          -> [AuditFinding(...), ...]
+#   audit_paths([Path("db")], cfg)              -> {Path("db/a.sql"): [AuditFinding(...)], ...}
+class AuditFinding:
+    """Hallazgo reportable: regla, severidad según [severities], posición (1-based) y mensaje."""
+    __slots__ = ("rule", "severity", "line", "column", "message", "path")
+
+    def __init__(self, rule: str, severity: str, line: int, column: int, message: str, path: str = None):
+        self.rule = rule
+        self.severity = severity
+        self.line = line
+        self.column = column
+        self.message = message
+        self.path = path   # relativa a la raíz del repo (audit_paths); None en audit_text
+
+    def _key(self):
+        return (self.rule, self.severity, self.line, self.column, self.message, self.path)
+
+    def __eq__(self, other):
+        return isinstance(other, AuditFinding) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        where = f"{self.path}:{self.line}:{self.column}" if self.path else f"{self.line}:{self.column}"
+        return f"AuditFinding({self.rule} {self.severity} {where} {self.message!r})"
+
+    def as_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+class AuditConfig:
+    """
+    Todo lo que se arma una vez por configuración: ConfigParser, patrón de special_chars, índice de
+    funciones y escáner de reglas. Se reutiliza entre llamadas a audit_text/audit_paths, así que
+    auditar muchas entradas no vuelve a compilar patrones. Sin `cfg` se usan los defaults. Una
+    config inválida (p.ej. [special_chars] policy desconocida) lanza ValueError.
+    """
+    __slots__ = ("cfg", "repo_root", "special_chars_re", "udf_index", "scanner")
+
+    def __init__(self, cfg: configparser.ConfigParser = None, repo_root: Path = None,
+                 special_chars_re: SpecialChars = None, udf_index: dict = None):
+        self.cfg = cfg if cfg is not None else configparser.ConfigParser()
+        self.repo_root = Path(repo_root).resolve() if repo_root is not None else Path.cwd().resolve()
+        self.special_chars_re = special_chars_re or compile_special_chars_pattern(self.cfg, self.repo_root)
+        self.udf_index = udf_index
+        self.scanner = LineScanner(self.cfg, self.special_chars_re, udf_index)
+
+    @classmethod
+    def from_repo(cls, repo_root: Path, function_index: bool = True) -> "AuditConfig":
+        """
+        Config de .github/audit/audit_config.ini bajo `repo_root` (defaults si no existe). Con
+        `function_index` arma el índice de funciones del repo según [functions], como main().
+        """
+        repo_root = Path(repo_root).resolve()
+        cfg = configparser.ConfigParser()
+        cfg.read(repo_root / CFG_FIXED_PATH, encoding="utf-8")
+        udf_index = None
+        if function_index and function_index_mode(cfg) != "off":
+            files = collect_sql_files(parse_roots_from_config(cfg, repo_root), cfg, repo_root, quiet=True)[0]
+            udf_index = build_function_index(files, cfg, repo_root)
+        return cls(cfg, repo_root, udf_index=udf_index)
+
+def _audit_findings(res: dict, cfg: configparser.ConfigParser, path: str = None) -> list:
+    """Resultado de audit_source/audit_file -> [AuditFinding], en el orden del reporte."""
+    return [AuditFinding(rule_key, s, it.line, it.col, it.message, path)
+            for rule_key, s, _, items in _reported(res, cfg) for it in items]
+
+def audit_text(sql: str, config: AuditConfig, first_line: int = 1) -> list:
+    """
+    Audita SQL en memoria (p.ej. un fragmento de una migración) y devuelve [AuditFinding];
+    `first_line` numera las líneas como en el archivo de origen.
+    """
+    limits = analysis_limits(config.cfg)
+    budget = TimeBudget(*limits) if any(limits) else None
+    res = audit_source(lex_sql(_normalize_newlines(sql), first_line), config.cfg, config.scanner, budget=budget)
+    return _audit_findings(res, config.cfg)
+
+def audit_paths(paths, config: AuditConfig, jobs: int = 1, cache: bool = False) -> dict:
+    """
+    Audita archivos y directorios (de estos, los .sql que encontraría main(), con [paths] exclude y
+    .gitignore) y devuelve {ruta: [AuditFinding]} en orden de ruta. Un archivo ilegible, que no es
+    UTF-8 o que el extractor rechaza (XML mal formado) no lanza: trae un AuditFinding unreadable_file
+    con el error, además de lo auditado antes de él. `cache` usa la caché de [cache].
+    """
+    files = []
+    for p in map(Path, paths):
+        p = p if p.is_absolute() else config.repo_root / p
+        if p.is_dir():
+            files.extend(collect_sql_files([p], config.cfg, config.repo_root, quiet=True)[0])
+        else:
+            files.append(p.resolve())
+    files = sorted(dict.fromkeys(files), key=str)
+    result_cache = open_result_cache(config.cfg, config.repo_root, config.special_chars_re,
+                                     config.udf_index) if cache else None
+    if jobs > 1:
+        results = audit_files(files, config.cfg, config.special_chars_re, jobs, result_cache, udf_index=config.udf_index)
+    else:
+        # en serie, el escáner de `config` (y sus alternancias ya compiladas) sirve para todos
+        results = (audit_file(fp, config.cfg, config.special_chars_re, config.scanner, result_cache) for fp in files)
+    return {fp: _audit_findings(res, config.cfg, _report_path(res["archivo"], config.repo_root))
+            for fp, res in zip(files, results)}
+
+# -----------------------------
+# Shards (--shard i/N) y combinación de resultados parciales (merge)
+# -----------------------------
+SHARD_FORMAT = "1"
+
+def load_shard_costs(path: Path, repo_root: Path) -> dict:
+    """
+    Costo histórico por archivo ({ruta relativa: segundos}) desde un --profile-json anterior.
+    Los archivos que salieron de la caché no cuentan: su tiempo no refleja el costo de auditarlos.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {_report_path(p["archivo"], repo_root): (p["total_s"], p["bytes"])
+            for p in data.get("per_file", ()) if not p.get("cache")}
+
+def shard_files(files: list, shard: int, shards: int, repo_root: Path, costs: dict = None) -> list:
+    """
+    Archivos del shard `shard` (1..shards) en el orden de `files`. Reparto LPT: de mayor a menor peso
+    (empates por ruta), cada archivo va al shard con menos carga acumulada (empates al de menor número).
+    El peso es el tamaño o, con `costs` (load_shard_costs), los segundos medidos; los archivos sin
+    medición se estiman por su tamaño a la velocidad media medida. Solo depende de la lista, los
+    tamaños y `costs`: repetir un shard cubre los mismos archivos.
+    """
+    rels = [_report_path(str(fp), repo_root) for fp in files]
+    sizes = []
+    for fp in files:
+        try:
+            sizes.append(fp.stat().st_size)
+        except OSError:
+            sizes.append(0)
+    weights = sizes
+    if costs:
+        measured_s = sum(s for s, _ in costs.values())
+        measured_b = sum(b for _, b in costs.values())
+        rate = measured_s / measured_b if measured_s > 0 and measured_b > 0 else 1.0
+        weights = [costs[rel][0] if rel in costs else size * rate for rel, size in zip(rels, sizes)]
+    loads = [0.0] * shards
+    owner = [0] * len(files)
+    for k in sorted(range(len(files)), key=lambda k: (-weights[k], rels[k])):
+        target = min(range(shards), key=lambda s: (loads[s], s))
+        loads[target] += weights[k]
+        owner[k] = target + 1
+    return [fp for fp, o in zip(files, owner) if o == shard]
+
+def _files_digest(files: list, repo_root: Path) -> str:
+    """Huella de la lista completa a repartir: todos los shards deben haber partido de la misma."""
+    h = hashlib.sha256()
+    for fp in files:
+        h.update(_report_path(str(fp), repo_root).encode("utf-8") + b"\0")
+    return h.hexdigest()
+
+class ShardPartial:
+    """
+    Resultado parcial de un shard en JSONL: un encabezado (shard, total y huella de la lista completa),
+    un registro por archivo con todos sus hallazgos (la severidad se aplica al combinar) y un cierre
+    con la cantidad de archivos, para detectar parciales truncados.
+    """
+    __slots__ = ("out", "repo_root", "count")
+
+    def __init__(self, path: Path, repo_root: Path, shard: tuple, all_files: list, audited_any: bool):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.out = open(path, "w", encoding="utf-8", newline="\n", buffering=REPORT_BUFFER_BYTES)
+        self.repo_root = repo_root
+        self.count = 0
+        header = {"partial": "audit_sql_standards", "format": SHARD_FORMAT, "shard": shard[0], "shards": shard[1],
+                  "files_total": len(all_files), "files_digest": _files_digest(all_files, repo_root),
+                  "audited_any": audited_any}
+        self.out.write(json.dumps(header) + "\n")
+
+    def file(self, res: dict):
+        # los Finding se guardan como listas [línea, columna, mensaje, snippet] (como en la caché)
+        result = {k: v for k, v in res.items() if k not in ("archivo", "perfil")}
+        self.out.write(json.dumps({"file": _report_path(res["archivo"], self.repo_root), "result": result},
+                                  ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def close(self):
+        self.out.write(json.dumps({"end": True, "files": self.count}) + "\n")
+        self.out.close()
+
+def read_partials(paths: list, repo_root: Path):
+    """
+    Lee los parciales de todos los shards y devuelve (resultados ordenados por ruta, si hubo algún
+    origen válido). Lanza ValueError si no son del mismo reparto, falta o sobra algún shard, alguno
+    está truncado o un archivo aparece en más de uno.
+    """
+    headers = {}
+    results = []
+    seen = set()
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            lines = iter(f)
+            try:
+                header = json.loads(next(lines))
+            except StopIteration:
+                raise ValueError(f"{path}: archivo vacío")
+            if header.get("partial") != "audit_sql_standards" or header.get("format") != SHARD_FORMAT:
+                raise ValueError(f"{path}: no es un resultado parcial de --shard (formato {SHARD_FORMAT})")
+            if header["shard"] in headers:
+                raise ValueError(f"{path}: shard {header['shard']}/{header['shards']} repetido")
+            headers[header["shard"]] = header
+            end = None
+            n_read = 0
+            for line in lines:
+                rec = json.loads(line)
+                if rec.get("end"):
+                    end = rec
+                    break
+                rel = rec["file"]
+                if rel in seen:
+                    raise ValueError(f"{path}: {rel} ya está en otro shard (¿distintos --shard-costs?)")
+                seen.add(rel)
+                res = {k: v if k in RESULT_META_KEYS else [Finding(*it) for it in v] for k, v in rec["result"].items()}
+                res["archivo"] = rel if Path(rel).is_absolute() else str(repo_root / rel)
+                results.append(res)
+                n_read += 1
+            if end is None or end["files"] != n_read:
+                raise ValueError(f"{path}: resultado truncado (el shard no terminó)")
+
+    first = next(iter(headers.values()))
+    shards = first["shards"]
+    for h in headers.values():
+        if h["shards"] != shards or h["files_digest"] != first["files_digest"]:
+            raise ValueError("los parciales no vienen del mismo reparto (otro N u otra lista de archivos)")
+    missing = sorted(set(range(1, shards + 1)) - set(headers))
+    if missing:
+        raise ValueError(f"faltan los shards {', '.join(f'{i}/{shards}' for i in missing)}")
+    if len(seen) != first["files_total"]:
+        raise ValueError(f"los shards cubren {len(seen)} de {first['files_total']} archivo(s)")
+    results.sort(key=lambda r: r["archivo"])
+    return results, any(h["audited_any"] for h in headers.values())
+
+def run_merge(args: argparse.Namespace, report_out):
+    print("==== Combinación de resultados por shard ====\n")
+    repo_root = Path.cwd().resolve()
+    cfg = load_config_fixed(repo_root)
+    try:
+        results, audited_any = read_partials(args.partials, repo_root)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"❌ No se pudieron combinar los resultados parciales: {e}")
+        sys.exit(2)
+    print(f"{len(args.partials)} shard(s), {len(results)} archivo(s)")
+    any_issue_as_error = False
+    reporter = REPORTERS[args.format](cfg, report_out, repo_root)
+    for res in results:
+        any_issue_as_error |= reporter.file(res)
+    reporter.close()
+    if args.output is not None:
+        print(f"\nReporte {args.format} escrito en {args.output}")
+    finish_audit(any_issue_as_error, audited_any)
+
+# -----------------------------
+# Main
+# -----------------------------
+def _jobs_arg(value: str) -> int:
+    if value.lower() == "auto":
+        return os.cpu_count() or 1
+    try:
+        n = int(value)
+    except ValueError:
+        n = 0
+    if n < 1:
+        raise argparse.ArgumentTypeError("se espera un entero >= 1 o 'auto'")
+    return n
+
+def _shard_arg(value: str) -> tuple:
+    i, sep, n = value.partition("/")
+    try:
+        shard = (int(i), int(n))
+    except ValueError:
+        shard = (0, 0)
+    if not sep or not 1 <= shard[0] <= shard[1]:
+        raise argparse.ArgumentTypeError("se espera i/N con 1 <= i <= N (p.ej. 2/4)")
+    return shard
+
+def _add_report_args(ap: argparse.ArgumentParser):
+    ap.add_argument("--format", choices=sorted(REPORTERS), default="console",
+                    help="formato del reporte: console (texto), jsonl (un hallazgo JSON por línea) o sarif (2.1.0)")
+    ap.add_argument("--output", "-o", type=Path, metavar="ARCHIVO",
+                    help="escribe el reporte en ARCHIVO en vez de stdout")
+
+def parse_args(argv=None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Auditoría de estándares SQL (config en .github/audit/audit_config.ini)",
+                                 epilog="Para combinar los resultados de --shard: audit_sql_standards.py merge PARCIAL...")
+    ap.add_argument("--jobs", "-j", type=_jobs_arg, default=1, metavar="N",
+                    help="archivos auditados en paralelo: N procesos o 'auto' (= núm. de CPUs). Default: 1")
+    ap.add_argument("--diff", metavar="BASE..HEAD",
+                    help="audita solo los .sql cambiados en ese rango de git y reporta solo hallazgos en líneas cambiadas")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="no leer ni escribir la caché de resultados ([cache] en audit_config.ini)")
+    ap.add_argument("--profile", action="store_true",
+                    help="mide tiempo y hallazgos por regla y por archivo; imprime los más costosos al final")
+    ap.add_argument("--profile-json", type=Path, metavar="ARCHIVO",
+                    help="escribe el perfil completo en este JSON (implica --profile)")
+    _add_report_args(ap)
+    ap.add_argument("--fail-fast", action="store_true",
+                    help="se detiene en el primer archivo con un hallazgo de severidad 'error' (pre-commit)")
+    ap.add_argument("--discovery", choices=("walk", "git"),
+                    help="cómo se listan los .sql: walk (recorre el disco) o git (índice + no ignorados). Default: [paths] discovery")
+    ap.add_argument("--shard", type=_shard_arg, metavar="i/N",
+                    help="audita solo la parte i de N (reparto determinista y balanceado por tamaño) y guarda el "
+                         "resultado parcial para `merge`")
+    ap.add_argument("--shard-costs", type=Path, metavar="PERFIL",
+                    help="con --shard, balancea por los segundos por archivo de un --profile-json anterior")
+    ap.add_argument("--partial", type=Path, metavar="ARCHIVO",
+                    help="con --shard, dónde guardar el resultado parcial. Default: <logs_dir>/shards/shard-i-of-N.jsonl")
+    ap.add_argument("--watch", action="store_true",
+                    help="queda corriendo: reaudita los .sql que cambian y recarga la config si cambia (Ctrl+C para salir)")
+    ap.add_argument("--socket", type=Path, metavar="RUTA",
+                    help="con --watch, atiende consultas JSON por este socket Unix (implica --watch)")
+    ap.add_argument("--poll", action="store_true", help="con --watch, usa sondeo aunque haya inotify")
+    ap.add_argument("--poll-interval", type=float, default=1.0, metavar="SEG",
+                    help="con --watch, cada cuánto se revisa la config (y los archivos si hay sondeo). Default: 1")
+    args = ap.parse_args(argv)
+    if args.profile_json:
+        args.profile = True
+    if args.socket:
+        args.watch = True
+    if (args.shard_costs or args.partial) and not args.shard:
+        ap.error("--shard-costs y --partial requieren --shard")
+    if args.fail_fast and args.shard:
+        ap.error("--fail-fast no se combina con --shard (el resultado parcial quedaría incompleto)")
+    if args.watch:
+        if args.diff or args.profile or args.shard or args.fail_fast:
+            ap.error("--watch no se combina con --diff, --profile, --shard ni --fail-fast")
+        if args.format == "sarif":
+            ap.error("--watch admite --format console o jsonl (SARIF es un documento único)")
+        if args.poll_interval <= 0:
+            ap.error("--poll-interval debe ser > 0")
+    return args
+
+def parse_merge_args(argv) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(prog="audit_sql_standards.py merge",
+                                 description="Combina los resultados parciales de --shard en un solo reporte "
+                                             "(mismo código de salida que una auditoría completa)")
+    ap.add_argument("partials", type=Path, nargs="+", metavar="PARCIAL", help="resultado parcial de cada shard")
+    _add_report_args(ap)
+    return ap.parse_args(argv)
+
+REPORT_BUFFER_BYTES = 1024 * 1024
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    merging = bool(argv) and argv[0] == "merge"
+    args = parse_merge_args(argv[1:]) if merging else parse_args(argv)
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        report_out = open(args.output, "w", encoding="utf-8", newline="\n", buffering=REPORT_BUFFER_BYTES)
+        status = contextlib.nullcontext()
+    elif args.format == "console":
+        report_out = sys.stdout
+        status = contextlib.nullcontext()
+    else:
+        # el reporte ocupa stdout; los mensajes de estado pasan a stderr para no mezclarse con él
+        sys.stdout.flush()
+        report_out = open(sys.stdout.fileno(), "w", encoding="utf-8", newline="\n",
+                          buffering=REPORT_BUFFER_BYTES, closefd=False)
+        status = contextlib.redirect_stdout(sys.stderr)
+    try:
+        with status:
+            if merging:
+                run_merge(args, report_out)
+            elif args.watch:
+                AuditDaemon(args, Path.cwd().resolve(), report_out).run()
+            else:
+                run_audit(args, report_out)
+    finally:
+        if report_out is not sys.stdout:
+            report_out.close()
+
+def run_audit(args: argparse.Namespace, report_out):
+    print("==== Auditoría iniciada ====\n")
+    repo_root = Path.cwd().resolve()
+    cfg = load_config_fixed(repo_root)
+    roots = parse_roots_from_config(cfg, repo_root)
+    print(f"Raíz del repo detectada: {repo_root}")
+    print("Orígenes a auditar:")
+    for r in roots:
+        print(f"  - {r}")
+
+    any_issue_as_error = False
+    telemetry = RunTelemetry(cfg, repo_root) if telemetry_enabled(cfg) else None
+
+    # Compilar caracteres especiales una sola vez
+    try:
+        special_chars_re = compile_special_chars_pattern(cfg, repo_root)
+    except ValueError as e:
+        print(f"❌ Configuración inválida: {e}")
+        sys.exit(2)
+
+    scopes = None
+    skipped = []
+    with _phase(telemetry, "discovery"):
+        if args.diff:
+            try:
+                audit_changes = git_diff_audit_changes(repo_root, args.diff, cfg)
+                if not audit_changes:
+                    scopes = git_diff_scopes(repo_root, args.diff, audited_suffixes(cfg))
+            except (OSError, RuntimeError) as e:
+                print(f"❌ No se pudo obtener el diff '{args.diff}': {e}")
+                sys.exit(2)
+            if audit_changes:
+                # cambiaron reglas, config o el script: lo ya existente puede dejar de cumplir
+                print(f"🔄 {args.diff} modifica la auditoría ({', '.join(audit_changes)}): se audita todo el repo")
+        if scopes is not None:
+            files = select_diff_files(scopes, roots, cfg, repo_root, skipped)
+            audited_any = any(r.is_dir() for r in roots)
+            print(f"Modo diff {args.diff}: {len(files)} archivo(s) con cambios")
+        else:
+            files, audited_any = collect_sql_files(roots, cfg, repo_root, args.discovery, skipped=skipped)
+    if telemetry is not None:
+        telemetry.discovered = len(files) + len(skipped)
+        telemetry.skipped = len(skipped)
+
+    # las reglas de UDF consultan las funciones de todo el repo, no solo las de los archivos cambiados
+    with _phase(telemetry, "function_index"):
+        index_files = files if scopes is None else collect_sql_files(roots, cfg, repo_root, args.discovery, quiet=True)[0]
+    partial = None
+    if args.shard:
+        try:
+            costs = load_shard_costs(args.shard_costs, repo_root) if args.shard_costs else None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"❌ No se pudo leer --shard-costs {args.shard_costs}: {e}")
+            sys.exit(2)
+        all_files = files
+        files = shard_files(all_files, *args.shard, repo_root, costs)
+        print(f"Shard {args.shard[0]}/{args.shard[1]}: {len(files)} de {len(all_files)} archivo(s)")
+        partial_path = args.partial or _logs_dir(cfg, repo_root) / "shards" / f"shard-{args.shard[0]}-of-{args.shard[1]}.jsonl"
+        partial = ShardPartial(partial_path, repo_root, args.shard, all_files, audited_any)
+    with _phase(telemetry, "function_index"):
+        udf_index = build_function_index(index_files, cfg, repo_root)
+    if udf_index is not None:
+        n_scalar = sum(kind == "scalar" for kind in udf_index.values())
+        print(f"Índice de funciones: {n_scalar} escalar(es), {len(udf_index) - n_scalar} de tabla")
 
-                res = audit_file(full, cfg, special_chars_re)
-                has_any = any([
-                    res["nolock"], res["special"], res["global"], res["temp"],
-                    res["curs"], res["funcs"], res["warn"], res["select_star"],
-                    res["select_top"], res["top_without_order_by"], res["delete_update_without_where"],
-                    res["merge_usage"], res["select_distinct_no_justification"],
-                    res["exec_dynamic_sql_unparameterized"], res["select_into_heavy"],
-                    res["scalar_udf_in_select_where"], res["deprecated_types"], res["hint_usage_general"]
-                ])
-
-                print(f"\n--- Archivo: {rel_print} ---")
-                if not has_any:
-                    print("   (sin hallazgos)")
-
-                # Mostrar por regla y recoger si hay 'error'
-                any_issue_as_error |= show("nolock", "Falta WITH (NOLOCK) en FROM/JOIN:", res["nolock"], cfg)
-                any_issue_as_error |= show("special_chars", "Caracteres especiales no permitidos:", res["special"], cfg)
-                any_issue_as_error |= show("global_temp", "Uso de tabla temporal global (##):", res["global"], cfg)
-                any_issue_as_error |= show("temp_names", "Nombre de temporal genérico (#temp/@temp):", res["temp"], cfg)
-                any_issue_as_error |= show("cursors", "Uso de cursor:", res["curs"], cfg)
-                any_issue_as_error |= show("user_functions", "Función en WHERE:", res["funcs"], cfg)
-                any_issue_as_error |= show("inner_join_where", "INNER JOIN + WHERE sin variantes:", res["warn"], cfg)
-                any_issue_as_error |= show("select_star", "SELECT * detectado:", res["select_star"], cfg)
-                any_issue_as_error |= show("select_top", "SELECT TOP detectado:", res["select_top"], cfg)
-
-                any_issue_as_error |= show("top_without_order_by", "SELECT TOP sin ORDER BY:", res["top_without_order_by"], cfg)
-                any_issue_as_error |= show("delete_update_without_where", "DELETE/UPDATE sin WHERE:", res["delete_update_without_where"], cfg)
-                any_issue_as_error |= show("merge_usage", "MERGE detectado:", res["merge_usage"], cfg)
-                any_issue_as_error |= show("select_distinct_no_justification", "SELECT DISTINCT sin justificación:", res["select_distinct_no_justification"], cfg)
-                any_issue_as_error |= show("exec_dynamic_sql_unparameterized", "EXEC dinámico sin parámetros:", res["exec_dynamic_sql_unparameterized"], cfg)
-                any_issue_as_error |= show("select_into_heavy", "SELECT INTO #temp (recomendación):", res["select_into_heavy"], cfg)
-
-                any_issue_as_error |= show("scalar_udf_in_select_where", "UDF escalar en SELECT/WHERE:", res["scalar_udf_in_select_where"], cfg)
-                any_issue_as_error |= show("deprecated_types", "Tipos deprecados (TEXT/NTEXT/IMAGE):", res["deprecated_types"], cfg)
-                any_issue_as_error |= show("hint_usage_general", "Hints de consulta detectados:", res["hint_usage_general"], cfg)
+    cache = None if args.no_cache else open_result_cache(cfg, repo_root, special_chars_re, udf_index)
+    profiler = RunProfile() if args.profile else None
+    reporter = REPORTERS[args.format](cfg, report_out, repo_root)
+    with _phase(telemetry, "audit"):
+        results = audit_files(files, cfg, special_chars_re, args.jobs, cache, scopes, args.profile, udf_index,
+                              metrics=telemetry is not None)
+        for n, res in enumerate(results, 1):
+            perfil = res.pop("perfil", None)
+            if profiler is not None:
+                profiler.add(res["archivo"], perfil)
+            if telemetry is not None:
+                telemetry.add(res, perfil)
+            file_error = reporter.file(res)
+            any_issue_as_error |= file_error
+            if partial is not None:
+                partial.file(res)
+            if file_error and args.fail_fast:
+                results.close()   # con --jobs, cancela los archivos que quedaban en cola
+                print(f"\n⛔ --fail-fast: auditoría detenida en {res['archivo']} ({n} de {len(files)} archivo(s))")
+                break
+        reporter.close()
+    if args.output is not None:
+        print(f"\nReporte {args.format} escrito en {args.output}")
+    if partial is not None:
+        partial.close()
+        print(f"\nResultado parcial del shard escrito en {partial_path}")
+    if cache is not None:
+        cache.prune()
+    if profiler is not None:
+        profiler.print_report()
+        if args.profile_json:
+            profiler.write_json(args.profile_json)
+            print(f"\nPerfil escrito en {args.profile_json}")
+    if telemetry is not None:
+        telemetry.write(any_issue_as_error, {
+            "mode": "diff" if scopes is not None else "full", "diff": args.diff,
+            "shard": f"{args.shard[0]}/{args.shard[1]}" if args.shard else None,
+            "jobs": args.jobs, "format": args.format, "cache": cache is not None})
+    finish_audit(any_issue_as_error, audited_any)
 
+def finish_audit(any_issue_as_error: bool, audited_any: bool):
+    """Mensaje final y código de salida (1 si algún hallazgo tiene severidad 'error')."""
     if not audited_any:
         print("\n⚠️  No se auditó ningún directorio (revisa [paths] sql_roots).")
         return
@@ -0,0 +1,419 @@
+import argparse
+import configparser
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import audit_sql_standards as audit
+
+# -----------------------------
+# Benchmark del auditor SQL
+#   python .github/audit/bench_audit.py                       # corre y muestra tabla
+#   python .github/audit/bench_audit.py --save-baseline       # guarda bench_baseline.json
+#   python .github/audit/bench_audit.py --fail-on-regression  # exit 1 si empeora vs baseline
+# -----------------------------
+AUDIT_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = AUDIT_DIR / "bench_baseline.json"
+BENCH_FORMAT = 1
+
+# -----------------------------
+# Generador de corpus sintético (reproducible por semilla)
+# -----------------------------
+TABLES = ["dbo.Clientes", "dbo.Ordenes", "dbo.Productos", "dbo.Categorias", "dbo.Marcas", "ventas.Detalle"]
+COLUMNS = ["Id", "Nombre", "Monto", "Fecha", "Activo", "CategoriaId", "ClienteId", "Descripcion"]
+
+def _table(rng):
+    return rng.choice(TABLES)
+
+def _cols(rng, n=None):
+    return ", ".join(rng.sample(COLUMNS, n or rng.randint(1, 4)))
+
+def _statement(rng) -> str:
+    """Una sentencia T-SQL al azar; la mezcla dispara (y no dispara) todas las reglas."""
+    t = _table(rng)
+    kind = rng.randrange(14)
+    if kind == 0:
+        return f"SELECT {_cols(rng)}\nFROM {t} WITH (NOLOCK)\nWHERE Activo = 1;\n"
+    if kind == 1:
+        return f"SELECT *\nFROM {t};\n"
+    if kind == 2:
+        return f"SELECT TOP {rng.randint(1, 100)} {_cols(rng)}\nFROM {t} WITH (NOLOCK)\nORDER BY Id;\n"
+    if kind == 3:
+        return (f"SELECT a.Id, b.Nombre\nFROM {t} a\n    INNER JOIN {_table(rng)} b ON b.Id = a.Id\n"
+                f"    INNER JOIN {_table(rng)} c ON c.Id = a.Id\nWHERE a.Activo = 1;\n")
+    if kind == 4:
+        return f"UPDATE {t} SET Activo = 0 WHERE Id = {rng.randint(1, 9999)};\n"
+    if kind == 5:
+        return f"DELETE FROM {t};\n"
+    if kind == 6:
+        return f"DECLARE c_{rng.randint(1, 99)} CURSOR FOR SELECT Id FROM {t} WITH (NOLOCK);\n"
+    if kind == 7:
+        return f"SELECT DISTINCT {_cols(rng, 1)}\nFROM {t} WITH (NOLOCK);\n"
+    if kind == 8:
+        return f"SELECT {_cols(rng)}\nINTO #tmp{rng.randint(1, 99)}\nFROM {t} WITH (NOLOCK);\n"
+    if kind == 9:
+        return f"SELECT dbo.fn_calcula(Monto) AS x\nFROM {t} WITH (NOLOCK)\nWHERE dbo.fn_valida(Id) = 1;\n"
+    if kind == 10:
+        return f"CREATE TABLE #temp{rng.randint(1, 9)} (Id INT, Notas TEXT);\n"
+    if kind == 11:
+        return f"SELECT Id FROM {t} p WITH (INDEX(IX_{rng.randint(1, 9)}))\nOPTION (RECOMPILE);\n"
+    if kind == 12:
+        return f"MERGE {t} AS d USING ##stage AS s ON d.Id = s.Id\nWHEN MATCHED THEN UPDATE SET d.Monto = s.Monto;\n"
+    return f"INSERT INTO {t} ({_cols(rng, 2)}) VALUES ({rng.randint(1, 9)}, N'descripción {rng.randint(1, 999)}');\n"
+
+def _procedure(rng, n_statements: int) -> str:
+    body = "".join("    " + _statement(rng).replace("\n", "\n    ").rstrip() + "\n" for _ in range(n_statements))
+    return (f"CREATE PROCEDURE dbo.usp_Proc{rng.randint(1, 10**6)}\n    @Id INT\nAS\nBEGIN\n"
+            f"    SET NOCOUNT ON;\n{body}END\nGO\n")
+
+def _dynamic_sql(rng, depth: int) -> str:
+    """EXEC anidado: cada nivel duplica las comillas del anterior."""
+    inner = f"SELECT * FROM {_table(rng)} WHERE Nombre = ''x''"
+    for _ in range(depth):
+        inner = "EXEC(''" + inner.replace("'", "''") + "'' + @p)"
+    return f"DECLARE @p NVARCHAR(10) = N'1';\nEXEC('{inner}' + @p);\nEXEC sp_executesql @sql = N'SELECT 1' + @p;\nGO\n"
+
+def _comment_block(rng) -> str:
+    words = " ".join(rng.choice(["SELECT", "FROM", "CURSOR", "MERGE", "##temp", "dbo.fn(x)", "año", "TEXT", "--"])
+                     for _ in range(rng.randint(5, 20)))
+    if rng.random() < 0.5:
+        return f"/* {words}\n   /* anidado: DELETE FROM t */\n   {words} */\n"
+    return f"-- {words}\n"
+
+def gen_small_procs(rng, scale):
+    return {f"procs/p{i:05d}.sql": _procedure(rng, rng.randint(3, 12)) for i in range(int(400 * scale) or 1)}
+
+def gen_huge_scripts(rng, scale):
+    files = {}
+    for i in range(2):
+        parts = []
+        size = 0
+        target = int(3 * 1024 * 1024 * scale) or 1024
+        while size < target:
+            p = _procedure(rng, rng.randint(5, 30))
+            parts.append(p)
+            size += len(p)
+        files[f"huge/script{i}.sql"] = "".join(parts)
+    return files
+
+def gen_long_lines(rng, scale):
+    files = {}
+    for i in range(int(5 * scale) or 1):
+        stmts = [_statement(rng).replace("\n", " ") for _ in range(2000)]
+        files[f"minified/m{i}.sql"] = " ".join(stmts) + "\n"
+    return files
+
+def gen_dynamic_sql(rng, scale):
+    return {f"dynamic/d{i:04d}.sql": "".join(_dynamic_sql(rng, rng.randint(1, 6)) for _ in range(40))
+            for i in range(int(60 * scale) or 1)}
+
+def gen_comment_heavy(rng, scale):
+    files = {}
+    for i in range(int(150 * scale) or 1):
+        parts = []
+        for _ in range(40):
+            parts.append(_comment_block(rng))
+            if rng.random() < 0.3:
+                parts.append(_statement(rng))
+        files[f"comments/c{i:04d}.sql"] = "".join(parts)
+    return files
+
+def gen_adversarial(rng, scale):
+    """
+    Una línea minificada por archivo que hace retroceder sin fin a un patrón (ver [limits]). No
+    escala con `scale`: achicadas, alguna terminaría dentro del presupuesto y el guard fallaría.
+    """
+    n = 4000
+    t = _table(rng)
+    return {
+        "adversarial/where_minified.sql": f"SELECT Id FROM {t} WITH (NOLOCK) WHERE Activo = 1 " * n + "\n",
+        "adversarial/where_unclosed_call.sql": "WHERE dbo.fn_valida( " * n + "\n",
+        "adversarial/option_unclosed.sql": "SELECT 1 OPTION (" * (6 * n) + "\n",
+        "adversarial/exec_concat.sql": "EXEC (@p + " * (5 * n) + "\n",
+        "adversarial/select_into.sql": "SELECT Id INTO " * (5 * n) + "\n",
+    }
+
+PROFILES = {
+    "small_procs": gen_small_procs,
+    "huge_scripts": gen_huge_scripts,
+    "long_lines": gen_long_lines,
+    "dynamic_sql": gen_dynamic_sql,
+    "comment_heavy": gen_comment_heavy,
+    "adversarial": gen_adversarial,
+}
+# Perfiles cuyas reglas no terminan sin presupuesto: se auditan con estos [limits] y, en vez de medir
+# cada etapa, se verifica que cada archivo termine dentro del presupuesto con su analysis_timeout.
+GUARDED_PROFILES = {"adversarial": {"rule_timeout_s": "1", "file_timeout_s": "3"}}
+GUARD_SLACK_S = 2.0   # lectura, lexer y reglas rápidas por encima de file_timeout_s
+
+def generate_corpus(root: Path, profile: str, seed: int, scale: float) -> dict:
+    """Escribe el corpus `profile` bajo `root` (con la config del repo) y devuelve {ruta relativa: bytes}."""
+    rng = random.Random(f"{seed}:{profile}")
+    files = PROFILES[profile](rng, scale)
+    cfg_dir = root / ".github" / "audit"
+    cfg_dir.mkdir(parents=True, exist_ok=True)
+    for name in ("audit_config.ini", "special_chars.txt"):
+        if (AUDIT_DIR / name).exists():
+            shutil.copy(AUDIT_DIR / name, cfg_dir / name)
+    if profile in GUARDED_PROFILES:
+        cfg = configparser.ConfigParser()
+        cfg.read(cfg_dir / "audit_config.ini", encoding="utf-8")
+        cfg["limits"] = GUARDED_PROFILES[profile]
+        with open(cfg_dir / "audit_config.ini", "w", encoding="utf-8") as f:
+            cfg.write(f)
+    sizes = {}
+    for rel, text in files.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = text.encode("utf-8")
+        path.write_bytes(data)
+        sizes[rel] = len(data)
+    return sizes
+
+# -----------------------------
+# Mediciones
+# -----------------------------
+# El corpus llama a estas funciones sin definirlas: las reglas con índice de funciones se miden
+# como si el repo las definiera como escalares
+CORPUS_UDFS = ("fn_calcula", "fn_valida")
+
+def rule_functions(special_chars_re, udf_index: dict) -> list:
+    """
+    (nombre, función(src)) de cada regla de audit.RULES, en el orden del reporte: su check_* o, si es
+    de línea, su patrón fuera del escáner fusionado. Las que tienen variante con índice de funciones
+    se miden además con `udf_index`, como "<clave>[indice]".
+    """
+    out = []
+    for rule in audit.RULES:
+        if rule.key == "special_chars":
+            out.append((rule.key, lambda src: audit.check_special_chars(src, special_chars_re)))
+        elif rule.check is not None:
+            out.append((rule.key, rule.check))
+        elif rule.pattern is not None:
+            out.append((rule.key, lambda src, r=rule: audit._line_rule_findings(src, list(src.spans()),
+                                                                              r.pattern, r.message)))
+        if rule.indexed_check is not None:
+            out.append((f"{rule.key}[indice]", lambda src, r=rule: r.indexed_check(src, udf_index)))
+    return out
+
+def _best_of(repeat: int, fn) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def time_pipeline(root: Path, jobs: int) -> float:
+    """main() completo (descubrimiento + auditoría + impresión) sobre `root`, sin caché."""
+    prev = Path.cwd()
+    os.chdir(root)
+    try:
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                audit.main(["--no-cache", "--jobs", str(jobs)])
+            except SystemExit:
+                pass
+        return time.perf_counter() - t0
+    finally:
+        os.chdir(prev)
+
+def time_stages(root: Path, rels: list, repeat: int) -> dict:
+    """
+    Lexer (vista enmascarada), tokens, índice de sentencias y escáner fusionado, y cada regla por
+    separado, sobre archivos ya leídos.
+    """
+    cfg = audit.load_config_fixed(root)
+    special_chars_re = audit.compile_special_chars_pattern(cfg, root)
+    scanner = audit.LineScanner(cfg, special_chars_re)
+    texts = [(root / rel).read_text(encoding="utf-8") for rel in rels]
+    sources = [audit.lex_sql(t) for t in texts]
+
+    tokens = [list(s.iter_tokens()) for s in sources]
+    stages = {
+        "lex": _best_of(repeat, lambda: [audit.lex_sql(t) for t in texts]),
+        "tokens": _best_of(repeat, lambda: [list(s.iter_tokens()) for s in sources]),
+        "statement_index": _best_of(repeat, lambda: [audit.index_statements(toks) for toks in tokens]),
+        "line_scanner": _best_of(repeat, lambda: [scanner.scan(s) for s in sources]),
+    }
+    del tokens
+    for s in sources:
+        s.build_statements()   # las reglas de sentencia miden solo su propio trabajo
+    udf_index = {audit.function_key("dbo", name): "scalar" for name in CORPUS_UDFS}
+    rules = {key: _best_of(repeat, lambda fn=fn: [fn(s) for s in sources])
+             for key, fn in rule_functions(special_chars_re, udf_index)}
+    return {"stages": stages, "rules": rules}
+
+def check_guard(root: Path, rels: list) -> dict:
+    """
+    Audita cada archivo de un perfil adversarial con los [limits] del corpus: todos deben terminar
+    en file_timeout_s (+ GUARD_SLACK_S) y reportar analysis_timeout. Devuelve lo medido y las fallas.
+    """
+    cfg = audit.load_config_fixed(root)
+    special_chars_re = audit.compile_special_chars_pattern(cfg, root)
+    scanner = audit.LineScanner(cfg, special_chars_re)
+    file_s = audit.analysis_limits(cfg)[1]
+    seconds = {}
+    failures = []
+    for rel in rels:
+        t0 = time.perf_counter()
+        res = audit.audit_file(root / rel, cfg, special_chars_re, scanner)
+        seconds[rel] = time.perf_counter() - t0
+        if seconds[rel] > file_s + GUARD_SLACK_S:
+            failures.append(f"{rel}: {seconds[rel]:.1f}s (presupuesto {file_s:g}s)")
+        if not res.get("analysis_timeout"):
+            failures.append(f"{rel}: sin analysis_timeout")
+    return {"budget_s": file_s, "files_s": seconds, "failures": failures}
+
+def run_benchmarks(profiles: list, seed: int, scale: float, repeat: int, jobs: int) -> dict:
+    results = {
+        "format": BENCH_FORMAT, "seed": seed, "scale": scale, "jobs": jobs,
+        "python": platform.python_version(), "machine": platform.machine(), "profiles": {},
+    }
+    for profile in profiles:
+        with tempfile.TemporaryDirectory(prefix=f"sqlbench-{profile}-") as tmp:
+            root = Path(tmp)
+            sizes = generate_corpus(root, profile, seed, scale)
+            rels = sorted(sizes)
+            pipeline = _best_of(repeat, lambda: time_pipeline(root, jobs))
+            entry = {"files": len(rels), "bytes": sum(sizes.values()), "pipeline_s": pipeline}
+            if profile in GUARDED_PROFILES:
+                entry.update(stages={}, rules={}, guard=check_guard(root, rels))
+            else:
+                entry.update(time_stages(root, rels, repeat))
+        results["profiles"][profile] = entry
+        print(f"  {profile}: {entry['files']} archivos, {entry['bytes'] / 1e6:.1f} MB, pipeline {pipeline:.2f}s",
+              file=sys.stderr)
+    return results
+
+# -----------------------------
+# Reporte y comparación con baseline
+# -----------------------------
+def _mb_s(nbytes: int, seconds: float) -> float:
+    return nbytes / 1e6 / seconds if seconds > 0 else float("inf")
+
+def throughput_metrics(results: dict) -> dict:
+    """{"perfil/etapa": MB/s} para todas las mediciones (mayor es mejor)."""
+    out = {}
+    for profile, e in results["profiles"].items():
+        out[f"{profile}/pipeline"] = _mb_s(e["bytes"], e["pipeline_s"])
+        for name, secs in e["stages"].items():
+            out[f"{profile}/{name}"] = _mb_s(e["bytes"], secs)
+        for name, secs in e["rules"].items():
+            out[f"{profile}/rule:{name}"] = _mb_s(e["bytes"], secs)
+    return out
+
+def print_report(results: dict):
+    for profile, e in results["profiles"].items():
+        mb = e["bytes"] / 1e6
+        print(f"\n== {profile}: {e['files']} archivos, {mb:.2f} MB ==")
+        print(f"   {'pipeline (main)':<40} {e['pipeline_s']:>8.3f}s {_mb_s(e['bytes'], e['pipeline_s']):>9.2f} MB/s"
+              f" {e['files'] / e['pipeline_s'] if e['pipeline_s'] else 0:>9.1f} archivos/s")
+        for name, secs in e["stages"].items():
+            print(f"   {name:<40} {secs:>8.3f}s {_mb_s(e['bytes'], secs):>9.2f} MB/s")
+        for name, secs in sorted(e["rules"].items(), key=lambda kv: -kv[1]):
+            print(f"   {'rule:' + name:<40} {secs:>8.3f}s {_mb_s(e['bytes'], secs):>9.2f} MB/s")
+        guard = e.get("guard")
+        if guard:
+            for rel, secs in guard["files_s"].items():
+                print(f"   {'guard:' + rel:<40} {secs:>8.3f}s (presupuesto {guard['budget_s']:g}s)")
+
+def guard_failures(results: dict) -> list:
+    """Archivos adversariales que no cortaron dentro del presupuesto (ver check_guard)."""
+    return [f"{profile}/{failure}" for profile, e in results["profiles"].items()
+            for failure in e.get("guard", {}).get("failures", ())]
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """Métricas cuyo MB/s cayó más que `tolerance` (fracción) respecto al baseline."""
+    if (baseline.get("seed"), baseline.get("scale")) != (results["seed"], results["scale"]):
+        print("⚠️  El baseline se generó con otra semilla/escala: la comparación no es directa.")
+    now = throughput_metrics(results)
+    before = throughput_metrics(baseline)
+    regressions = []
+    for key in sorted(now.keys() & before.keys()):
+        if before[key] <= 0 or before[key] == float("inf"):
+            continue
+        change = now[key] / before[key] - 1
+        if change < -tolerance:
+            regressions.append((key, before[key], now[key], change))
+    return regressions
+
+# -----------------------------
+# Main
+# -----------------------------
+def parse_args(argv=None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Benchmark del auditor SQL sobre corpus sintéticos reproducibles")
+    ap.add_argument("--profiles", default=",".join(PROFILES),
+                    help=f"perfiles separados por coma (default: todos: {', '.join(PROFILES)})")
+    ap.add_argument("--scale", type=float, default=1.0, help="multiplica el tamaño de cada corpus (default 1.0)")
+    ap.add_argument("--seed", type=int, default=1234, help="semilla del generador (default 1234)")
+    ap.add_argument("--repeat", type=int, default=3, help="repeticiones por medición; se toma la mejor (default 3)")
+    ap.add_argument("--jobs", default="1", help="--jobs del pipeline completo (default 1)")
+    ap.add_argument("--output", type=Path, help="escribe los resultados en este JSON")
+    ap.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help=f"baseline a comparar (default {DEFAULT_BASELINE.name})")
+    ap.add_argument("--save-baseline", action="store_true", help="guarda estos resultados como baseline")
+    ap.add_argument("--tolerance", type=float, default=0.15,
+                    help="caída de MB/s tolerada antes de marcar regresión (default 0.15 = 15%%)")
+    ap.add_argument("--fail-on-regression", action="store_true", help="exit 1 si hay regresiones vs baseline")
+    ap.add_argument("--generate", type=Path, metavar="DIR",
+                    help="solo genera los corpus en DIR/<perfil> (para inspección o perfiles externos) y termina")
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    unknown = [p for p in profiles if p not in PROFILES]
+    if unknown:
+        print(f"❌ Perfil(es) desconocido(s): {', '.join(unknown)}")
+        sys.exit(2)
+
+    if args.generate:
+        for profile in profiles:
+            sizes = generate_corpus(args.generate / profile, profile, args.seed, args.scale)
+            print(f"{profile}: {len(sizes)} archivos, {sum(sizes.values()) / 1e6:.2f} MB en {args.generate / profile}")
+        return
+
+    jobs = audit._jobs_arg(args.jobs)
+    print(f"==== Benchmark (semilla {args.seed}, escala {args.scale}, {args.repeat} repeticiones) ====", file=sys.stderr)
+    results = run_benchmarks(profiles, args.seed, args.scale, args.repeat, jobs)
+    print_report(results)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    failures = guard_failures(results)
+    if failures:
+        print("\n❌ El presupuesto de [limits] no cortó el análisis:")
+        for failure in failures:
+            print(f"   {failure}")
+        if args.fail_on_regression:
+            sys.exit(1)
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\nBaseline guardado en {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"\n(sin baseline en {args.baseline}; usa --save-baseline para crearlo)")
+        return
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if not regressions:
+        print(f"\n✅ Sin regresiones vs baseline (tolerancia {args.tolerance:.0%}).")
+        return
+    print(f"\n❌ Regresiones vs baseline (tolerancia {args.tolerance:.0%}):")
+    for key, before, now, change in regressions:
+        print(f"   {key:<48} {before:>9.2f} -> {now:>9.2f} MB/s ({change:+.0%})")
+    if args.fail_on_regression:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# El script de auditoría no es un paquete: se importa desde su carpeta
+AUDIT_DIR = Path(__file__).resolve().parents[1] / ".github" / "audit"
+sys.path.insert(0, str(AUDIT_DIR))
@@ -0,0 +1,82 @@
+"""
+--diff audita solo lo cambiado, salvo que el rango modifique lo que se exige (el script,
+audit_config.ini, special_chars.txt): ahí lo ya existente puede dejar de cumplir y se audita todo el repo.
+"""
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import audit_sql_standards as audit
+
+AUDIT_DIR = Path(audit.__file__).resolve().parent
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="requiere git")
+
+def _git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True)
+
+def _commit(repo, message):
+    _git(repo, "add", "-A")
+    _git(repo, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", message)
+
+@pytest.fixture
+def repo(tmp_path):
+    _git(tmp_path, "init", "-q")
+    cfg_dir = tmp_path / ".github" / "audit"
+    cfg_dir.mkdir(parents=True)
+    for name in ("audit_sql_standards.py", "audit_config.ini", "special_chars.txt", "bench_audit.py"):
+        shutil.copy(AUDIT_DIR / name, cfg_dir / name)
+    (tmp_path / "viejo.sql").write_text("SELECT Id FROM ##global\n", encoding="utf-8")
+    (tmp_path / "paquete.dtsx").write_text("<DTS:Executable/>\n", encoding="utf-8")
+    _commit(tmp_path, "base")
+    return tmp_path
+
+def _audit_diff(repo):
+    return subprocess.run([sys.executable, str(repo / ".github" / "audit" / "audit_sql_standards.py"), "--no-cache",
+                           "--diff", "HEAD~1..HEAD"], cwd=repo, capture_output=True, text=True, timeout=120)
+
+def test_diff_audits_only_changed_files(repo):
+    (repo / "nuevo.sql").write_text("SELECT Id FROM dbo.T WITH (NOLOCK)\n", encoding="utf-8")
+    _commit(repo, "nuevo")
+    run = _audit_diff(repo)
+    assert "Modo diff HEAD~1..HEAD: 1 archivo(s) con cambios" in run.stdout
+    assert "viejo.sql" not in run.stdout
+    assert run.returncode == 0
+
+@pytest.mark.parametrize("changed", ["audit_sql_standards.py", "audit_config.ini", "special_chars.txt"])
+def test_diff_touching_the_audit_runs_full_audit(repo, changed):
+    with open(repo / ".github" / "audit" / changed, "a", encoding="utf-8") as f:
+        f.write("\n# cambio\n")
+    _commit(repo, "config")
+    run = _audit_diff(repo)
+    assert f"🔄 HEAD~1..HEAD modifica la auditoría (.github/audit/{changed}): se audita todo el repo" in run.stdout
+    assert "Modo diff" not in run.stdout
+    # el .sql que no cambió se audita igual y su error hace fallar la ejecución
+    assert "viejo.sql" in run.stdout
+    assert run.returncode == 1
+
+def test_diff_touching_other_audit_files_stays_incremental(repo):
+    # el bench (o los logs) están en .github/audit/ pero no cambian lo que se exige
+    with open(repo / ".github" / "audit" / "bench_audit.py", "a", encoding="utf-8") as f:
+        f.write("\n# cambio\n")
+    (repo / "nuevo.sql").write_text("SELECT Id FROM dbo.T WITH (NOLOCK)\n", encoding="utf-8")
+    _commit(repo, "bench")
+    run = _audit_diff(repo)
+    assert "Modo diff HEAD~1..HEAD: 1 archivo(s) con cambios" in run.stdout
+    assert "viejo.sql" not in run.stdout
+    assert run.returncode == 0
+
+def test_diff_includes_embedded_extensions(repo):
+    (repo / "paquete.dtsx").write_text(
+        '<DTS:Executable xmlns:DTS="www.microsoft.com/SqlServer/Dts">\n'
+        '  <SQLTask:SqlTaskData SQLTask:SqlStatementSource="SELECT * FROM ##global" '
+        'xmlns:SQLTask="www.microsoft.com/sqlserver/dts/tasks/sqltask"/>\n'
+        '</DTS:Executable>\n', encoding="utf-8")
+    _commit(repo, "paquete")
+    run = _audit_diff(repo)
+    assert "Modo diff HEAD~1..HEAD: 1 archivo(s) con cambios" in run.stdout
+    assert "paquete.dtsx" in run.stdout
+    assert run.returncode == 1
@@ -0,0 +1,74 @@
+"""
+Descubrimiento de archivos (collect_sql_files): emulación de .gitignore al recorrer el disco,
+poda de directorios excluidos, [paths] exclude, y mismo resultado que `git ls-files` en modo git.
+"""
+import configparser
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import audit_sql_standards as audit
+
+TREE = {
+    ".gitignore": "*.tmp.sql\nbuild/\n/solo_raiz.sql\n# comentario\n",
+    "a.sql": "", "x.tmp.sql": "", "solo_raiz.sql": "", "notas.txt": "",
+    "build/b.sql": "",
+    "sub/.gitignore": "gen/**\n!conserva.tmp.sql\n[ab].sql\n",
+    "sub/a.sql": "", "sub/c.sql": "", "sub/solo_raiz.sql": "", "sub/conserva.tmp.sql": "",
+    "sub/gen/g.sql": "", "sub/gen/deep/h.sql": "",
+    "otro/build": "",   # archivo llamado build: 'build/' solo excluye directorios
+    "otro/D.SQL": "",
+    ".github/audit/x.sql": "",
+}
+EXPECTED = sorted(["a.sql", "otro/D.SQL", "sub/c.sql", "sub/conserva.tmp.sql", "sub/solo_raiz.sql"])
+
+@pytest.fixture
+def repo(tmp_path):
+    for rel, text in TREE.items():
+        (tmp_path / rel).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / rel).write_text(text, encoding="utf-8")
+    return tmp_path
+
+def _collect(repo, cfg=None, mode="walk", roots=None):
+    files, _ = audit.collect_sql_files(roots or [repo], cfg or configparser.ConfigParser(), repo, mode=mode, quiet=True)
+    return [p.relative_to(repo).as_posix() for p in files]
+
+def test_walk_applies_gitignore(repo):
+    assert _collect(repo) == EXPECTED
+
+def test_respect_gitignore_off(repo):
+    cfg = configparser.ConfigParser()
+    cfg["paths"] = {"respect_gitignore": "false"}
+    assert len(_collect(repo, cfg)) == 11   # todos los .sql salvo el de .github
+
+def test_exclude_is_not_rescued_by_gitignore_negation(repo):
+    cfg = configparser.ConfigParser()
+    cfg["paths"] = {"exclude": "*.tmp.sql, otro/"}
+    assert _collect(repo, cfg) == ["a.sql", "sub/c.sql", "sub/solo_raiz.sql"]
+
+def test_ignored_directories_are_not_listed(repo, monkeypatch):
+    listed = []
+    real = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda d: listed.append(os.path.relpath(d, repo)) or real(d))
+    _collect(repo)
+    # gen/** excluye el contenido de gen, no gen: se lista gen pero no gen/deep
+    assert not {"build", "sub/gen/deep", ".github"} & set(listed)
+    assert {".", "sub", "otro"} <= set(listed)
+
+def test_excluded_matches_the_walk(repo):
+    # --diff y --watch consultan rutas sueltas: mismo veredicto que el recorrido
+    pfilter = audit.PathFilter(configparser.ConfigParser(), repo)
+    candidates = [rel for rel in TREE if rel.lower().endswith(".sql") and not rel.startswith(".github")]
+    kept = sorted(rel for rel in candidates if not pfilter.excluded(repo / rel))
+    assert kept == EXPECTED
+
+def test_overlapping_roots_are_audited_once(repo):
+    assert _collect(repo, roots=[repo, repo / "sub", repo / "sub"]) == EXPECTED
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="requiere git")
+def test_git_mode_matches_walk(repo):
+    subprocess.run(["git", "-C", str(repo), "init", "-q"], check=True)
+    subprocess.run(["git", "-C", str(repo), "add", "sub/c.sql"], check=True)   # versionados y nuevos
+    assert _collect(repo, mode="git") == _collect(repo, mode="walk") == EXPECTED
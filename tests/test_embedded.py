@@ -0,0 +1,123 @@
+"""
+SQL embebido ([embedded]): fragmentos extraídos de .dtsx/.rdl, .py y .cs con su posición en el
+archivo original, caché por extractor y archivos que el extractor rechaza.
+"""
+import configparser
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import audit_sql_standards as audit
+
+AUDIT_DIR = Path(audit.__file__).resolve().parent
+
+def _config(tmp_path, extensions=".dtsx,.rdl,.py,.cs"):
+    cfg = configparser.ConfigParser()
+    cfg["embedded"] = {"extensions": extensions}
+    return audit.AuditConfig(cfg, repo_root=tmp_path)
+
+def _rules(findings):
+    return sorted((f.rule, f.line) for f in findings)
+
+DTSX = """<DTS:Executable xmlns:DTS="www.microsoft.com/SqlServer/Dts">
+  <SQLTask:SqlTaskData SQLTask:SqlStatementSource="SELECT Id&#xA;FROM ##g" xmlns:SQLTask="x"/>
+  <property name="SqlCommand">SELECT *
+FROM dbo.T</property>
+  <property name="Otro">SELECT 1</property>
+</DTS:Executable>
+"""
+RDL = """<Report>
+  <Query>
+    <CommandText>SELECT a
+  FROM ##rep</CommandText>
+    <CommandText>="SELECT " &amp; Parameters!X.Value</CommandText>
+  </Query>
+</Report>
+"""
+PY = '''"""SELECT * FROM docstring"""
+sql = ("SELECT Id "
+       "FROM ##g")
+b = b"SELECT * FROM bytes"
+nota = "no es SQL"
+f = f"DELETE FROM {tabla}"
+'''
+CS = r'''// var x = "SELECT * FROM comentario";
+var a = "SELECT Id\nFROM ##g";
+var b = @"SELECT *
+FROM dbo.T";
+var c = "SELECT Id " +
+        "FROM #t";
+var d = """
+    DELETE FROM t
+    """;
+'''
+
+@pytest.mark.parametrize("name, content, expected", [
+    # atributo con saltos codificados: inexacto, en la línea de la etiqueta; <property> de otro nombre no
+    ("p.dtsx", DTSX, [("SELECT Id\nFROM ##g", 2, 3, False), ("SELECT *\nFROM dbo.T", 3, 31, True)]),
+    # una expresión (=...) no es SQL
+    ("r.rdl", RDL, [("SELECT a\n  FROM ##rep", 3, 18, True)]),
+    # docstring, bytes y texto que no empieza como SQL se ignoran; los literales unidos conservan columnas
+    ("q.py", PY, [("SELECT Id \n        FROM ##g", 2, 9, True), ("DELETE FROM {tabla}", 6, 7, True)]),
+    ("c.cs", CS, [("SELECT Id\nFROM ##g", 2, 10, False), ("SELECT *\nFROM dbo.T", 3, 11, True),
+                  ("SELECT Id \n         FROM #t", 5, 10, True), ("\n    DELETE FROM t\n    ", 7, 12, True)]),
+])
+def test_extractors(tmp_path, name, content, expected):
+    fp = tmp_path / name
+    fp.write_text(content, encoding="utf-8")
+    assert [tuple(f) for f in audit.EXTRACTORS[fp.suffix](fp)] == expected
+
+def test_findings_point_into_the_original_file(tmp_path):
+    (tmp_path / "q.py").write_text(PY, encoding="utf-8")
+    (tmp_path / "p.dtsx").write_text(DTSX, encoding="utf-8")
+    results = audit.audit_paths([tmp_path], _config(tmp_path))
+    found = {(f.rule, f.line, f.column) for f in results[tmp_path / "q.py"]}
+    assert ("global_temp", 3, 14) in found and ("delete_update_without_where", 6, 7) in found
+    # fragmento inexacto: todo en la línea del atributo
+    assert {f.line for f in results[tmp_path / "p.dtsx"] if f.rule == "global_temp"} == {2}
+
+def test_extensions_outside_embedded_are_not_audited(tmp_path):
+    (tmp_path / "q.py").write_text(PY, encoding="utf-8")
+    (tmp_path / "c.cs").write_text(CS, encoding="utf-8")
+    assert list(audit.audit_paths([tmp_path], _config(tmp_path, ".cs"))) == [tmp_path / "c.cs"]
+
+def test_cache_key_depends_on_extractor(tmp_path):
+    # mismos bytes: en el .rdl el texto del elemento es SQL; en el .sql, el archivo entero
+    for name in ("a.rdl", "b.sql"):
+        (tmp_path / name).write_text("<a>DELETE FROM t</a>\n", encoding="utf-8")
+    config = _config(tmp_path)
+    expected = audit.audit_paths([tmp_path], config)
+    assert _rules(expected[tmp_path / "b.sql"])
+    for _ in range(2):   # la segunda pasada sale de la caché
+        results = audit.audit_paths([tmp_path], config, cache=True)
+        assert {p: _rules(f) for p, f in results.items()} == {p: _rules(f) for p, f in expected.items()}
+
+MALFORMED_DTSX = '<DTS:Executable xmlns:DTS="www.microsoft.com/SqlServer/Dts">\n  <DTS:Property>\n</DTS:Executable>\n'
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_malformed_xml_is_reported_and_the_audit_continues(tmp_path, jobs):
+    (tmp_path / "roto.dtsx").write_text(MALFORMED_DTSX, encoding="utf-8")
+    (tmp_path / "latin1.sql").write_bytes("-- versión\nSELECT Id FROM dbo.T\n".encode("latin-1"))
+    (tmp_path / "ok.sql").write_text("SELECT Id FROM ##global\n", encoding="utf-8")
+    results = audit.audit_paths([tmp_path], _config(tmp_path), jobs=jobs, cache=True)
+    assert _rules(results[tmp_path / "roto.dtsx"]) == [("unreadable_file", 1)]
+    assert "XML mal formado" in results[tmp_path / "roto.dtsx"][0].message
+    assert _rules(results[tmp_path / "latin1.sql"]) == [("unreadable_file", 1)]
+    assert all(f.severity == "error" for f in results[tmp_path / "roto.dtsx"])
+    assert _rules(results[tmp_path / "ok.sql"]) == [("global_temp", 1)]
+
+def test_malformed_xml_fails_the_run_without_traceback(tmp_path):
+    cfg_dir = tmp_path / ".github" / "audit"
+    cfg_dir.mkdir(parents=True)
+    shutil.copy(AUDIT_DIR / "audit_config.ini", cfg_dir / "audit_config.ini")
+    (tmp_path / "roto.dtsx").write_text(MALFORMED_DTSX, encoding="utf-8")
+    (tmp_path / "ok.sql").write_text("SELECT Id FROM dbo.T\n", encoding="utf-8")
+    run = subprocess.run([sys.executable, str(AUDIT_DIR / "audit_sql_standards.py"), "--no-cache", "--jobs", "2"],
+                         cwd=tmp_path, capture_output=True, text=True, timeout=120)
+    assert "Traceback" not in run.stderr
+    assert "Línea 1: XML mal formado" in run.stdout
+    assert "ok.sql" in run.stdout
+    assert run.returncode == 1
@@ -0,0 +1,89 @@
+"""
+Índice de funciones del repo (build_function_index): qué funciones encuentra, que se reutiliza
+por contenido (sha256) aunque cambien los mtime, como en un checkout nuevo en CI, y que las reglas
+de UDF con índice marcan solo las funciones escalares definidas en el repo.
+"""
+import configparser
+import json
+import os
+
+import pytest
+
+import audit_sql_standards as audit
+
+FUNCS = (
+    "CREATE FUNCTION dbo.fn_valida (@Id INT) RETURNS BIT AS BEGIN RETURN 1 END\nGO\n"
+    "CREATE OR ALTER FUNCTION ventas.fn_lista () RETURNS TABLE AS RETURN (SELECT 1 AS x)\nGO\n"
+)
+
+@pytest.fixture
+def repo(tmp_path):
+    (tmp_path / "funcs.sql").write_text(FUNCS, encoding="utf-8")
+    (tmp_path / "proc.sql").write_text("SELECT Id FROM dbo.T WITH (NOLOCK) WHERE dbo.fn_valida(Id) = 1\n",
+                                       encoding="utf-8")
+    return tmp_path
+
+def _index(repo, cfg=None):
+    files = sorted(repo.glob("*.sql"))
+    return audit.build_function_index(files, cfg or configparser.ConfigParser(), repo)
+
+def _count_analyzed(monkeypatch):
+    analyzed = []
+    real = audit._function_defs_in_file
+    monkeypatch.setattr(audit, "_function_defs_in_file", lambda fp, max_bytes: analyzed.append(fp.name) or real(fp, max_bytes))
+    return analyzed
+
+def test_index_finds_scalar_and_table_functions(repo):
+    assert _index(repo) == {"dbo.fn_valida": "scalar", "ventas.fn_lista": "table"}
+
+def test_new_mtime_with_same_content_is_not_reanalyzed(repo, monkeypatch):
+    expected = _index(repo)
+    for fp in repo.glob("*.sql"):   # checkout nuevo: mismo contenido, otro mtime
+        st = fp.stat()
+        os.utime(fp, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    analyzed = _count_analyzed(monkeypatch)
+    assert _index(repo) == expected
+    assert analyzed == []
+    # el índice guardado quedó con los mtime nuevos: la siguiente vez ni siquiera se leen
+    stored = json.loads((repo / ".github" / "audit" / "audit_logs" / audit.FUNCTION_INDEX_FILE).read_text("utf-8"))
+    assert all(e["stamp"] == list(audit._file_stamp(repo / rel)) for rel, e in stored["files"].items())
+
+def test_changed_content_is_reanalyzed(repo, monkeypatch):
+    _index(repo)
+    (repo / "funcs.sql").write_text(FUNCS.replace("fn_valida", "fn_verifica"), encoding="utf-8")
+    analyzed = _count_analyzed(monkeypatch)
+    assert _index(repo) == {"dbo.fn_verifica": "scalar", "ventas.fn_lista": "table"}
+    assert analyzed == ["funcs.sql"]
+
+def test_definition_forms():
+    src = audit.lex_sql(
+        "-- CREATE FUNCTION dbo.fn_comentada () RETURNS INT\n"
+        "CREATE FUNCTION [ventas].[fn ]]raro] (@a INT) RETURNS INT AS BEGIN RETURN @a END\nGO\n"
+        "ALTER FUNCTION \"fn_sin_esquema\" () RETURNS @t TABLE (x INT) AS BEGIN RETURN END\nGO\n"
+        "CREATE FUNCTION otra_db.rpt.fn_tres (@d DATE = NULL) RETURNS DECIMAL(10, 2) AS BEGIN RETURN 1 END\n"
+        "SELECT 'CREATE FUNCTION dbo.fn_literal () RETURNS INT'\n")
+    assert [tuple(d) for d in audit.extract_function_defs(src)] == [
+        ("ventas", "fn ]raro", "scalar", 2), ("dbo", "fn_sin_esquema", "table", 4), ("rpt", "fn_tres", "scalar", 6)]
+
+@pytest.mark.parametrize("mode, expected", [("off", None), ("auto", None), ("true", {})])
+def test_index_mode_without_definitions(tmp_path, mode, expected):
+    (tmp_path / "proc.sql").write_text("SELECT 1\n", encoding="utf-8")
+    cfg = configparser.ConfigParser()
+    cfg["functions"] = {"index": mode}
+    assert _index(tmp_path, cfg) == expected
+
+def test_deleted_file_leaves_the_index(repo):
+    _index(repo)
+    (repo / "funcs.sql").unlink()
+    assert _index(repo) is None   # auto: sin definiciones no hay índice
+    stored = json.loads((repo / ".github" / "audit" / "audit_logs" / audit.FUNCTION_INDEX_FILE).read_text("utf-8"))
+    assert list(stored["files"]) == ["proc.sql"]
+
+def test_indexed_rules_flag_only_scalar_functions_of_the_repo(repo):
+    config = audit.AuditConfig(repo_root=repo, udf_index=_index(repo))
+    sql = ("SELECT Id FROM dbo.T WITH (NOLOCK) WHERE DBO.FN_VALIDA(Id) = 1\n"
+           "SELECT Id FROM ventas.fn_lista() AS l\n"
+           "SELECT Id FROM dbo.T WITH (NOLOCK) WHERE dbo.fn_externa(Id) = 1\n")
+    udf_rules = {"scalar_udf_in_select_where", "user_functions"}
+    rules = sorted((f.rule, f.line) for f in audit.audit_text(sql, config) if f.rule in udf_rules)
+    assert rules == [("scalar_udf_in_select_where", 1), ("user_functions", 1)]
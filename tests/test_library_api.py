@@ -0,0 +1,84 @@
+"""
+API de biblioteca (AuditConfig, audit_text, audit_paths): los mismos hallazgos que el script, con
+severidad de [severities], sin prints ni sys.exit, y con el mismo resultado en serie y en paralelo.
+"""
+import configparser
+import shutil
+from pathlib import Path
+
+import pytest
+
+import audit_sql_standards as audit
+
+AUDIT_DIR = Path(audit.__file__).resolve().parent
+SQL = "SELECT * FROM ##global\nSELECT Id FROM dbo.T\n"
+
+def _rules(findings):
+    return [(f.rule, f.line) for f in findings]
+
+def test_audit_text(capsys):
+    findings = audit.audit_text(SQL, audit.AuditConfig())
+    assert ("global_temp", 1) in _rules(findings) and ("nolock", 2) in _rules(findings)
+    assert all(f.path is None for f in findings)
+    assert capsys.readouterr().out == ""
+
+def test_first_line_and_crlf():
+    plain = audit.audit_text(SQL, audit.AuditConfig())
+    shifted = audit.audit_text(SQL.replace("\n", "\r\n"), audit.AuditConfig(), first_line=40)
+    assert [(f.rule, f.line + 39, f.column, f.message) for f in plain] == \
+           [(f.rule, f.line, f.column, f.message) for f in shifted]
+
+def test_severities_and_disabled_rules():
+    cfg = configparser.ConfigParser()
+    cfg["severities"] = {"global_temp": "warning", "nolock": "off"}
+    cfg["rules"] = {"select_star": "false"}
+    findings = audit.audit_text(SQL, audit.AuditConfig(cfg))
+    rules = {f.rule: f.severity for f in findings}
+    assert rules["global_temp"] == "warning"
+    assert "nolock" not in rules and "select_star" not in rules
+
+def test_invalid_config_raises_value_error():
+    cfg = configparser.ConfigParser()
+    cfg["special_chars"] = {"policy": "todas"}
+    with pytest.raises(ValueError, match="policy desconocida"):
+        audit.AuditConfig(cfg)
+
+@pytest.fixture
+def repo(tmp_path):
+    (tmp_path / "db").mkdir()
+    (tmp_path / "db" / "a.sql").write_text(SQL, encoding="utf-8")
+    (tmp_path / "db" / "b.sql").write_text("DECLARE @x INT = 1\n", encoding="utf-8")
+    (tmp_path / "db" / "notas.txt").write_text(SQL, encoding="utf-8")
+    (tmp_path / "suelto.sql").write_text("DECLARE c CURSOR FOR SELECT 1\n", encoding="utf-8")
+    return tmp_path
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_audit_paths(repo, jobs):
+    config = audit.AuditConfig(repo_root=repo)
+    results = audit.audit_paths([Path("db"), repo / "suelto.sql"], config, jobs=jobs)
+    assert list(results) == [repo / "db" / "a.sql", repo / "db" / "b.sql", repo / "suelto.sql"]
+    assert results[repo / "db" / "b.sql"] == []
+    assert {f.path for f in results[repo / "db" / "a.sql"]} == {"db/a.sql"}
+    assert _rules(results[repo / "suelto.sql"]) == [("cursors", 1)]
+    # mismos hallazgos que audit_text sobre el mismo contenido, ahora con ruta
+    assert [f.as_dict() | {"path": None} for f in results[repo / "db" / "a.sql"]] == \
+           [f.as_dict() for f in audit.audit_text(SQL, config)]
+
+def test_from_repo_reads_the_config(repo):
+    assert audit.AuditConfig.from_repo(repo).cfg.sections() == []   # sin ini: defaults
+    cfg_dir = repo / ".github" / "audit"
+    cfg_dir.mkdir(parents=True, exist_ok=True)   # ya existe si se guardó el índice de funciones
+    shutil.copy(AUDIT_DIR / "audit_config.ini", cfg_dir / "audit_config.ini")
+    (repo / "db" / "f.sql").write_text("CREATE FUNCTION dbo.fn_x () RETURNS INT AS BEGIN RETURN 1 END\n",
+                                       encoding="utf-8")
+    config = audit.AuditConfig.from_repo(repo)
+    assert config.cfg.get("severities", "global_temp") == "error"
+    assert config.udf_index == {"dbo.fn_x": "scalar"}
+    assert audit.AuditConfig.from_repo(repo, function_index=False).udf_index is None
+
+def test_finding_value_semantics():
+    a = audit.AuditFinding("nolock", "error", 2, 1, "m", "db/a.sql")
+    b = audit.AuditFinding("nolock", "error", 2, 1, "m", "db/a.sql")
+    assert a == b and hash(a) == hash(b) and len({a, b}) == 1
+    assert a.as_dict() == {"rule": "nolock", "severity": "error", "line": 2, "column": 1, "message": "m",
+                           "path": "db/a.sql"}
@@ -0,0 +1,132 @@
+"""
+El escáner fusionado (LineScanner) y el prefiltro por palabras clave (LineScanner.candidates)
+deben dar exactamente los mismos hallazgos que correr cada regla por separado sobre todo el archivo:
+su check_* o, si es de línea, su patrón del registro (RULES) buscado línea a línea.
+"""
+import configparser
+import random
+
+import pytest
+
+import audit_sql_standards as audit
+
+def _line_reference(rule):
+    """
+    Referencia de una regla por línea: su patrón del registro, buscado línea a línea sobre el código
+    sin comentarios ni literales; primer match por línea, con la línea original como texto.
+    """
+    def check(src):
+        issues = []
+        for i, s, e in src.spans():
+            m = rule.pattern.search(src.code_text, s, e)
+            if m:
+                text = src.text[s:e].strip()
+                issues.append(audit.Finding(i, m.start() - s + 1, rule.message.format(text=text), text))
+        return issues
+    return check
+
+# regla -> función por regla de referencia (sin escáner fusionado ni prefiltro)
+REFERENCE_CHECKS = {r.key: r.check or _line_reference(r) for r in audit.RULES if r.check or r.pattern}
+LINE_RULES = [r for r in audit.RULES if r.pattern is not None]
+SPECIAL = audit.SpecialChars(list("áéíóúñ$¿"))
+
+FIXED = [
+    "",
+    "SELECT * FROM dbo.Clientes\nWHERE dbo.fn_valida(Id) = 1\n",
+    "SELECT TOP 10 Id FROM ##global g JOIN #temp t ON t.Id = g.Id\n",
+    "DECLARE c CURSOR FOR SELECT Id FROM dbo.T WITH (NOLOCK)\nOPEN c\n",
+    "SELECT a FROM dbo.T WITH (INDEX(ix_a)) OPTION (RECOMPILE)\nSELECT b FROM dbo.U t INNER HASH JOIN dbo.V v ON 1 = 1\n",
+    "-- SELECT * FROM ##comentario\nSELECT 'CURSOR ##x' AS texto FROM dbo.T WITH (NOLOCK)\n",
+    "CREATE TABLE #temp (c TEXT, d NTEXT, e IMAGE)\nDECLARE @temp TABLE (x INT)\n",
+    "MERGE dbo.T AS t USING dbo.S AS s ON t.Id = s.Id\nWHEN MATCHED THEN DELETE;\n",
+    "select * from dbo.t where dbo.f(x) = 1 option(fast 10)\nselect top 5 a from dbo.t\n",
+    "/* CURSOR\n##g */ SELECT Id INTO #tmp FROM dbo.T\nEXEC (@sql + @where)\nDELETE FROM dbo.T\n",
+    "SELECT DISTINCT a FROM dbo.T WITH (NOLOCK)\nUPDATE dbo.T SET a = 1\nGO\nSELECT ſ FROM dbo.T\n",
+]
+
+FRAGMENTS = [
+    "SELECT", "*", "FROM", "dbo.t", "WHERE", "dbo.fn(x)", "x.y (1)", "x", "=", "1", "##g", "#temp", "@temp",
+    "CURSOR", "MERGE", "JOIN", "INNER", "LEFT", "LOOP", "HASH", "TEXT", "NTEXT", "IMAGE", "OPTION", "(",
+    "RECOMPILE", ")", "FAST", "10", "FORCESEEK", "WITH", "INDEX", "NOLOCK", "--", "'str'", "/*", "*/", "\n", "\n",
+    "á", "$", "sys.objects", "#t", " ", "\t", ";", "TOP", "DISTINCT", "ORDER BY", "DELETE", "UPDATE", "SET",
+    "INTO", "EXEC", "sp_executesql", "@s", "+", "'a'", "GO\n", "-- justification: ok", "CASE", "UNION", "ſ",
+]
+
+def _random_inputs(count, seed=3):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield "".join(rng.choice(FRAGMENTS) + rng.choice(["", " ", "\n"]) for _ in range(rng.randint(0, 60)))
+
+RANDOM_INPUTS = 3000
+
+@pytest.fixture(scope="module")
+def scanner():
+    return audit.LineScanner(configparser.ConfigParser(), SPECIAL)
+
+def _expected(src):
+    """{clave de resultado: hallazgos} corriendo cada regla por separado, sin prefiltro."""
+    expected = {}
+    for rule in audit.RULES:
+        if rule.key in REFERENCE_CHECKS:
+            expected[rule.res_key] = REFERENCE_CHECKS[rule.key](src)
+    expected["special"] = audit.check_special_chars(src, SPECIAL)
+    return expected
+
+def test_every_rule_has_a_reference_check():
+    covered = set(REFERENCE_CHECKS) | {"special_chars", "analysis_timeout", "unreadable_file"}
+    assert covered == {r.key for r in audit.RULES}
+
+def _check_scan(scanner, text):
+    src = audit.lex_sql(text)
+    expected = _expected(src)
+    found = scanner.scan(src)
+    for rule in LINE_RULES:
+        assert found[rule.res_key] == expected[rule.res_key], (rule.key, text)
+    assert found["special"] == expected["special"], text
+
+def _check_prefilter(scanner, text):
+    src = audit.lex_sql(text)
+    expected = _expected(src)
+    active = scanner.candidates(src)
+    if active is not None:
+        # una regla que el prefiltro salta no puede tener hallazgos
+        for rule in audit.RULES:
+            if rule.key in REFERENCE_CHECKS and rule.key not in active:
+                assert expected[rule.res_key] == [], (rule.key, text)
+    res = audit.audit_source(audit.lex_sql(text), configparser.ConfigParser(), scanner)
+    for res_key, items in expected.items():
+        assert res[res_key] == items, (res_key, text)
+
+@pytest.mark.parametrize("text", FIXED)
+def test_scan_matches_per_rule_checks(scanner, text):
+    _check_scan(scanner, text)
+
+def test_scan_matches_per_rule_checks_random(scanner):
+    for text in _random_inputs(RANDOM_INPUTS):
+        _check_scan(scanner, text)
+
+@pytest.mark.parametrize("text", FIXED)
+def test_prefilter_never_drops_findings(scanner, text):
+    _check_prefilter(scanner, text)
+
+def test_prefilter_never_drops_findings_random(scanner):
+    for text in _random_inputs(RANDOM_INPUTS):
+        _check_prefilter(scanner, text)
+
+@pytest.mark.parametrize("text", FIXED)
+def test_scan_each_matches_scan(scanner, text):
+    src = audit.lex_sql(text)
+    assert scanner.scan_each(src, {}) == scanner.scan(src)
+
+def test_prefilter_skips_absent_keywords(scanner):
+    active = scanner.candidates(audit.lex_sql("SELECT Id FROM dbo.T WITH (NOLOCK)\n"))
+    assert "cursors" not in active and "merge_usage" not in active
+    assert {"nolock", "scalar_udf_in_select_where"} <= active
+
+def test_prefilter_ignores_comments_and_literals(scanner):
+    active = scanner.candidates(audit.lex_sql("-- CURSOR MERGE\nSELECT 'TEXT' AS a\n"))
+    assert "cursors" not in active and "merge_usage" not in active and "deprecated_types" not in active
+
+def test_prefilter_disabled_for_non_ascii_code(scanner):
+    # IGNORECASE de `re` iguala 'ſ' con 's': con código no ASCII corren todas las reglas
+    assert scanner.candidates(audit.lex_sql("SELECT ſ FROM dbo.T\n")) is None
@@ -0,0 +1,79 @@
+"""
+Caché de resultados ([cache]): una entrada por hash de contenido + huella de la ejecución; un
+acierto no vuelve a auditar, cualquier cambio de contenido o de config invalida, y se poda por tamaño.
+"""
+import configparser
+import os
+
+import pytest
+
+import audit_sql_standards as audit
+
+SQL = "SELECT * FROM ##global\n"
+
+@pytest.fixture
+def env(tmp_path):
+    (tmp_path / "a.sql").write_text(SQL, encoding="utf-8")
+    cfg = configparser.ConfigParser()
+    special = audit.SpecialChars(list("ñ$"))
+    return tmp_path, cfg, special, audit.LineScanner(cfg, special)
+
+def _cache(env, cfg=None):
+    root, default_cfg, special, _ = env
+    return audit.open_result_cache(cfg or default_cfg, root, special)
+
+def _audit(env, cache):
+    root, cfg, special, scanner = env
+    return audit.audit_file(root / "a.sql", cfg, special, scanner, cache, profile=True)
+
+def _count_lexed(monkeypatch):
+    lexed = []
+    real = audit.lex_sql
+    monkeypatch.setattr(audit, "lex_sql", lambda *a, **k: lexed.append(1) or real(*a, **k))
+    return lexed
+
+def test_hit_returns_the_same_findings_without_auditing(env, monkeypatch):
+    first = _audit(env, _cache(env))
+    assert not first["perfil"]["cache"]
+    lexed = _count_lexed(monkeypatch)
+    second = _audit(env, _cache(env))
+    assert second["perfil"]["cache"] and lexed == []
+    assert {k: v for k, v in second.items() if k != "perfil"} == {k: v for k, v in first.items() if k != "perfil"}
+
+def test_changed_content_is_audited_again(env):
+    assert _audit(env, _cache(env))["global"]
+    (env[0] / "a.sql").write_text("SELECT Id FROM dbo.T WITH (NOLOCK)\n", encoding="utf-8")
+    res = _audit(env, _cache(env))
+    assert not res["perfil"]["cache"]
+    assert not res.get("global") and not res.get("select_star")
+
+def test_config_changes_the_fingerprint(env):
+    other = configparser.ConfigParser()
+    other["rules"] = {"select_star": "false"}
+    assert _cache(env).fingerprint != _cache(env, other).fingerprint
+    assert _cache(env).fingerprint == _cache(env).fingerprint
+
+def test_disabled_cache(env):
+    cfg = configparser.ConfigParser()
+    cfg["cache"] = {"enabled": "false"}
+    assert _cache(env, cfg) is None
+
+def test_corrupt_entry_is_a_miss(env):
+    cache = _cache(env)
+    _audit(env, cache)
+    key = cache.key((env[0] / "a.sql").read_bytes())
+    cache._path(key).write_text("{no es json", encoding="utf-8")
+    assert cache.get(key) is None
+    assert not _audit(env, cache)["perfil"]["cache"]
+    assert cache.get(key) is not None   # se reescribió
+
+def test_prune_removes_least_recently_used(tmp_path):
+    cache = audit.ResultCache(tmp_path, b"huella", max_bytes=4000)
+    keys = [cache.key(str(i).encode()) for i in range(10)]
+    for age, key in enumerate(keys):
+        cache.put(key, {"global_temp": [audit.Finding(1, 1, "x" * 900, "")]})
+        os.utime(cache._path(key), (1000 + age, 1000 + age))
+    cache.prune()
+    kept = [k for k in keys if cache._path(k).exists()]
+    assert kept == keys[-len(kept):]   # sobreviven las más recientes
+    assert sum(cache._path(k).stat().st_size for k in kept) <= 4000 * 0.9
@@ -0,0 +1,86 @@
+"""
+--shard i/N y merge: el reparto cubre cada archivo exactamente una vez y es determinista, y combinar
+los parciales da el mismo reporte y código de salida que la auditoría completa; merge rechaza
+parciales incompletos o de otro reparto.
+"""
+import json
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import audit_sql_standards as audit
+
+AUDIT_DIR = Path(audit.__file__).resolve().parent
+SHARDS = 3
+
+@pytest.fixture
+def repo(tmp_path):
+    cfg_dir = tmp_path / ".github" / "audit"
+    cfg_dir.mkdir(parents=True)
+    shutil.copy(AUDIT_DIR / "audit_config.ini", cfg_dir / "audit_config.ini")
+    for i in range(12):
+        body = "SELECT Id FROM dbo.T WITH (NOLOCK)\n" * (i + 1)
+        if i % 4 == 0:
+            body += "SELECT * FROM ##global\n"
+        (tmp_path / f"p{i:02}.sql").write_text(body, encoding="utf-8")
+    return tmp_path
+
+def _run(repo, *args):
+    return subprocess.run([sys.executable, str(AUDIT_DIR / "audit_sql_standards.py"), *map(str, args)],
+                          cwd=repo, capture_output=True, text=True, timeout=120)
+
+def _shard(repo, i, n=SHARDS):
+    return _run(repo, "--no-cache", "--shard", f"{i}/{n}", "--partial", repo / "parts" / f"{i}.jsonl")
+
+def test_shards_partition_the_files(repo):
+    files = sorted(repo.glob("*.sql"))
+    parts = [audit.shard_files(files, i, SHARDS, repo) for i in range(1, SHARDS + 1)]
+    assert sorted(fp for part in parts for fp in part) == files
+    assert parts == [audit.shard_files(files, i, SHARDS, repo) for i in range(1, SHARDS + 1)]
+    loads = [sum(fp.stat().st_size for fp in part) for part in parts]
+    assert max(loads) - min(loads) <= max(fp.stat().st_size for fp in files)
+
+def test_costs_drive_the_split(repo):
+    files = sorted(repo.glob("*.sql"))
+    # un archivo chico pero lento queda solo en su shard
+    costs = {fp.name: (100.0 if fp.name == "p00.sql" else 0.01, fp.stat().st_size) for fp in files}
+    assert [fp.name for fp in audit.shard_files(files, 1, 2, repo, costs)] == ["p00.sql"]
+
+def test_merge_matches_full_audit(repo):
+    full = _run(repo, "--no-cache", "--format", "jsonl", "--output", repo / "full.jsonl")
+    for i in range(1, SHARDS + 1):
+        assert _shard(repo, i).returncode == 1   # cada shard falla si tiene un error
+    merged = _run(repo, "merge", *(repo / "parts" / f"{i}.jsonl" for i in (2, 3, 1)),
+                  "--format", "jsonl", "--output", repo / "merged.jsonl")
+    assert "Traceback" not in merged.stderr
+    assert merged.returncode == full.returncode == 1
+    assert (repo / "merged.jsonl").read_text("utf-8") == (repo / "full.jsonl").read_text("utf-8")
+
+def _merge_error(repo, *names):
+    run = _run(repo, "merge", *(repo / "parts" / n for n in names))
+    assert run.returncode == 2
+    return run.stdout
+
+def test_merge_rejects_incomplete_or_mixed_partials(repo):
+    for i in range(1, SHARDS + 1):
+        _shard(repo, i)
+    assert "faltan los shards 3/3" in _merge_error(repo, "1.jsonl", "2.jsonl")
+    assert "repetido" in _merge_error(repo, "1.jsonl", "1.jsonl", "2.jsonl", "3.jsonl")
+    lines = (repo / "parts" / "3.jsonl").read_text("utf-8").splitlines()
+    (repo / "parts" / "3.jsonl").write_text("\n".join(lines[:-1]) + "\n", encoding="utf-8")
+    assert "truncado" in _merge_error(repo, "1.jsonl", "2.jsonl", "3.jsonl")
+    # otro reparto: la lista de archivos cambió entre shards
+    (repo / "nuevo.sql").write_text("SELECT 1\n", encoding="utf-8")
+    _shard(repo, 3)
+    assert "mismo reparto" in _merge_error(repo, "1.jsonl", "2.jsonl", "3.jsonl")
+
+def test_partial_records_every_finding(repo):
+    _shard(repo, 1)
+    records = [json.loads(ln) for ln in (repo / "parts" / "1.jsonl").read_text("utf-8").splitlines()]
+    header, files, end = records[0], records[1:-1], records[-1]
+    assert (header["shard"], header["shards"], header["files_total"]) == (1, SHARDS, 12)
+    assert end == {"end": True, "files": len(files)}
+    assert all(not Path(r["file"]).is_absolute() for r in files)
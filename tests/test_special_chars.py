@@ -0,0 +1,65 @@
+"""Motor de special_chars (SpecialChars): columnas y codepoints, políticas list/ascii y config inválida."""
+import configparser
+import random
+import re
+
+import pytest
+
+import audit_sql_standards as audit
+
+def _config(tmp_path, chars=None, policy=None):
+    cfg = configparser.ConfigParser()
+    cfg["rules"] = {r.key: "false" for r in audit.RULES if r.key != "special_chars"}
+    if chars is not None:
+        (tmp_path / "chars.txt").write_text("\n".join(chars) + "\n", encoding="utf-8")
+        cfg["paths"] = {"special_chars_file": str(tmp_path / "chars.txt")}
+    if policy is not None:
+        cfg["special_chars"] = {"policy": policy}
+    return audit.AuditConfig(cfg, repo_root=tmp_path)
+
+def test_reports_every_column_and_codepoint(tmp_path):
+    findings = audit.audit_text("SELECT 1\n-- categoría, ñandú y más ñ\n", _config(tmp_path), first_line=10)
+    assert [(f.rule, f.line, f.column) for f in findings] == [("special_chars", 11, 11)]
+    assert findings[0].message == ("'í' U+00ED (col 11); 'ñ' U+00F1 (col 15, 27); 'ú' U+00FA (col 19); "
+                                   "'á' U+00E1 (col 24) -> -- categoría, ñandú y más ñ")
+
+def test_ascii_file_has_no_findings(tmp_path):
+    assert audit.audit_text("SELECT Id FROM dbo.T -- sin acentos\n", _config(tmp_path)) == []
+
+def test_ascii_entries_are_found_in_ascii_files(tmp_path):
+    findings = audit.audit_text("SELECT 1\nCREATE TABLE [ventas$]\n", _config(tmp_path))
+    assert [(f.line, f.column, f.message) for f in findings] == [(2, 21, "'$' U+0024 (col 21) -> CREATE TABLE [ventas$]")]
+
+def test_multi_character_entries_ignore_case(tmp_path):
+    findings = audit.audit_text("-- SS y ñ ss\n", _config(tmp_path, chars=["ñ", "ss"]))
+    assert findings[0].message == "'SS' U+0053 U+0053 (col 4); 'ñ' U+00F1 (col 9); 'ss' U+0073 U+0073 (col 11) -> -- SS y ñ ss"
+
+def test_ascii_policy_flags_any_non_ascii(tmp_path):
+    findings = audit.audit_text("SELECT 1 -- ok\n-- café — 😀\nSELECT $1\n", _config(tmp_path, chars=["$"], policy="ascii"))
+    assert [(f.line, f.column) for f in findings] == [(2, 7), (3, 8)]
+    assert findings[0].message.startswith("'é' U+00E9 (col 7); '—' U+2014 (col 9); '😀' U+1F600 (col 11) -> ")
+
+def test_unknown_policy_raises_without_printing(tmp_path, capsys):
+    with pytest.raises(ValueError, match=r"\[special_chars\] policy desconocida 'latin1'"):
+        audit.audit_text("SELECT 1\n", _config(tmp_path, policy="latin1"))
+    assert capsys.readouterr() == ("", "")
+
+@pytest.mark.parametrize("entries", [list("áéñ$¿"), ["ñ", "ss", "K"], ["😀", "á"]])
+def test_matches_line_by_line_search(entries):
+    # misma línea y primera columna que buscar la lista línea por línea con la regex de siempre
+    if all(len(c) == 1 for c in entries):
+        reference = re.compile("[" + "".join(map(re.escape, entries)) + "]")
+    else:
+        reference = re.compile("|".join(map(re.escape, sorted(entries, key=len, reverse=True))), re.IGNORECASE)
+    engine = audit.SpecialChars(entries)
+    rng = random.Random(21)
+    alphabet = list("ab SELECT\n\t-'[]/*áé$ñ¿ſKkßs") + ["😀", "Ω"]
+    for _ in range(2000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 80)))
+        src = audit.lex_sql(text)
+        expected = []
+        for i, s, e in src.spans():
+            m = reference.search(text, s, e)
+            if m:
+                expected.append((i, m.start() - s + 1, text[s:e].strip()))
+        assert [(f.line, f.col, f.snippet) for f in engine.findings(src)] == expected, text
@@ -0,0 +1,29 @@
+"""
+Índice de sentencias (index_statements): las sentencias reparten los tokens del archivo sin
+perder ni repetir ninguno, y Statement.tokens (una vista sobre TokenTable) se comporta como la lista.
+"""
+import audit_sql_standards as audit
+
+SQL = (
+    "-- cabecera\nSELECT TOP 5 a, b FROM dbo.T WHERE x = 1;\n"
+    "DELETE FROM dbo.T\nGO\n"
+    "WITH c AS (SELECT Id FROM dbo.U) UPDATE t SET a = 1 FROM dbo.T t JOIN c ON c.Id = t.Id\n"
+    "INSERT INTO #tmp (Id) SELECT Id FROM dbo.V /* fin */ ORDER BY Id\n"
+)
+
+def test_statements_cover_every_token_once():
+    src = audit.lex_sql(SQL)
+    expected = [t for t in src.iter_tokens() if t.kind not in ("COMMENT", "GO")]
+    assert [t for st in src.statements for t in st.tokens] == expected
+    assert [(st.batch, st.verb) for st in src.statements] == [
+        (1, "SELECT"), (1, "DELETE"), (2, "UPDATE"), (2, "INSERT")]
+
+def test_statement_tokens_behave_like_a_list():
+    for st in audit.lex_sql(SQL).statements:
+        toks = list(st.tokens)
+        assert len(st.tokens) == len(toks)
+        assert st.tokens[-1] == toks[-1] and st.tokens[st.verb_pos] == toks[st.verb_pos]
+        for lo, hi in ((1, 3), (0, 100), (3, 1), (-2, None)):
+            assert list(st.tokens[lo:hi]) == toks[lo:hi]
+        assert list(st.tokens[1:][:2]) == toks[1:][:2]
+        assert st.tokens[::2] == toks[::2]
@@ -0,0 +1,108 @@
+"""
+Presupuestos de [limits] con entradas adversarias: la regla que retrocede sin fin se interrumpe y
+queda un hallazgo analysis_timeout, y las demás reglas conservan sus hallazgos. Cada entrada tarda
+varios segundos sin presupuesto (decenas de veces rule_timeout_s), así que el resultado no depende
+de la velocidad de la máquina.
+"""
+import configparser
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import audit_sql_standards as audit
+
+AUDIT_DIR = Path(audit.__file__).resolve().parent
+
+pytestmark = pytest.mark.skipif(not hasattr(signal, "setitimer"), reason="sin SIGALRM no se interrumpe una regla")
+
+RULE_TIMEOUT_S = 0.2
+
+# regla que se cuelga -> línea minificada que la hace retroceder (varios segundos sin presupuesto)
+ADVERSARIAL = {
+    "user_functions": "SELECT Id FROM dbo.T WITH (NOLOCK) WHERE Activo = 1 " * 2000,
+    "user_functions_unclosed_call": "WHERE dbo.fn_valida( " * 500,
+    "hint_usage_general": "SELECT 1 OPTION (" * 12000,
+    "exec_dynamic_sql_unparameterized": "EXEC (@p + " * 1000,
+}
+# hallazgos de otras reglas en el mismo archivo, antes de la línea adversaria
+PREFIX = "SELECT * FROM ##global\nGO\n"
+
+def _config(tmp_path, rule_timeout_s=RULE_TIMEOUT_S, file_timeout_s=10):
+    cfg = configparser.ConfigParser()
+    cfg["limits"] = {"rule_timeout_s": str(rule_timeout_s), "file_timeout_s": str(file_timeout_s)}
+    return audit.AuditConfig(cfg, repo_root=tmp_path)
+
+def _stalled_rule(case: str) -> str:
+    return "user_functions" if case.startswith("user_functions") else case
+
+def _assert_interrupted(findings, case):
+    timeouts = [f for f in findings if f.rule == "analysis_timeout"]
+    assert _stalled_rule(case) in [f.message.split()[1] for f in timeouts]
+    assert all(f.severity == "error" and f.line == 1 for f in timeouts)
+    # las demás reglas conservan sus hallazgos
+    assert [(f.rule, f.line) for f in findings if f.rule == "global_temp"] == [("global_temp", 1)]
+
+@pytest.mark.parametrize("case", sorted(ADVERSARIAL))
+def test_rule_budget_interrupts_audit_text(tmp_path, case):
+    t0 = time.monotonic()
+    findings = audit.audit_text(PREFIX + ADVERSARIAL[case] + "\n", _config(tmp_path))
+    assert time.monotonic() - t0 < 3
+    _assert_interrupted(findings, case)
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_rule_budget_interrupts_audit_paths(tmp_path, jobs):
+    for case, text in ADVERSARIAL.items():
+        (tmp_path / f"{case}.sql").write_text(PREFIX + text + "\n", encoding="utf-8")
+    t0 = time.monotonic()
+    results = audit.audit_paths([tmp_path], _config(tmp_path), jobs=jobs)
+    assert time.monotonic() - t0 < 10
+    assert sorted(p.stem for p in results) == sorted(ADVERSARIAL)
+    for path, findings in results.items():
+        _assert_interrupted(findings, path.stem)
+
+def test_file_budget_skips_remaining_rules(tmp_path):
+    # sin límite por regla: la pasada que se cuelga se corta al agotar el archivo y lo que queda se omite
+    text = PREFIX + ADVERSARIAL["exec_dynamic_sql_unparameterized"] + "\n"
+    t0 = time.monotonic()
+    findings = audit.audit_text(text, _config(tmp_path, rule_timeout_s=0, file_timeout_s=0.5))
+    assert time.monotonic() - t0 < 3
+    messages = [f.message for f in findings if f.rule == "analysis_timeout"]
+    assert any(m.startswith("Regla exec_dynamic_sql_unparameterized interrumpida") for m in messages)
+    assert any(m.startswith("Presupuesto del archivo agotado") for m in messages)
+    # lo que corrió antes de agotarse el archivo se conserva
+    assert "global_temp" in {f.rule for f in findings}
+
+def test_file_budget_stops_streaming(tmp_path):
+    # en streaming, agotado el archivo no se leen más lotes
+    audit_cfg = _config(tmp_path, rule_timeout_s=0, file_timeout_s=0.5)
+    audit_cfg.cfg["paths"] = {"max_file_size_mb": "0.05"}
+    batch = ADVERSARIAL["user_functions"][:40000] + "\nGO\n"
+    # varios lotes de STREAM_BATCH_BYTES: el primero agota el presupuesto y los demás no se leen
+    copies = 3 * audit.STREAM_BATCH_BYTES // len(batch)
+    (tmp_path / "big.sql").write_text(PREFIX + batch * copies, encoding="utf-8")
+    t0 = time.monotonic()
+    findings = audit.audit_paths([tmp_path / "big.sql"], audit_cfg)[tmp_path / "big.sql"]
+    assert time.monotonic() - t0 < 5
+    assert any("sin auditar desde la línea" in f.message for f in findings if f.rule == "analysis_timeout")
+
+def test_fail_fast_with_jobs_does_not_wait_for_workers(tmp_path):
+    cfg_dir = tmp_path / ".github" / "audit"
+    cfg_dir.mkdir(parents=True)
+    shutil.copy(AUDIT_DIR / "audit_config.ini", cfg_dir / "audit_config.ini")
+    (tmp_path / "a_error.sql").write_text("SELECT * FROM ##global\n", encoding="utf-8")
+    for i in range(4):
+        # cada uno ocupa a su worker varios segundos (rule_timeout_s por defecto: 30)
+        (tmp_path / f"b_slow{i}.sql").write_text(ADVERSARIAL["user_functions"] + "\n", encoding="utf-8")
+    t0 = time.monotonic()
+    run = subprocess.run([sys.executable, str(AUDIT_DIR / "audit_sql_standards.py"), "--no-cache", "--jobs", "2",
+                          "--fail-fast"], cwd=tmp_path, capture_output=True, text=True, timeout=120)
+    elapsed = time.monotonic() - t0
+    assert run.returncode == 1
+    assert f"⛔ --fail-fast: auditoría detenida en {tmp_path / 'a_error.sql'} (1 de 5" in run.stdout
+    assert "Traceback" not in run.stderr
+    assert elapsed < 5